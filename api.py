@@ -0,0 +1,203 @@
+import os
+import asyncio
+import logging
+import threading
+import multiprocessing
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from logging_setup import setup_logging, set_request_id
+from runtime_config import set_thread_environment
+from utils import read_yaml
+
+# Logging configuration
+setup_logging()
+
+config_path = "config.yaml"
+api_settings = read_yaml(config_path)['api']
+
+# Spawned workers inherit the environment and import this module before init_worker runs, so the OpenMP
+# and BLAS pools of numpy (postprocess below), torch and TensorFlow start at the worker budget
+set_thread_environment(workers=api_settings['WORKERS'])
+
+from postprocess import PARSERS
+
+# HTTP status for each KYCPipeline outcome
+STATUS_CODES = {
+    "registered": 201,
+    "extracted": 200,
+    "duplicate": 409,
+    "invalid_image": 400,
+    "no_card": 422,
+    "no_text": 422,
+    "type_mismatch": 422,
+    "face_mismatch": 422,
+}
+
+# ---------- Worker processes ----------
+# Each worker builds one KYCPipeline at boot and serves one request at a time with it
+
+_pipeline = None
+
+def init_worker():
+    global _pipeline
+    # Workers share the host, each gets its slice of the cores before the models load
+    from runtime_config import configure_threads
+    configure_threads(workers=api_settings['WORKERS'])
+    # Imported in the worker so the API process itself never loads the models
+    from pipeline import KYCPipeline
+    # One request at a time per worker, so one pooled connection is enough
+    _pipeline = KYCPipeline(pool_size=1)
+
+def worker_ready():
+    return os.getpid()
+
+def public_result(result):
+    # Embeddings stay server side
+    record = {key: value for key, value in (result.get("record") or {}).items() if key != "Embedding"}
+    return {**result, "record": record}
+
+def run_verify(request_id, card_bytes, selfie_bytes):
+    set_request_id(request_id)
+    return {"verified": _pipeline.verify(card_bytes, selfie_bytes), "request_id": request_id}
+
+def run_extract(request_id, card_bytes, id_type):
+    return public_result(_pipeline.extract(card_bytes, id_type, request_id=request_id))
+
+def run_register(request_id, card_bytes, selfie_bytes, id_type):
+    return public_result(_pipeline.process(card_bytes, selfie_bytes, id_type, request_id=request_id))
+
+# ---------- HTTP layer ----------
+
+class WorkerPool:
+    """Process pool plus the in-flight counter used for 429 backpressure"""
+
+    def __init__(self, workers, max_in_flight, timeout):
+        self.workers = workers
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.in_flight = 0
+        # Jobs finish on the executor's management thread, which decrements in_flight
+        self._lock = threading.Lock()
+        self.executor = self.new_executor()
+
+    def new_executor(self):
+        # spawn, not fork: torch and TensorFlow do not survive being forked after import
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=init_worker)
+
+    def job_done(self, future):
+        with self._lock:
+            self.in_flight -= 1
+
+    def replace_executor(self, broken):
+        # Every request on a broken pool fails at once, only the first one replaces it
+        with self._lock:
+            if self.executor is not broken:
+                return
+            self.executor = self.new_executor()
+        broken.shutdown(wait=False, cancel_futures=True)
+        logging.error("A worker process died, the worker pool was recreated")
+
+    async def warm_up(self):
+        # One call per worker makes the executor start them all and load the models before serving
+        loop = asyncio.get_running_loop()
+        pids = await asyncio.gather(*[loop.run_in_executor(self.executor, worker_ready) for _ in range(self.workers)])
+        logging.info(f"API workers ready: {sorted(set(pids))}")
+
+    async def run(self, fn, *args):
+        with self._lock:
+            if self.in_flight >= self.max_in_flight:
+                raise HTTPException(status_code=429, detail="Too many requests in flight, retry later",
+                                    headers={"Retry-After": "1"})
+            self.in_flight += 1
+        executor = self.executor
+        try:
+            future = executor.submit(fn, *args)
+        except BrokenProcessPool:
+            self.job_done(None)
+            self.replace_executor(executor)
+            raise HTTPException(status_code=503, detail="Worker pool restarting, retry later",
+                                headers={"Retry-After": "5"})
+        # Counted until the worker is done with the job, not until the client stops waiting
+        future.add_done_callback(self.job_done)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            # A queued job is cancelled, a running one finishes in the background
+            logging.warning(f"Request timed out after {self.timeout}s")
+            raise HTTPException(status_code=504, detail="Request timed out")
+        except BrokenProcessPool:
+            self.replace_executor(executor)
+            raise HTTPException(status_code=503, detail="Worker pool restarting, retry later",
+                                headers={"Retry-After": "5"})
+        except Exception as e:
+            # e.g. the database is unreachable, the exception itself stays in the log
+            logging.exception(f"Request failed in a worker: {type(e).__name__}")
+            raise HTTPException(status_code=503, detail="Request could not be processed, retry later")
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    app.state.workers = WorkerPool(api_settings['WORKERS'], api_settings['MAX_IN_FLIGHT'],
+                                   api_settings['REQUEST_TIMEOUT_S'])
+    await app.state.workers.warm_up()
+    yield
+    app.state.workers.shutdown()
+
+
+app = FastAPI(title="E-KYC API", lifespan=lifespan)
+
+async def read_upload(upload):
+    data = await upload.read(api_settings['MAX_UPLOAD_BYTES'] + 1)
+    if len(data) > api_settings['MAX_UPLOAD_BYTES']:
+        raise HTTPException(status_code=413, detail=f"{upload.filename} is too large")
+    if not data:
+        raise HTTPException(status_code=400, detail=f"{upload.filename} is empty")
+    return data
+
+def check_id_type(id_type):
+    if id_type is not None and id_type not in PARSERS:
+        raise HTTPException(status_code=400, detail=f"id_type must be one of {', '.join(PARSERS)}")
+
+def respond(result):
+    return JSONResponse(result, status_code=STATUS_CODES.get(result.get("status"), 200))
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "in_flight": app.state.workers.in_flight}
+
+@app.post("/verify")
+async def verify(card: UploadFile = File(...), selfie: UploadFile = File(...)):
+    """Face on the ID card against the selfie"""
+    request_id = set_request_id()
+    card_bytes, selfie_bytes = await read_upload(card), await read_upload(selfie)
+    return await app.state.workers.run(run_verify, request_id, card_bytes, selfie_bytes)
+
+@app.post("/extract")
+async def extract(card: UploadFile = File(...), id_type: Optional[str] = Form(None)):
+    """OCR fields of the ID card, the card type is detected when id_type is not given"""
+    check_id_type(id_type)
+    request_id = set_request_id()
+    card_bytes = await read_upload(card)
+    return respond(await app.state.workers.run(run_extract, request_id, card_bytes, id_type))
+
+@app.post("/register")
+async def register(card: UploadFile = File(...), selfie: UploadFile = File(...), id_type: Optional[str] = Form(None)):
+    """Full KYC: verify the face, extract the fields and store the record"""
+    check_id_type(id_type)
+    request_id = set_request_id()
+    card_bytes, selfie_bytes = await read_upload(card), await read_upload(selfie)
+    return respond(await app.state.workers.run(run_register, request_id, card_bytes, selfie_bytes, id_type))
+
+
+if __name__ == "__main__":
+    import uvicorn
+    # A single event loop process, the parallelism is in the worker pool
+    uvicorn.run(app, host=api_settings['HOST'], port=api_settings['PORT'])
@@ -1,11 +1,20 @@
-import os
+import io
 import logging
+from runtime_config import configure_threads, thread_settings
+
+# One Streamlit process serves every session, so the cores are split between the sessions expected at once.
+# Runs before the imports below, torch (EasyOCR) and TensorFlow (DeepFace) size their pools when imported
+configure_threads(workers=thread_settings['APP_SESSIONS'])
+
+from logging_setup import setup_logging, set_request_id
 import streamlit as st
+from collections import OrderedDict
 from datetime import datetime
-from preprocess import read_image, extract_id_card, save_image
-from ocr_engine import extract_text
+from preprocess import read_image, crop_id_card
+from ocr_engine import probe_card, recognize_card
 from postprocess import extract_information, extract_information1, extract_college_info
-from face_verification import detect_and_extract_face, deepface_face_comparison, get_face_embeddings
+from face_verification import crop_largest_face, verify_faces, embed_face, largest_face_box
+from batching import batched_face_embedding, batched_verify_faces, batched_recognize_card
 from sql_connection import (
     insert_records, 
     fetch_records, 
@@ -17,30 +26,27 @@ from sql_connection import (
     fetch_college_records,
     check_college_duplicacy
 )
+from utils import hash_bytes, hash_id
+from id_classifier import classify_card
+from cache_store import ByteBoundedCache
+from image_store import release_record_images
+from profiling import profiled
+from versioning import config as app_config, pipeline_settings, pipeline_fingerprint, stamp_pipeline_info
 import toml
-import hashlib
 
 # Logging configuration
-logging_str = "[%(asctime)s: %(levelname)s: %(module)s]: %(message)s"
-log_dir = "logs"
-os.makedirs(log_dir, exist_ok=True)
-logging.basicConfig(
-    filename=os.path.join(log_dir, "ekyc_logs.log"),
-    level=logging.INFO,
-    format=logging_str,
-    filemode="a"
-)
+setup_logging()
 
 # Load configuration
 config = toml.load("config.toml")
 db_config = config.get("database", {})
 db_user = db_config.get("user")
 db_password = db_config.get("password")
+cache_settings = app_config['cache']
 
-def hash_id(id_value):
-    """Generate SHA-256 hash of the ID value"""
-    hash_object = hashlib.sha256(id_value.encode())
-    return hash_object.hexdigest()
+# Sessions run as threads of one process, with batching on their model calls share forward passes
+if app_config['batching']['ENABLED']:
+    embed_face, verify_faces, recognize_card = batched_face_embedding, batched_verify_faces, batched_recognize_card
 
 def wider_page():
     """Set wider page layout"""
@@ -76,7 +82,7 @@ def set_custom_theme():
 def sidebar_section():
     """Create sidebar with ID type selection"""
     st.sidebar.title("Select ID Card Type")
-    option = st.sidebar.selectbox("", ("PAN", "AADHAR", "COLLEGE ID"))
+    option = st.sidebar.selectbox("", ("AUTO DETECT", "PAN", "AADHAR", "COLLEGE ID"))
     logging.info(f"ID card type selected: {option}")
     return option
 
@@ -91,20 +97,23 @@ def header_section(option):
     elif option == "COLLEGE ID":
         st.title("Extract Data from College ID Card")
         logging.info("Header set for College ID Card registration.")
+    elif option == "AUTO DETECT":
+        st.title("Extract Data from ID Card")
+        logging.info("Header set for automatic ID card detection.")
 
-def process_pan_aadhar(image_roi, face_image_path1, option, extracted_text):
+def process_pan_aadhar(image_roi, face_image, option, extracted_text, source_images=None, tokens=None, ui=st, crops=None):
     """Process PAN or Aadhar card data"""
-    text_info = extract_information(extracted_text) if option == "PAN" else extract_information1(extracted_text)
+    text_info = extract_information(extracted_text, tokens) if option == "PAN" else extract_information1(extracted_text, tokens)
     text_info['ID'] = hash_id(text_info['ID'])
     
     records = fetch_records(text_info) if option == "PAN" else fetch_records_aadhar(text_info)
     if records.shape[0] > 0:
-        st.write(records.shape)
-        st.write(records)
+        ui.write(records.shape)
+        ui.write(records)
     
     is_duplicate = check_duplicacy(text_info) if option == "PAN" else check_duplicacy_aadhar(text_info)
     if is_duplicate:
-        st.write(f"User already present with ID {text_info['ID']}")
+        ui.write(f"User already present with ID {text_info['ID']}")
         return
     
     # Process and store new record
@@ -112,29 +121,35 @@ def process_pan_aadhar(image_roi, face_image_path1, option, extracted_text):
         text_info["DOB"] = datetime.strptime(text_info["DOB"], "%Y-%m-%d")
     
     text_info["DOB"] = text_info["DOB"].strftime('%Y-%m-%d')
-    text_info["Embedding"] = get_face_embeddings(face_image_path1)
+    text_info["Embedding"] = face_embedding(face_image)
+    stamp_pipeline_info(text_info, source_images or {}, crops)
     
-    if option == "PAN":
-        insert_records(text_info)
-    else:
-        insert_records_aadhar(text_info)
+    try:
+        if option == "PAN":
+            insert_records(text_info)
+        else:
+            insert_records_aadhar(text_info)
+    except Exception:
+        # The row was not stored, so nothing references the images stamped above
+        release_record_images(text_info)
+        raise
     
     logging.info(f"New user record inserted: {text_info['ID']}")
-    st.write(text_info)
+    ui.write(text_info)
 
-def process_college_id(image_roi, face_image_path1, extracted_text):
+def process_college_id(image_roi, face_image, extracted_text, source_images=None, tokens=None, ui=st, crops=None):
     """Process College ID card data"""
-    text_info = extract_college_info(extracted_text)
+    text_info = extract_college_info(extracted_text, tokens)
     text_info["ID"] = hash_id(text_info.get("contact_no", "") + hash_id(text_info.get("name", "")))
     
     records = fetch_college_records(text_info)
     if records.shape[0] > 0:
-        st.write(records.shape)
-        st.write(records)
+        ui.write(records.shape)
+        ui.write(records)
     
     is_duplicate = check_college_duplicacy(text_info)
     if is_duplicate:
-        st.write(f"User already present with contact number {text_info.get('contact_no', '')}")
+        ui.write(f"User already present with contact number {text_info.get('contact_no', '')}")
         return
     
     # Process validity date if exists
@@ -144,52 +159,174 @@ def process_college_id(image_roi, face_image_path1, extracted_text):
         except ValueError:
             text_info["validity"] = None
     
-    text_info["Embedding"] = get_face_embeddings(face_image_path1)
-    insert_college_id(text_info)
+    text_info["Embedding"] = face_embedding(face_image)
+    stamp_pipeline_info(text_info, source_images or {}, crops)
+    try:
+        insert_college_id(text_info)
+    except Exception:
+        # Includes the duplicate ValueError, the row was not stored so nothing references the images
+        release_record_images(text_info)
+        raise
     
-    logging.info(f"New college ID record inserted: {text_info.get('name', '')}")
-    st.write(text_info)
+    logging.info(f"New college ID record inserted: {text_info['ID']}")
+    ui.write(text_info)
 
-def main_content(image_file, face_image_file, option):
-    """Main content processing function"""
-    if image_file is None:
-        st.warning("Please upload an ID card image.")
-        logging.warning("No ID card image uploaded.")
-        return
-    
-    face_image = read_image(face_image_file, is_uploaded=True)
+class RecordedUI:
+    """Forwards Streamlit calls and remembers them so a rerun can replay the result without recomputing"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            return getattr(st, name)(*args, **kwargs)
+        return call
+
+def replay(calls):
+    for name, args, kwargs in calls:
+        getattr(st, name)(*args, **kwargs)
+
+@st.cache_resource
+def get_result_store():
+    """Process-wide store for decoded images, crops, OCR tokens and embeddings, bounded by bytes"""
+    return ByteBoundedCache(cache_settings['MAX_BYTES'])
+
+# Cached in place of a None result, so "no card found" and "no face" are not recomputed on every rerun
+NO_RESULT = object()
+
+def memoize(key, compute):
+    store = get_result_store()
+    value = store.get(key)
+    if value is None:
+        value = compute()
+        store.put(key, NO_RESULT if value is None else value)
+        return value
+    return None if value is NO_RESULT else value
+
+def face_embedding(face_image):
+    """Face embedding memoized on the image content"""
+    face_hash = hash_bytes(face_image.tobytes())
+    model_name = pipeline_settings['FACE_MODEL']
+    return memoize(("embedding", face_hash, model_name), lambda: embed_face(face_image, model_name=model_name))
+
+def crop_card(card_bytes):
+    """Card crop and its (x, y, w, h) box in the upload, or None"""
+    image = read_image(io.BytesIO(card_bytes), is_uploaded=True)
+    if image is None:
+        return None
+    return crop_id_card(image)
+
+def verify_card_face(image_roi, face_image):
+    # Arrays rather than files under data/02_intermediate_data, concurrent sessions would overwrite each other's
+    card_face = crop_largest_face(image_roi)
+    logging.info("Face extracted from the ID card.")
+    if card_face is None:
+        logging.warning("No face detected in the image")
+        return False
+    return verify_faces(face_image, card_face)
+
+def run_kyc(image_file, face_image_file, option, ui):
+    """Run the full KYC flow for one pair of uploads, rendering through ui"""
+    card_bytes = image_file.getvalue()
+    face_bytes = face_image_file.getvalue()
+    card_hash = hash_bytes(card_bytes)
+    face_hash = hash_bytes(face_bytes)
+    languages = pipeline_settings['OCR_LANGUAGES']
+
+    face_image = memoize(("image", face_hash), lambda: read_image(io.BytesIO(face_bytes), is_uploaded=True))
     if face_image is None:
-        st.error("Face image not uploaded. Please upload a face image.")
+        ui.error("Face image not uploaded. Please upload a face image.")
         logging.error("No face image uploaded.")
         return
     
     # Process the ID card image
-    image = read_image(image_file, is_uploaded=True)
-    logging.info("ID card image loaded.")
-    image_roi, _ = extract_id_card(image)
+    cropped = memoize(("card_roi", card_hash), lambda: crop_card(card_bytes))
+    if cropped is None:
+        ui.error("No ID card found in the image. Please upload a clearer image.")
+        return
+    image_roi, card_box = cropped
     logging.info("ID card ROI extracted.")
-    
-    # Process face images
-    face_image_path2 = detect_and_extract_face(img=image_roi)
-    face_image_path1 = save_image(face_image, "face_image.jpg", path=os.path.join("data", "02_intermediate_data"))
-    logging.info("Faces extracted and saved.")
+
+    auto_detect = option == "AUTO DETECT"
+    if auto_detect:
+        def detect_card_type():
+            card_type, detected_probe = classify_card(image_roi, languages=languages)
+            # A keyword fallback already probed the card, keep it so the probe below is not run twice
+            if detected_probe is not None:
+                get_result_store().put(("probe", card_hash, card_type), detected_probe)
+            return card_type
+        option = memoize(("card_type", card_hash), detect_card_type)
+        logging.info(f"ID card type detected: {option}")
+
+    # Cheap detection pass first, so blank or wrong cards never reach face verification or full OCR
+    probe = memoize(("probe", card_hash, option),
+                    lambda: probe_card(image_roi, expected_type=option, languages=languages))
+    if probe.status == "no_text":
+        ui.error("No text found on the ID card. Please upload a clearer image.")
+        return
+    if probe.status == "mismatch":
+        if not auto_detect:
+            ui.error(f"This looks like a {probe.card_type} card, but {option} is selected. Please check the ID card type.")
+            return
+        # Keywords on the card beat the colour/layout guess
+        option = probe.card_type
+    if auto_detect:
+        ui.info(f"Detected ID card type: {option}")
+    image_roi = probe.image
     
     # Verify face match
-    is_face_verified = deepface_face_comparison(image1_path=face_image_path1, image2_path=face_image_path2)
+    is_face_verified = memoize(("face_verified", card_hash, face_hash),
+                               lambda: verify_card_face(image_roi, face_image))
     logging.info(f"Face verification status: {'successful' if is_face_verified else 'failed'}.")
     
     if not is_face_verified:
-        st.error("Face verification failed. Please try again.")
+        ui.error("Face verification failed. Please try again.")
         return
     
     # Process the ID card based on type
-    extracted_text = extract_text(image_roi)
+    fingerprint = pipeline_fingerprint()
+    extracted_text, tokens = memoize(("ocr", card_hash, probe.rotation, fingerprint), lambda: recognize_card(
+        probe,
+        confidence_threshold=pipeline_settings['OCR_CONFIDENCE'],
+        languages=languages,
+        return_tokens=True,
+        cache_key=f"{card_hash}_{fingerprint}"
+    ))
     logging.info("Text extracted from ID card.")
-    
+
+    source_images = {"Image Hash": card_bytes, "Face Hash": face_bytes}
+    # Crops are stored as boxes on the uploads, image_roi is the card crop turned upright
+    crops = {"Card Crop Hash": ("Image Hash", card_box, 0)}
+    face_box = memoize(("face_box", card_hash, probe.rotation), lambda: largest_face_box(image_roi))
+    if face_box is not None:
+        crops["Face Crop Hash"] = ("Card Crop Hash", face_box, probe.rotation)
     if option == "COLLEGE ID":
-        process_college_id(image_roi, face_image_path1, extracted_text)
+        process_college_id(image_roi, face_image, extracted_text, source_images, tokens, ui, crops)
     else:
-        process_pan_aadhar(image_roi, face_image_path1, option, extracted_text)
+        process_pan_aadhar(image_roi, face_image, option, extracted_text, source_images, tokens, ui, crops)
+
+@profiled("main_content")
+def main_content(image_file, face_image_file, option):
+    """Main content processing function"""
+    if image_file is None:
+        st.warning("Please upload an ID card image.")
+        logging.warning("No ID card image uploaded.")
+        return
+
+    # Widget interactions rerun the whole script, replay the finished result for the same uploads
+    key = (image_file.file_id, face_image_file.file_id, option)
+    outcomes = st.session_state.setdefault("kyc_outcomes", OrderedDict())
+    if key in outcomes:
+        replay(outcomes[key])
+        return
+
+    set_request_id()
+    ui = RecordedUI()
+    run_kyc(image_file, face_image_file, option, ui)
+    outcomes[key] = ui.calls
+    while len(outcomes) > cache_settings['SESSION_RESULTS']:
+        outcomes.popitem(last=False)
 
 def main():
     """Main application function"""
@@ -0,0 +1,159 @@
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from functools import partial
+from logging_setup import setup_logging
+from ocr_engine import (extract_text, extract_tokens_batch, tokens_to_string, ocr_cache_path, save_tokens,
+                        recognize_card, recognize_cards, card_cache_path)
+from face_verification import VERIFY_MODEL, embed_faces, embeddings_match
+from profiling import worker_task
+from utils import read_yaml
+
+# Logging configuration
+setup_logging()
+
+config_path = "config.yaml"
+batch_settings = read_yaml(config_path)['batching']
+
+
+class MicroBatcher:
+    """Collects concurrent calls for up to max_wait_ms or max_batch_size items and runs batch_fn once on them.
+
+    batch_fn takes a list of items and returns one result per item. Callers block on a Future, so the
+    batcher can sit in front of any per-item function without changing its callers.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=8, max_wait_ms=10, name="micro-batcher"):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.SimpleQueue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        if self._closed:
+            raise RuntimeError("MicroBatcher is closed")
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item, timeout=None):
+        return self.submit(item).result(timeout)
+
+    def close(self):
+        """Run what is already queued, then stop the batching thread"""
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            entry = self._queue.get()
+            if entry is None:
+                break
+            batch = [entry]
+            # The first item starts the clock, the batch goes out when it is full or the wait is over
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    entry = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stopping = True
+                    break
+                batch.append(entry)
+            self._dispatch(batch)
+
+    def _dispatch(self, batch):
+        # Callers that cancelled while waiting are left out
+        batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            # Sampled by profiled runs while the batch runs, see profiling.worker_task
+            with worker_task():
+                results = self.batch_fn([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"batch_fn returned {len(results)} results for {len(batch)} items")
+        except Exception as e:
+            logging.error(f"Batch of {len(batch)} failed: {e}")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+
+# ---------- Shared batchers ----------
+# One batcher per OCR language set and per face model, created on first use
+
+_batchers = {}
+_batchers_lock = threading.Lock()
+
+def get_batcher(key, batch_fn):
+    with _batchers_lock:
+        if key not in _batchers:
+            _batchers[key] = MicroBatcher(batch_fn, max_batch_size=batch_settings['MAX_BATCH_SIZE'],
+                                          max_wait_ms=batch_settings['MAX_WAIT_MS'], name=f"batcher-{key[0]}")
+        return _batchers[key]
+
+def batched_extract_text(image, confidence_threshold=0.3, languages=['en'], return_tokens=False, cache_key=None):
+    """Drop-in for extract_text (image array or path) whose readtext call is shared with concurrent callers"""
+    width, height = batch_settings['OCR_WIDTH'], batch_settings['OCR_HEIGHT']
+    # Tokens read at the batch size differ from full-resolution ones, neither path may serve the other's cache
+    if cache_key:
+        cache_key = f"{cache_key}_batch{width}x{height}"
+    cache_path = ocr_cache_path(cache_key, languages) if cache_key else None
+    if cache_path and os.path.exists(cache_path):
+        return extract_text(image, confidence_threshold, languages, return_tokens, cache_key)
+
+    batcher = get_batcher(("ocr", tuple(languages)), partial(
+        extract_tokens_batch, languages=languages, width=width, height=height))
+    try:
+        tokens = batcher(image)
+    except Exception as e:
+        logging.info(f"An error occurred during text extraction: {e}")
+        return ("", None) if return_tokens else ""
+    if cache_path:
+        save_tokens(tokens, cache_path)
+    filtered_text = tokens_to_string(tokens, confidence_threshold)
+    return (filtered_text, tokens) if return_tokens else filtered_text
+
+def batched_face_embedding(image, model_name="Facenet"):
+    """Drop-in for get_face_embeddings / embed_face whose forward pass is shared with concurrent callers"""
+    batcher = get_batcher(("embedding", model_name), partial(embed_faces, model_name=model_name))
+    return batcher(image)
+
+def batched_recognize_card(probe, confidence_threshold=0.3, languages=['en'], return_tokens=False, cache_key=None):
+    """Drop-in for recognize_card whose recognizer pass is shared with concurrent callers"""
+    # Same boxes and recognizer as recognize_card, so both read and write the same cache entries
+    cache_path = card_cache_path(cache_key, languages) if cache_key else None
+    if cache_path and os.path.exists(cache_path):
+        return recognize_card(probe, confidence_threshold, languages, return_tokens, cache_key)
+
+    batcher = get_batcher(("recognize", tuple(languages)), partial(recognize_cards, languages=languages))
+    try:
+        tokens = batcher(probe)
+    except Exception as e:
+        logging.warning(f"An error occurred during text extraction: {e}")
+        return ("", None) if return_tokens else ""
+    if cache_path:
+        save_tokens(tokens, cache_path)
+    filtered_text = tokens_to_string(tokens, confidence_threshold)
+    return (filtered_text, tokens) if return_tokens else filtered_text
+
+def batched_verify_faces(img1, img2, model_name=VERIFY_MODEL):
+    """Drop-in for verify_faces, both faces are embedded in batches shared with concurrent callers"""
+    batcher = get_batcher(("embedding", model_name), partial(embed_faces, model_name=model_name))
+    futures = [batcher.submit(img1), batcher.submit(img2)]
+    return embeddings_match(*(future.result() for future in futures), model_name=model_name)
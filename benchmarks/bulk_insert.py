@@ -0,0 +1,82 @@
+"""Rows/sec of the per-row insert path (execute + commit per record) against insert_many.
+
+Uses a scratch database so the configured one is never filled with synthetic rows. Importing
+sql_connection still connects to (and migrates) the database in config.toml.
+
+Run from the project root:  python -m benchmarks.bulk_insert --rows 20000
+"""
+import time
+import argparse
+import numpy as np
+import mysql.connector
+import toml
+from schema import apply_migrations
+from sql_connection import INSERT_SQL, record_values, insert_many
+
+
+def make_records(count, offset):
+    embedding = list(np.random.default_rng(0).random(128))
+    return [{
+        "name": f"Student {offset + i}",
+        "course": "B.Tech",
+        "department": "CSE",
+        "contact_no": f"9{offset + i:09d}",
+        "validity": None,
+        "address": "Kanpur",
+        "father_name": f"Parent {offset + i}",
+        "ID Type": "COLLEGE ID",
+        "Embedding": embedding,
+    } for i in range(count)]
+
+
+def per_row(connection, records):
+    cursor = connection.cursor()
+    for record in records:
+        cursor.execute(INSERT_SQL["college_ids"], record_values("college_ids", record))
+        connection.commit()
+    cursor.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--database", default="kyc_benchmark")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[100, 500, 2000])
+    args = parser.parse_args()
+
+    db_config = toml.load("config.toml")["database"]
+    host = db_config.get("host", "localhost")
+    server = mysql.connector.connect(host=host, user=db_config["user"], password=db_config["password"])
+    server.cursor().execute(f"DROP DATABASE IF EXISTS {args.database}")
+    server.cursor().execute(f"CREATE DATABASE {args.database}")
+    connection = mysql.connector.connect(host=host, user=db_config["user"],
+                                         password=db_config["password"], database=args.database)
+    apply_migrations(connection)
+
+    offset = 0
+    start = time.perf_counter()
+    per_row(connection, make_records(args.rows, offset))
+    elapsed = time.perf_counter() - start
+    print(f"{'per-row insert + commit':28} {args.rows / elapsed:10.0f} rows/s")
+    offset += args.rows
+
+    for batch_size in args.batch_sizes:
+        records = make_records(args.rows, offset)
+        start = time.perf_counter()
+        insert_many("college_ids", records, batch_size=batch_size, connection=connection)
+        elapsed = time.perf_counter() - start
+        print(f"{f'insert_many batch {batch_size}':28} {args.rows / elapsed:10.0f} rows/s (with embeddings)")
+        offset += args.rows
+
+    # 1% duplicates, found by the per-batch contact_no lookup before the insert
+    records = make_records(args.rows, offset)
+    records[::100] = make_records(len(records[::100]), 0)
+    start = time.perf_counter()
+    statuses = insert_many("college_ids", records, connection=connection)
+    elapsed = time.perf_counter() - start
+    print(f"{'insert_many, 1% duplicates':28} {args.rows / elapsed:10.0f} rows/s "
+          f"({statuses.count('inserted')} inserted, {statuses.count('duplicate')} skipped)")
+
+
+if __name__ == "__main__":
+    main()
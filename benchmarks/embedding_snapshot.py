@@ -0,0 +1,90 @@
+"""Cold start of a 1:N face search: loading every embedding from MySQL against opening the memmap snapshot.
+
+Fills a scratch database (never the one in config.toml) with random Facenet-sized embeddings, then times
+SELECT + parse of all rows, a full snapshot build, a delta append and opening the snapshot plus one search.
+Half of the delta rows re-embed existing records, so the snapshot has replaced rows to mask out.
+
+Run from the project root:  python -m benchmarks.embedding_snapshot --rows 1000000
+"""
+import time
+import argparse
+import tempfile
+import numpy as np
+import mysql.connector
+import toml
+from schema import apply_migrations, embedding_to_blob, blob_to_embedding
+import embedding_snapshot
+from embedding_snapshot import build_snapshot, append_delta, EmbeddingSnapshot
+
+FILL_BATCH_SIZE = 10000
+DIM = 128
+
+
+def fill(connection, rows, offset=0, seed=3):
+    rng = np.random.default_rng(seed)
+    cursor = connection.cursor()
+    for start in range(offset, offset + rows, FILL_BATCH_SIZE):
+        count = min(FILL_BATCH_SIZE, offset + rows - start)
+        vectors = rng.normal(size=(count, DIM)).astype(np.float32)
+        cursor.executemany(
+            "REPLACE INTO face_embeddings (source_table, record_id, model, embedding) VALUES (%s, %s, %s, %s)",
+            [("users", f"{start + i:064x}", embedding_snapshot.face_model, embedding_to_blob(v))
+             for i, v in enumerate(vectors)])
+        connection.commit()
+    cursor.close()
+
+
+def load_from_mysql(connection):
+    cursor = connection.cursor()
+    cursor.execute("SELECT source_table, record_id, embedding FROM face_embeddings")
+    rows = cursor.fetchall()
+    cursor.close()
+    return np.stack([blob_to_embedding(blob) for _, _, blob in rows])
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--delta-rows", type=int, default=10_000)
+    parser.add_argument("--database", default="kyc_benchmark")
+    args = parser.parse_args()
+
+    db_config = toml.load("config.toml")["database"]
+    host = db_config.get("host", "localhost")
+    server = mysql.connector.connect(host=host, user=db_config["user"], password=db_config["password"])
+    server.cursor().execute(f"DROP DATABASE IF EXISTS {args.database}")
+    server.cursor().execute(f"CREATE DATABASE {args.database}")
+    connection = mysql.connector.connect(host=host, user=db_config["user"],
+                                         password=db_config["password"], database=args.database)
+    apply_migrations(connection)
+    # Nothing else writes to the scratch database, rows can be exported as soon as they are committed
+    embedding_snapshot.snapshot_settings['SAFETY_LAG_S'] = 0
+    print(f"Filling {args.rows:,} embeddings...")
+    fill(connection, args.rows)
+    directory = tempfile.mkdtemp()
+
+    elapsed, matrix = timed(load_from_mysql, connection)
+    print(f"{'SELECT + parse all rows':32} {elapsed:9.2f} s")
+    elapsed, _ = timed(build_snapshot, connection, directory)
+    print(f"{'build snapshot':32} {elapsed:9.2f} s")
+
+    fill(connection, args.delta_rows, offset=args.rows - args.delta_rows // 2, seed=4)
+    elapsed, _ = timed(append_delta, connection, directory)
+    print(f"{f'append delta ({args.delta_rows:,} rows)':32} {elapsed:9.2f} s")
+
+    elapsed, snapshot = timed(EmbeddingSnapshot, directory)
+    print(f"{'open snapshot':32} {elapsed * 1000:9.1f} ms")
+    elapsed, _ = timed(snapshot.search, matrix[0])
+    print(f"{'first search (cold pages)':32} {elapsed * 1000:9.1f} ms")
+    elapsed, _ = timed(snapshot.search, matrix[1])
+    print(f"{'second search (page cached)':32} {elapsed * 1000:9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""Leave-one-out accuracy and latency of the colour/layout ID card classifier on the sample cards.
+
+Run from the project root:  python -m benchmarks.id_classifier
+"""
+import time
+import numpy as np
+from id_classifier import reference_crops, card_features, fit_centroids, classify_by_features
+
+
+def main():
+    # Same crops reference_centroids() fits on
+    crops = reference_crops()
+
+    correct = 0
+    feature_ms, classify_ms = [], []
+    for held_out, (image, card_type) in crops.items():
+        model = fit_centroids([pair for path, pair in crops.items() if path != held_out])
+
+        start = time.perf_counter()
+        card_features(image)
+        feature_ms.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        predicted, margin = classify_by_features(image, model)
+        classify_ms.append((time.perf_counter() - start) * 1000)
+
+        correct += predicted == card_type
+        print(f"{held_out:36} {card_type:11} -> {predicted:11} margin {margin:.2f}")
+
+    print()
+    print(f"Leave-one-out accuracy: {correct}/{len(crops)}")
+    print(f"Features: median {np.median(feature_ms):.2f} ms, classify: median {np.median(classify_ms):.2f} ms, "
+          f"max {np.max(classify_ms):.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
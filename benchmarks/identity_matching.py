@@ -0,0 +1,102 @@
+"""Precision, recall and latency of IdentityIndex.match on synthetic Indian-style names with OCR noise.
+
+Builds an index of --rows random records, then queries it with OCR-corrupted copies of stored records
+(should match their source) and with unseen people (should match nothing). A few queries are also run
+as a full scan over every row for comparison.
+
+Run from the project root:  python -m benchmarks.identity_matching --rows 1000000
+"""
+import time
+import random
+import argparse
+import numpy as np
+from identity_matching import IdentityIndex, levenshtein_many, normalize_name
+
+FIRST_NAMES = ["RAHUL", "PRIYA", "AMIT", "SUNITA", "VIKRAM", "ANJALI", "SURESH", "KAVITA", "ARJUN", "NEHA",
+               "RAJESH", "POOJA", "SANJAY", "DEEPA", "MANOJ", "LAKSHMI", "KIRAN", "ANITA", "RAVI", "MEERA"]
+SYLLABLES = ["RA", "JA", "KU", "MA", "SH", "AR", "VE", "NI", "TH", "PA", "DE", "SI", "NG", "YA", "LA", "KA",
+             "VA", "DH", "RI", "SA", "NA", "GU", "PT", "BH", "AT", "TI", "MI", "SHA", "RMA", "NDA"]
+# Characters EasyOCR tends to confuse on printed cards
+OCR_CONFUSIONS = {"O": "0D", "I": "1L", "S": "5", "B": "8", "G": "6", "M": "N", "N": "M", "U": "V", "E": "F"}
+
+
+def random_name(rng):
+    # Printed names are mostly 12-25 letters: given name, often a middle name, and a surname
+    surname = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(3, 4)))
+    middle = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+    first = rng.choice(FIRST_NAMES) if rng.random() < 0.3 else "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3)))
+    return f"{first} {middle} {surname}" if rng.random() < 0.6 else f"{first} {surname}"
+
+
+def random_dob(rng):
+    return f"{rng.randint(1950, 2005)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+
+
+def ocr_noise(name, rng):
+    letters = list(name)
+    for _ in range(rng.randint(0, 2)):
+        i = rng.randrange(len(letters))
+        if letters[i] in OCR_CONFUSIONS and rng.random() < 0.7:
+            letters[i] = rng.choice(OCR_CONFUSIONS[letters[i]])
+        elif letters[i] != " ":
+            letters[i] = "" if rng.random() < 0.5 else letters[i] * 2
+    return "".join(letters)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--scan-queries", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    tables = ("users", "aadhar", "college_ids")
+    people = [(random_name(rng), random_dob(rng)) for _ in range(args.rows)]
+
+    start = time.perf_counter()
+    index = IdentityIndex()
+    for i, (name, dob) in enumerate(people):
+        table = tables[i % 3]
+        index.add(table, i, name, None if table == "college_ids" else dob)
+    print(f"Indexed {len(index):,} records in {len(index.blocks):,} blocks in {time.perf_counter() - start:.1f}s")
+
+    latencies, true_positives, false_positives, found = [], 0, 0, 0
+    for _ in range(args.queries):
+        target = rng.randrange(args.rows)
+        name, dob = people[target]
+        start = time.perf_counter()
+        matches = index.match(ocr_noise(name, rng), dob)
+        latencies.append(time.perf_counter() - start)
+        # Synthetic names can collide, a match counts as correct when it is the same normalized name and dob
+        expected = (normalize_name(name), dob)
+        correct = [m for m in matches if m["record_id"] == str(target)
+                   or (m["name"], m["dob"]) == expected]
+        true_positives += len(correct)
+        false_positives += len(matches) - len(correct)
+        found += any(m["record_id"] == str(target) for m in matches)
+
+    unseen_matches = 0
+    for _ in range(args.queries):
+        start = time.perf_counter()
+        matches = index.match(random_name(rng), random_dob(rng))
+        latencies.append(time.perf_counter() - start)
+        unseen_matches += len(matches)
+
+    returned = true_positives + false_positives + unseen_matches
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+    print(f"recall     {found / args.queries:8.3f}  (noisy copy finds its source record)")
+    print(f"precision  {true_positives / max(returned, 1):8.3f}  ({false_positives + unseen_matches} wrong matches)")
+    print(f"latency ms p50 {p50:.2f}  p99 {p99:.2f}")
+
+    # Same distance computation without blocking
+    count = len(index)
+    start = time.perf_counter()
+    for _ in range(args.scan_queries):
+        name, _ = people[rng.randrange(args.rows)]
+        levenshtein_many(normalize_name(name), index.names[:count], index.lengths[:count])
+    print(f"full scan  {(time.perf_counter() - start) / args.scan_queries * 1000:8.1f} ms per query")
+
+
+if __name__ == "__main__":
+    main()
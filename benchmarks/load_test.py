@@ -0,0 +1,76 @@
+"""Closed-loop load test of the HTTP API: RPS, latency percentiles and how many requests were shed.
+
+Start the service first (python api.py), then from the project root:
+
+    python -m benchmarks.load_test --endpoint extract --concurrency 16 --requests 400
+"""
+import time
+import argparse
+import threading
+import numpy as np
+import requests
+
+CARDS = [
+    "data/01_raw_data/pan.jpeg",
+    "data/01_raw_data/aadhar.png",
+    "data/01_raw_data/id_1.png",
+]
+
+
+def read_bytes(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--endpoint", choices=("verify", "extract", "register"), default="extract")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=400)
+    args = parser.parse_args()
+
+    # Each card doubles as its own selfie, so /verify and /register get past the face check
+    cards = [(path, read_bytes(path)) for path in CARDS]
+    url = f"{args.url}/{args.endpoint}"
+    latencies, statuses = [], []
+    lock = threading.Lock()
+    counter = iter(range(args.requests))
+
+    def client():
+        session = requests.Session()
+        for i in counter:
+            path, data = cards[i % len(cards)]
+            files = {"card": (path, data)}
+            if args.endpoint != "extract":
+                files["selfie"] = (path, data)
+            start = time.perf_counter()
+            try:
+                status = session.post(url, files=files, timeout=300).status_code
+            except requests.RequestException:
+                status = "error"
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                statuses.append(status)
+
+    clients = [threading.Thread(target=client) for _ in range(args.concurrency)]
+    start = time.perf_counter()
+    for c in clients:
+        c.start()
+    for c in clients:
+        c.join()
+    wall = time.perf_counter() - start
+
+    served = [latency for latency, status in zip(latencies, statuses) if status not in (429, 504, "error")]
+    print(f"{args.requests} requests to /{args.endpoint} at concurrency {args.concurrency} in {wall:.1f}s")
+    print(f"throughput   {len(served) / wall:8.2f} served req/s ({len(statuses) / wall:.2f} incl. rejected)")
+    if served:
+        p50, p95, p99 = np.percentile(served, [50, 95, 99]) * 1000
+        print(f"latency ms   p50 {p50:8.0f}   p95 {p95:8.0f}   p99 {p99:8.0f}")
+    for status in sorted(set(statuses), key=str):
+        print(f"status {status!s:>6} {statuses.count(status):8}")
+
+
+if __name__ == "__main__":
+    main()
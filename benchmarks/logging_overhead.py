@@ -0,0 +1,71 @@
+"""Per-request logging overhead: the old per-module basicConfig file handler vs the shared queue setup.
+
+Replays the same log calls through both setups, about 30 INFO lines plus the extracted OCR text and
+per-file existence messages of one KYC request, from several threads at once. Only the handler
+side differs; the call sites are identical.
+
+Run from the project root:  python -m benchmarks.logging_overhead
+"""
+import os
+import time
+import logging
+import tempfile
+import threading
+import argparse
+import logging_setup
+
+EXTRACTED_TEXT = "|INCOME TAX DEPARTMENT|GOVT OF INDIA|RAHUL KUMAR SHARMA|SURESH KUMAR SHARMA|" \
+                 "01/01/1990|Permanent Account Number|ABCDE1234F|Signature|" * 4
+
+
+def request():
+    logging_setup.set_request_id()
+    for i in range(30):
+        logging.info(f"Pipeline step {i} done")
+    for path in ("data/02_intermediate_data/face_image.jpg", "data/02_intermediate_data/extracted_face.jpg"):
+        logging.info(f"File exists at {path}")
+    logging.info(f"Extracted Text: {EXTRACTED_TEXT}")
+
+
+def run(request, threads, requests_per_thread):
+    def worker():
+        for _ in range(requests_per_thread):
+            request()
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return (time.perf_counter() - start) / (threads * requests_per_thread) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 16])
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp()
+    root = logging.getLogger()
+
+    # Before: FileHandler with the old text format, writing in the calling thread
+    handler = logging.FileHandler(os.path.join(scratch, "old.log"))
+    handler.setFormatter(logging.Formatter("[%(asctime)s: %(levelname)s: %(module)s]: %(message)s"))
+    root.handlers = [handler]
+    root.setLevel(logging.INFO)
+    before = {threads: run(request, threads, args.requests // threads) for threads in args.threads}
+    handler.close()
+
+    # After: queue handler, JSON lines written by the listener thread
+    logging_setup.log_settings['LOG_FILE'] = os.path.join(scratch, "new.log")
+    logging_setup.setup_logging()
+    after = {threads: run(request, threads, args.requests // threads) for threads in args.threads}
+
+    print(f"{'threads':>8} {'before us/request':>18} {'after us/request':>17}")
+    for threads in args.threads:
+        print(f"{threads:8} {before[threads]:18.1f} {after[threads]:17.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Throughput and p99 latency of per-request inference against the micro-batched path on CPU.
+
+N client threads call either the plain function or its batched drop-in back to back on the sample
+images: extract_text, recognize_card (on probes made up front), embed_face, or verify_faces (each face
+against itself). recognize, embedding and verify are the paths KYCPipeline and the app batch.
+
+Run from the project root:  python -m benchmarks.micro_batching --target embedding --concurrency 1 4 8 16
+"""
+import time
+import argparse
+import threading
+import numpy as np
+import batching
+from preprocess import read_image
+from ocr_engine import extract_text, probe_card, recognize_card
+from face_verification import embed_face, verify_faces
+
+CARDS = [
+    "data/01_raw_data/pan.jpeg",
+    "data/01_raw_data/aadhar.png",
+    "data/01_raw_data/id_1.png",
+]
+FACES = [
+    "data/01_raw_data/srk1.jpeg",
+    "data/01_raw_data/extracted_face.jpg",
+]
+
+
+def run(fn, images, concurrency, calls_per_thread):
+    latencies = []
+    lock = threading.Lock()
+
+    def client(offset):
+        for i in range(calls_per_thread):
+            start = time.perf_counter()
+            fn(images[(offset + i) % len(images)])
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+
+    clients = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    start = time.perf_counter()
+    for c in clients:
+        c.start()
+    for c in clients:
+        c.join()
+    wall = time.perf_counter() - start
+    return len(latencies) / wall, np.percentile(latencies, 99) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--target", choices=("ocr", "recognize", "embedding", "verify"), default="embedding")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--calls", type=int, default=8, help="calls per client thread")
+    parser.add_argument("--max-batch-size", type=int, default=None)
+    parser.add_argument("--max-wait-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    if args.max_batch_size:
+        batching.batch_settings['MAX_BATCH_SIZE'] = args.max_batch_size
+    if args.max_wait_ms is not None:
+        batching.batch_settings['MAX_WAIT_MS'] = args.max_wait_ms
+
+    if args.target == "ocr":
+        images = [read_image(path) for path in CARDS]
+        plain, batched = extract_text, batching.batched_extract_text
+    elif args.target == "recognize":
+        images = [probe_card(read_image(path)) for path in CARDS]
+        plain, batched = recognize_card, batching.batched_recognize_card
+    elif args.target == "verify":
+        images = [read_image(path) for path in FACES]
+        plain = lambda face: verify_faces(face, face)
+        batched = lambda face: batching.batched_verify_faces(face, face)
+    else:
+        images = [read_image(path) for path in FACES]
+        plain, batched = embed_face, batching.batched_face_embedding
+
+    # Warm up both paths so model loading is not billed to the first level
+    plain(images[0])
+    batched(images[0])
+
+    print(f"{args.target}: batch size {batching.batch_settings['MAX_BATCH_SIZE']}, "
+          f"max wait {batching.batch_settings['MAX_WAIT_MS']} ms")
+    print(f"{'clients':>8} {'plain/s':>9} {'plain p99 ms':>13} {'batched/s':>10} {'batched p99 ms':>15}")
+    for concurrency in args.concurrency:
+        plain_rate, plain_p99 = run(plain, images, concurrency, args.calls)
+        batched_rate, batched_p99 = run(batched, images, concurrency, args.calls)
+        print(f"{concurrency:8} {plain_rate:9.2f} {plain_p99:13.0f} {batched_rate:10.2f} {batched_p99:15.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""CPU time of full readtext vs the early-exit cascade on uploads that do not match the selection.
+
+Run from the project root:  python -m benchmarks.ocr_cascade
+"""
+import time
+from preprocess import read_image
+from ocr_engine import get_reader, probe_card, recognize_card
+
+# Sample cards shipped in data/01_raw_data and the type each one actually is
+SAMPLES = {
+    "data/01_raw_data/pan.jpeg": "PAN",
+    "data/01_raw_data/pan_1.jpg": "PAN",
+    "data/01_raw_data/pan_2.jpg": "PAN",
+    "data/01_raw_data/aadhar.png": "AADHAR",
+    "data/01_raw_data/adhar_2.jpg": "AADHAR",
+    "data/01_raw_data/adhar_3.png": "AADHAR",
+    "data/01_raw_data/id_1.png": "COLLEGE ID",
+    "data/01_raw_data/id_2.png": "COLLEGE ID",
+}
+CARD_TYPES = ("PAN", "AADHAR", "COLLEGE ID")
+
+
+def cpu_time(fn, *args, **kwargs):
+    start = time.process_time()
+    result = fn(*args, **kwargs)
+    return time.process_time() - start, result
+
+
+def main():
+    reader = get_reader(("en",))
+    # Warm up so model loading is not billed to the first sample
+    reader.readtext(read_image("data/01_raw_data/pan.jpeg"))
+
+    print(f"{'image':36} {'selected':11} {'full s':>8} {'cascade s':>10} {'status':>9}")
+    full_total = cascade_total = 0.0
+    mismatches = aborted = 0
+    for path, actual_type in SAMPLES.items():
+        image = read_image(path)
+        if image is None:
+            continue
+        full_time, _ = cpu_time(reader.readtext, image)
+        for selected in CARD_TYPES:
+            probe_time, probe = cpu_time(probe_card, image, expected_type=selected)
+            cascade_time = probe_time
+            if probe.status == "ok":
+                recognize_time, _ = cpu_time(recognize_card, probe)
+                cascade_time += recognize_time
+            if selected != actual_type:
+                mismatches += 1
+                aborted += probe.status == "mismatch"
+                full_total += full_time
+                cascade_total += cascade_time
+            print(f"{path:36} {selected:11} {full_time:8.2f} {cascade_time:10.2f} {probe.status:>9}")
+
+    print()
+    print(f"Mismatched uploads aborted early: {aborted}/{mismatches}")
+    if full_total:
+        print(f"CPU time on mismatched uploads: full {full_total:.1f}s, cascade {cascade_total:.1f}s "
+              f"({100 * (1 - cascade_total / full_total):.0f}% saved)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Concurrent KYCPipeline.process calls: checks that no request sees another's state and reports throughput.
+
+Every sample card is processed once sequentially as the baseline, then the same cards are shuffled over
+N threads sharing one pipeline and each result must equal its baseline. The OCR disk cache is off, so
+every call does the full work. Each card doubles as its own selfie, the face printed on it is matched
+against itself.
+
+Nothing is written to the database unless --database names a scratch database. It is then recreated,
+every thread count starts from empty tables, and the threads register through a pool smaller than the
+thread count: each card must be registered exactly once and reported as a duplicate otherwise.
+
+Run from the project root:  python -m benchmarks.pipeline_stress --threads 1 2 4 8
+                            python -m benchmarks.pipeline_stress --database kyc_stress --pool-size 2
+"""
+import time
+import random
+import argparse
+import numpy as np
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pipeline import KYCPipeline
+
+SAMPLES = [
+    "data/01_raw_data/pan.jpeg",
+    "data/01_raw_data/pan_1.jpg",
+    "data/01_raw_data/pan_2.jpg",
+    "data/01_raw_data/aadhar.png",
+    "data/01_raw_data/adhar_2.jpg",
+    "data/01_raw_data/id_1.png",
+    "data/01_raw_data/id_2.png",
+]
+
+
+def read_bytes(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def comparable(result):
+    # Request ids differ by design, embeddings are compared with a tolerance
+    record = dict(result.get("record") or {})
+    embedding = record.pop("Embedding", None)
+    # Registering turns an extracted card into registered or duplicate, the record is the same
+    status = "extracted" if result["status"] in ("registered", "duplicate") else result["status"]
+    return (status, result["id_type"], record), embedding
+
+
+def same_result(result, baseline):
+    (fields, embedding), (expected_fields, expected_embedding) = comparable(result), comparable(baseline)
+    if fields != expected_fields:
+        return False
+    if embedding is None or expected_embedding is None:
+        return embedding is expected_embedding
+    return np.allclose(embedding, expected_embedding, atol=1e-5)
+
+
+def scratch_database(name):
+    """Recreate the scratch database and point new pools at it"""
+    import toml
+    import mysql.connector
+    import sql_connection
+    from schema import apply_migrations
+
+    db_config = toml.load("config.toml")["database"]
+    host = db_config.get("host", "localhost")
+    server = mysql.connector.connect(host=host, user=db_config["user"], password=db_config["password"])
+    server.cursor().execute(f"DROP DATABASE IF EXISTS {name}")
+    server.cursor().execute(f"CREATE DATABASE {name}")
+    connection = mysql.connector.connect(host=host, user=db_config["user"],
+                                         password=db_config["password"], database=name)
+    apply_migrations(connection)
+    sql_connection.db_name = name
+    return connection
+
+
+def empty_tables(connection):
+    from schema import KYC_TABLES
+    cursor = connection.cursor()
+    for table in (*KYC_TABLES, "face_embeddings"):
+        cursor.execute(f"DELETE FROM {table}")
+    connection.commit()
+    cursor.close()
+
+
+def registration_errors(results, baseline):
+    """Cards not registered exactly once, keyed by the record id the baseline extracted"""
+    registered = Counter((result["id_type"], result["record"]["ID"])
+                         for result in results if result["status"] == "registered")
+    expected = {(result["id_type"], result["record"]["ID"])
+                for result in baseline.values() if result["status"] == "extracted"}
+    return sum(registered[key] != 1 for key in expected) + sum(key not in expected for key in registered)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--rounds", type=int, default=4, help="passes over the sample cards per thread count")
+    parser.add_argument("--database", default=None, help="scratch database to register into, dropped first")
+    parser.add_argument("--pool-size", type=int, default=2, help="connections shared by the threads")
+    args = parser.parse_args()
+
+    connection = scratch_database(args.database) if args.database else None
+    pipeline = KYCPipeline(use_database=connection is not None, pool_size=args.pool_size, ocr_cache=False)
+    cards = {path: read_bytes(path) for path in SAMPLES}
+    register = connection is not None
+    process = lambda path: pipeline.process(cards[path], cards[path], register=register)
+
+    baseline = {path: pipeline.process(cards[path], cards[path], register=False) for path in SAMPLES}
+    for path, result in baseline.items():
+        print(f"{path:36} {result['status']:14} {result['id_type']}")
+
+    print(f"\n{'threads':>8} {'cards/s':>9} {'speedup':>8} {'mismatches':>11}")
+    single = None
+    for threads in args.threads:
+        jobs = SAMPLES * args.rounds
+        random.Random(threads).shuffle(jobs)
+        if register:
+            empty_tables(connection)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            results = list(executor.map(process, jobs))
+        throughput = len(jobs) / (time.perf_counter() - start)
+        single = single or throughput
+        mismatches = sum(not same_result(result, baseline[path]) for path, result in zip(jobs, results))
+        print(f"{threads:8} {throughput:9.2f} {throughput / single:8.2f} {mismatches:11}")
+        assert mismatches == 0, f"{mismatches} results differ from the sequential baseline at {threads} threads"
+        if register:
+            errors = registration_errors(results, baseline)
+            assert errors == 0, f"{errors} cards were not registered exactly once at {threads} threads"
+
+
+if __name__ == "__main__":
+    main()
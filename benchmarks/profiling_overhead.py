@@ -0,0 +1,67 @@
+"""Cost of profiling mode on a Python-heavy run: off, stack sampling only, and sampling plus tracemalloc.
+
+The workload builds an IdentityIndex and queries it, which is allocation heavy pure Python plus numpy,
+close to the worst case for tracemalloc. Model inference spends its time in native code and pays
+much less. Profiles are written to a scratch directory and summarized at the end.
+
+Run from the project root:  python -m benchmarks.profiling_overhead --runs 5
+"""
+import time
+import random
+import tempfile
+import argparse
+import profiling
+from identity_matching import IdentityIndex
+
+LETTERS = "ABCDEFGHIKLMNOPRSTUVY"
+
+
+def workload(rows, rng):
+    index = IdentityIndex()
+    names = [" ".join("".join(rng.choice(LETTERS) for _ in range(rng.randint(4, 9))) for _ in range(3))
+             for _ in range(rows)]
+    for i, name in enumerate(names):
+        index.add("users", i, name, f"{rng.randint(1950, 2005)}-01-01")
+    for name in names[:200]:
+        index.match(name)
+
+
+def timed(rows, runs, profile=None):
+    rng = random.Random(5)
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        if profile is None:
+            workload(rows, rng)
+        else:
+            with profiling.profile_run(profile, force=True):
+                workload(rows, rng)
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--interval-ms", type=float, nargs="+", default=[1, 5, 20])
+    args = parser.parse_args()
+
+    profiling.profile_settings['DIR'] = tempfile.mkdtemp()
+    baseline = timed(args.rows, args.runs)
+    print(f"{'mode':>26} {'ms/run':>9} {'overhead':>9}")
+    print(f"{'off':>26} {baseline:9.1f}")
+    for tracemalloc_on in (False, True):
+        profiling.profile_settings['TRACEMALLOC'] = tracemalloc_on
+        for interval in args.interval_ms:
+            profiling.profile_settings['INTERVAL_MS'] = interval
+            mode = f"{interval:g} ms{' + tracemalloc' if tracemalloc_on else ''}"
+            elapsed = timed(args.rows, args.runs, profile=f"overhead-{interval:g}-{int(tracemalloc_on)}")
+            print(f"{mode:>26} {elapsed:9.1f} {elapsed / baseline - 1:9.1%}")
+
+    print()
+    profiling.print_summary(profiling.summarize(top=8))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Lookup latency of every sql_connection query on a large local database, with and without the schema indexes.
+
+Fills a scratch database (never the one in config.toml) with synthetic rows, then times each lookup
+against the migrated tables and against copies without secondary indexes.
+
+Run from the project root:  python -m benchmarks.schema_lookup --rows 10000000
+"""
+import time
+import random
+import string
+import argparse
+import numpy as np
+import mysql.connector
+import toml
+from schema import apply_migrations, embedding_to_blob
+
+FILL_BATCH_SIZE = 10000
+
+
+def random_name(rng):
+    return " ".join("".join(rng.choices(string.ascii_uppercase, k=rng.randint(4, 9))) for _ in range(2))
+
+
+def fill(connection, rows, seed=7):
+    rng = random.Random(seed)
+    cursor = connection.cursor()
+    embedding = embedding_to_blob(np.zeros(128))
+    samples = {"users": [], "college_ids": []}
+    for start in range(0, rows, FILL_BATCH_SIZE):
+        users, colleges, embeddings = [], [], []
+        for i in range(start, min(start + FILL_BATCH_SIZE, rows)):
+            user_id = f"{i:064x}"
+            name, father_name = random_name(rng), random_name(rng)
+            contact_no = f"9{i:09d}"
+            users.append((user_id, name, father_name, "1990-01-01", "PAN", "0" * 16, "0" * 64, "0" * 64))
+            colleges.append((name, "B.Tech", "CSE", contact_no, father_name, "0" * 16))
+            embeddings.append(("users", user_id, embedding))
+            if rng.random() < 0.0005:
+                samples["users"].append(user_id)
+                samples["college_ids"].append((contact_no, name, father_name))
+        cursor.executemany(
+            "INSERT INTO users (id, name, father_name, dob, id_type, pipeline_fingerprint, image_hash, face_hash) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s, %s)", users)
+        cursor.executemany(
+            "INSERT IGNORE INTO college_ids (name, course, department, contact_no, father_name, pipeline_fingerprint) "
+            "VALUES (%s, %s, %s, %s, %s, %s)", colleges)
+        cursor.executemany(
+            "INSERT INTO face_embeddings (source_table, record_id, embedding) VALUES (%s, %s, %s)", embeddings)
+        connection.commit()
+        if start % (100 * FILL_BATCH_SIZE) == 0:
+            print(f"  {start + len(users):,} rows")
+    cursor.close()
+    return samples
+
+
+def make_unindexed_copies(connection):
+    cursor = connection.cursor()
+    for table in ("users", "college_ids"):
+        cursor.execute(f"DROP TABLE IF EXISTS {table}_noindex")
+        cursor.execute(f"CREATE TABLE {table}_noindex LIKE {table}")
+        cursor.execute(f"SHOW INDEX FROM {table}_noindex")
+        indexes = {row[2] for row in cursor.fetchall()} - {"PRIMARY"}
+        for index in indexes:
+            cursor.execute(f"ALTER TABLE {table}_noindex DROP INDEX {index}")
+        cursor.execute(f"INSERT INTO {table}_noindex SELECT * FROM {table}")
+    connection.commit()
+    cursor.close()
+
+
+def time_queries(connection, sql, params, limit):
+    cursor = connection.cursor()
+    timings = []
+    for values in params[:limit]:
+        start = time.perf_counter()
+        cursor.execute(sql, values)
+        cursor.fetchall()
+        timings.append((time.perf_counter() - start) * 1000)
+    cursor.close()
+    return np.percentile(timings, 50), np.percentile(timings, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--database", default="kyc_benchmark")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--unindexed-queries", type=int, default=10,
+                        help="full scans at 10M rows take seconds each")
+    args = parser.parse_args()
+
+    db_config = toml.load("config.toml")["database"]
+    server = mysql.connector.connect(host=db_config.get("host", "localhost"),
+                                     user=db_config["user"], password=db_config["password"])
+    server.cursor().execute(f"DROP DATABASE IF EXISTS {args.database}")
+    server.cursor().execute(f"CREATE DATABASE {args.database}")
+    connection = mysql.connector.connect(host=db_config.get("host", "localhost"), user=db_config["user"],
+                                         password=db_config["password"], database=args.database)
+    apply_migrations(connection)
+
+    print(f"Filling {args.rows:,} rows per table...")
+    samples = fill(connection, args.rows)
+    # Every row is stale against the "f" * 16 fingerprint below, flag them the way reverify.py does
+    cursor = connection.cursor()
+    cursor.execute("UPDATE users SET reverify_pending = 1")
+    connection.commit()
+    cursor.close()
+    make_unindexed_copies(connection)
+
+    users = [(user_id,) for user_id in samples["users"]]
+    contacts = [(contact_no,) for contact_no, _, _ in samples["college_ids"]]
+    names = [(name, father_name) for _, name, father_name in samples["college_ids"]]
+    # Keyset pages starting at random points of the table, as in the middle of a reverify run
+    stale = [("f" * 16, user_id, 100) for user_id in samples["users"]]
+    pending = [(user_id, 100) for user_id in samples["users"]]
+    queries = [
+        ("users by id", "SELECT * FROM {users} WHERE id = %s", users),
+        ("users exists", "SELECT id FROM {users} WHERE id = %s LIMIT 1", users),
+        ("college by contact_no", "SELECT * FROM {college_ids} WHERE contact_no = %s", contacts),
+        ("college exists by contact_no", "SELECT id FROM {college_ids} WHERE contact_no = %s LIMIT 1", contacts),
+        ("college by name+father", "SELECT * FROM {college_ids} WHERE name = %s AND father_name = %s", names),
+        ("stale batch, fingerprint <>", "SELECT id, image_hash, face_hash FROM {users} WHERE (pipeline_fingerprint "
+                                        "IS NULL OR pipeline_fingerprint <> %s) AND id > %s ORDER BY id LIMIT %s", stale),
+        ("stale batch, pending flag", "SELECT id, image_hash, face_hash FROM {users} WHERE reverify_pending = 1 "
+                                      "AND id > %s ORDER BY id LIMIT %s", pending),
+    ]
+
+    print(f"{'query':30} {'indexed p50/p99 ms':>20} {'no index p50/p99 ms':>22}")
+    for label, sql, params in queries:
+        indexed = time_queries(connection, sql.format(users="users", college_ids="college_ids"),
+                               params, args.queries)
+        unindexed = time_queries(connection, sql.format(users="users_noindex", college_ids="college_ids_noindex"),
+                                 params, args.unindexed_queries)
+        print(f"{label:30} {indexed[0]:9.2f}/{indexed[1]:<9.2f} {unindexed[0]:11.2f}/{unindexed[1]:<9.2f}")
+
+
+if __name__ == "__main__":
+    main()
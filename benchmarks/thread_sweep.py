@@ -0,0 +1,79 @@
+"""Throughput of worker processes x threads per worker, to pick api.WORKERS and threads.PER_WORKER.
+
+Each combination starts a fresh spawn pool whose workers call configure_threads and build a KYCPipeline
+(no database, no OCR cache), then pushes the sample cards through it. Model loading is not timed.
+
+Run from the project root:  python -m benchmarks.thread_sweep --workers 1 2 4 --threads 1 2 4 auto
+"""
+import os
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+SAMPLES = [
+    "data/01_raw_data/pan.jpeg",
+    "data/01_raw_data/pan_1.jpg",
+    "data/01_raw_data/aadhar.png",
+    "data/01_raw_data/adhar_2.jpg",
+    "data/01_raw_data/id_1.png",
+    "data/01_raw_data/id_2.png",
+]
+
+_pipeline = None
+
+
+def init_worker(workers, threads):
+    global _pipeline
+    from runtime_config import configure_threads
+    configure_threads(workers=workers, threads=threads)
+    from pipeline import KYCPipeline
+    _pipeline = KYCPipeline(use_database=False, ocr_cache=False)
+
+
+def warm_up(_):
+    time.sleep(0.5)
+    return os.getpid()
+
+
+def process(card_bytes):
+    # The card doubles as the selfie
+    return _pipeline.process(card_bytes, card_bytes, register=False)["status"]
+
+
+def read_bytes(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--threads", nargs="+", default=["1", "2", "4", "auto"])
+    parser.add_argument("--rounds", type=int, default=4, help="passes over the sample cards")
+    args = parser.parse_args()
+
+    cards = [read_bytes(path) for path in SAMPLES] * args.rounds
+    context = multiprocessing.get_context("spawn")
+    print(f"{len(cards)} cards per run on {os.cpu_count()} CPUs")
+    print(f"{'workers':>8} {'threads':>8} {'cards/s':>9}")
+    results = {}
+    for workers in args.workers:
+        for threads in args.threads:
+            threads = threads if threads == "auto" else int(threads)
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                     initargs=(workers, threads), initializer=init_worker) as executor:
+                # Start every worker and load its models before the clock starts
+                list(executor.map(warm_up, range(workers)))
+                start = time.perf_counter()
+                list(executor.map(process, cards))
+                throughput = len(cards) / (time.perf_counter() - start)
+            results[(workers, threads)] = throughput
+            print(f"{workers:8} {threads!s:>8} {throughput:9.2f}")
+
+    (workers, threads), throughput = max(results.items(), key=lambda item: item[1])
+    print(f"\nBest: {workers} workers x {threads} threads, {throughput:.2f} cards/s")
+
+
+if __name__ == "__main__":
+    main()
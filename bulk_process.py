@@ -0,0 +1,179 @@
+import os
+import csv
+import logging
+from logging_setup import setup_logging, set_request_id
+import argparse
+from runtime_config import configure_threads
+
+if __name__ == "__main__":
+    # Before numpy, torch (EasyOCR) and TensorFlow (DeepFace) are imported below, they size their pools on import
+    configure_threads()
+
+from preprocess import read_image, crop_id_card, SOURCE_IMAGE_EXTENSIONS
+from ocr_engine import probe_card, recognize_card
+from postprocess import PARSERS
+from face_verification import largest_face_box, verify_faces, get_face_embeddings
+from id_classifier import classify_card
+from utils import hash_id, hash_bytes
+from profiling import profiled, profile_run
+from versioning import pipeline_settings, pipeline_fingerprint, stamp_pipeline_info
+from image_store import release_record_images
+
+# Logging configuration
+setup_logging()
+
+# A card "ravi.jpg" is paired with the selfie "ravi_face.jpg" in the same folder
+FACE_SUFFIX = "_face"
+
+def find_face_image(card_path):
+    stem = os.path.splitext(card_path)[0]
+    for extension in SOURCE_IMAGE_EXTENSIONS:
+        face_path = stem + FACE_SUFFIX + extension
+        if os.path.exists(face_path):
+            return face_path
+    return None
+
+def list_cards(input_dir):
+    for name in sorted(os.listdir(input_dir)):
+        stem, extension = os.path.splitext(name)
+        if extension.lower() in SOURCE_IMAGE_EXTENSIONS and not stem.endswith(FACE_SUFFIX):
+            yield os.path.join(input_dir, name)
+
+def read_bytes(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+@profiled("bulk_card")
+def process_card(card_path, face_path=None, id_type=None):
+    """Extract one card, routing it to the right parser when id_type is not given"""
+    image = read_image(card_path)
+    if image is None:
+        return None
+    cropped = crop_id_card(image)
+    if cropped is None:
+        logging.warning(f"No ID card found in {card_path}")
+        return None
+    image_roi, card_box = cropped
+
+    languages = pipeline_settings['OCR_LANGUAGES']
+    card_type, probe = (id_type, None) if id_type else classify_card(image_roi, languages=languages)
+    if probe is None:
+        probe = probe_card(image_roi, expected_type=card_type, languages=languages)
+    if probe.status == "no_text":
+        logging.warning(f"No text found on {card_path}")
+        return None
+    if probe.status == "mismatch":
+        logging.info(f"{card_path} rerouted from {card_type} to {probe.card_type}")
+        card_type = probe.card_type
+
+    # Face check before the expensive recognition pass, as in the web app
+    face_box = None
+    if face_path:
+        # The box is kept so the face crop can be stored as a reference to the card crop
+        face_box = largest_face_box(probe.image)
+        if face_box is None:
+            logging.warning(f"No face found on {card_path}")
+            return None
+        x, y, w, h = face_box
+        if not verify_faces(read_image(face_path), probe.image[y:y+h, x:x+w]):
+            logging.warning(f"Face verification failed for {card_path}")
+            return None
+
+    card_bytes = read_bytes(card_path)
+    extracted_text, tokens = recognize_card(
+        probe,
+        confidence_threshold=pipeline_settings['OCR_CONFIDENCE'],
+        languages=languages,
+        return_tokens=True,
+        cache_key=f"{hash_bytes(card_bytes)}_{pipeline_fingerprint()}"
+    )
+    text_info = PARSERS[card_type](extracted_text, tokens)
+    if card_type == "COLLEGE ID":
+        text_info["ID"] = hash_id(text_info.get("contact_no", "") + hash_id(text_info.get("name", "")))
+    else:
+        text_info["ID"] = hash_id(text_info["ID"])
+
+    source_images = {"Image Hash": card_bytes}
+    crops = {"Card Crop Hash": ("Image Hash", card_box, 0)}
+    if face_path:
+        text_info["Embedding"] = get_face_embeddings(face_path, model_name=pipeline_settings['FACE_MODEL'])
+        source_images["Face Hash"] = read_bytes(face_path)
+        crops["Face Crop Hash"] = ("Card Crop Hash", face_box, probe.rotation)
+    stamp_pipeline_info(text_info, source_images, crops)
+
+    # Empty dates cannot be stored in DATE columns
+    for key in ("DOB", "validity"):
+        if key in text_info and not text_info[key]:
+            text_info[key] = None
+    return text_info
+
+def insert_records_bulk(records):
+    """Store the processed cards with one batched insert per table, returns insert_many's status per record"""
+    # Imported here so extraction-only runs do not need a database
+    from sql_connection import ID_TYPE_TABLES, insert_many
+
+    by_table = {}
+    for position, text_info in enumerate(records):
+        by_table.setdefault(ID_TYPE_TABLES[text_info["ID Type"]], []).append(position)
+    statuses = ["failed"] * len(records)
+    for table, positions in by_table.items():
+        try:
+            table_statuses = insert_many(table, [records[position] for position in positions])
+        except Exception as e:
+            # The rows of this table stay "failed", the other tables are still inserted
+            logging.error(f"Bulk insert into {table} failed: {e}")
+            continue
+        for position, status in zip(positions, table_statuses):
+            statuses[position] = status
+        logging.info(f"Bulk insert into {table}: {table_statuses.count('inserted')} inserted, "
+                     f"{table_statuses.count('duplicate')} duplicates, {table_statuses.count('failed')} rejected")
+    return statuses
+
+def run_bulk(input_dir, output_csv, id_type=None, insert=False):
+    """Process every card in input_dir and write the extracted fields to output_csv"""
+    rows, records = [], []
+    for card_path in list_cards(input_dir):
+        set_request_id()
+        try:
+            text_info = process_card(card_path, find_face_image(card_path), id_type)
+        except Exception as e:
+            logging.error(f"Error processing {card_path}: {e}")
+            continue
+        if text_info is None:
+            continue
+        records.append(text_info)
+        row = {key: value for key, value in text_info.items() if key != "Embedding"}
+        row["File"] = os.path.basename(card_path)
+        rows.append(row)
+        logging.info(f"Bulk processed {card_path} as {text_info['ID Type']}")
+
+    # The CSV is written first so a database problem never costs the OCR output of the run
+    fieldnames = sorted({key for row in rows for key in row})
+    with open(output_csv, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+    logging.info(f"Bulk run wrote {len(rows)} records to {output_csv}")
+
+    statuses = ["not inserted"] * len(records)
+    if insert and records:
+        # The per-card runs end before the insert, it gets a run of its own
+        with profile_run("bulk_insert"):
+            statuses = insert_records_bulk(records)
+    # Only inserted rows reference their images, image_store.py gc removes the rest after GC_GRACE_S
+    for text_info, status in zip(records, statuses):
+        if status != "inserted":
+            release_record_images(text_info)
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract a folder of ID cards (selfies named <card>_face.<ext>)")
+    parser.add_argument("input_dir")
+    parser.add_argument("--output", default="bulk_results.csv")
+    parser.add_argument("--id-type", choices=tuple(PARSERS), default=None,
+                        help="skip automatic card type detection")
+    parser.add_argument("--insert", action="store_true", help="also store the records in the database")
+    args = parser.parse_args()
+
+    results = run_bulk(args.input_dir, args.output, id_type=args.id_type, insert=args.insert)
+    print(f"Processed {len(results)} cards, results in {args.output}")
@@ -0,0 +1,56 @@
+import sys
+import logging
+import threading
+import numpy as np
+from collections import OrderedDict
+
+
+def estimate_nbytes(value):
+    """Approximate memory held by a cached value, dominated by the NumPy arrays inside it"""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(estimate_nbytes(k) + estimate_nbytes(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_nbytes(item) for item in value) + 8 * len(value)
+    return sys.getsizeof(value)
+
+
+class ByteBoundedCache:
+    """Thread-safe LRU cache that evicts by the total byte size of its values instead of entry count"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def put(self, key, value):
+        size = estimate_nbytes(value)
+        if size > self.max_bytes:
+            logging.info(f"Not caching {key[0] if isinstance(key, tuple) else key}: {size} bytes exceeds the cache size")
+            return
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,273 @@
+import os
+import json
+import glob
+import logging
+import argparse
+import threading
+import numpy as np
+from logging_setup import setup_logging
+from schema import blob_to_embedding
+from utils import read_yaml
+
+# Logging configuration
+setup_logging()
+
+# Face embeddings exported from face_embeddings into flat files that worker processes open with np.memmap,
+# so every process shares the same page-cached matrix and starts without touching MySQL.
+#
+#   manifest.json           segments in order, vector size, model, the seq watermark and the live file
+#   seg-<seq>.f32           raw little-endian float32 rows, L2-normalized, C order (rows x dim)
+#   seg-<seq>.ids.npy       (source_table, record_id) of each row
+#   live-<seq>.npy          one bool per row over all segments, False for rows a later segment replaced
+#
+# build writes one base segment with every row, delta appends a segment with the rows inserted since
+# the watermark, compact rebuilds the base once there are too many deltas. Rows younger than
+# SAFETY_LAG_S are left for the next export, see export_segment.
+
+config_path = "config.yaml"
+config = read_yaml(config_path)
+snapshot_dir = config['artifacts']['EMBEDDING_SNAPSHOT_DIR']
+snapshot_settings = config['embedding_snapshot']
+face_model = config['pipeline']['FACE_MODEL']
+
+MANIFEST_FILE = "manifest.json"
+ID_DTYPE = np.dtype([("source_table", "S16"), ("record_id", "S64")])
+
+
+def manifest_path(directory):
+    return os.path.join(directory, MANIFEST_FILE)
+
+
+def load_manifest(directory=None):
+    path = manifest_path(directory or snapshot_dir)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def write_atomic(path, write):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def write_manifest(directory, manifest):
+    # Readers only ever see a complete manifest, pointing at segments that are already on disk
+    write_atomic(manifest_path(directory), lambda f: f.write(json.dumps(manifest, indent=2).encode()))
+
+
+def get_db_connection(connection=None):
+    if connection is not None:
+        return connection
+    # Imported here so processes that only search the snapshot never connect to MySQL
+    from sql_connection import mydb
+    return mydb
+
+
+def export_segment(connection, directory, model, after_seq):
+    """Write every embedding with seq > after_seq into a new segment, returns its manifest entry or None.
+
+    AUTO_INCREMENT hands out seq when a row is inserted, so a transaction that commits late can make a
+    lower seq visible after a higher one was exported. The export stops at the first row younger than
+    SAFETY_LAG_S, so the watermark never passes a row that may still be uncommitted. Only transactions
+    open for longer than the lag can still be missed, compact picks those rows up.
+    """
+    batch_size = snapshot_settings['EXPORT_BATCH_SIZE']
+    cursor = connection.cursor()
+    os.makedirs(directory, exist_ok=True)
+    vectors_tmp = os.path.join(directory, f"export.{os.getpid()}.f32.tmp")
+    ids, rows, dim, last_seq = [], 0, None, after_seq
+    try:
+        cursor.execute("SELECT NOW() - INTERVAL %s SECOND", (snapshot_settings['SAFETY_LAG_S'],))
+        cutoff = cursor.fetchall()[0][0]
+        with open(vectors_tmp, "wb") as f:
+            while True:
+                # Keyset paging on the seq index, rows are streamed to disk batch by batch
+                cursor.execute(
+                    "SELECT seq, source_table, record_id, embedding, created_at FROM face_embeddings "
+                    "WHERE model = %s AND seq > %s ORDER BY seq LIMIT %s",
+                    (model, last_seq, batch_size)
+                )
+                batch = cursor.fetchall()
+                recent = next((i for i, row in enumerate(batch) if row[4] > cutoff), None)
+                if recent is not None:
+                    batch = batch[:recent]
+                if not batch:
+                    break
+                vectors = np.stack([blob_to_embedding(row[3]) for row in batch])
+                if dim is None:
+                    dim = vectors.shape[1]
+                elif vectors.shape[1] != dim:
+                    raise ValueError(f"Embedding size changed from {dim} to {vectors.shape[1]} inside one model")
+                norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+                f.write((vectors / np.maximum(norms, 1e-12)).astype("<f4").tobytes())
+                ids.extend((row[1], row[2]) for row in batch)
+                rows += len(batch)
+                last_seq = batch[-1][0]
+                if recent is not None:
+                    break
+    finally:
+        cursor.close()
+
+    if rows == 0:
+        os.remove(vectors_tmp)
+        return None
+    name = f"seg-{last_seq:012d}"
+    os.replace(vectors_tmp, os.path.join(directory, name + ".f32"))
+    write_atomic(os.path.join(directory, name + ".ids.npy"), lambda f: np.save(f, np.array(ids, dtype=ID_DTYPE)))
+    logging.info(f"Embedding snapshot segment {name}: {rows} rows after seq {after_seq}")
+    return {"name": name, "rows": rows, "dim": dim, "max_seq": last_seq}
+
+
+def remove_unreferenced(directory, manifest):
+    # Processes that still map an old segment keep their pages until they reopen, unlinking is safe on POSIX
+    keep = {segment["name"] for segment in manifest["segments"]} | {manifest.get("live")}
+    for path in glob.glob(os.path.join(directory, "seg-*")) + glob.glob(os.path.join(directory, "live-*")):
+        if os.path.basename(path).split(".")[0] not in keep:
+            os.remove(path)
+
+
+def load_live(directory, manifest):
+    """Live mask of a snapshot, None when every row is live"""
+    if manifest.get("live"):
+        return np.load(os.path.join(directory, manifest["live"] + ".npy"), mmap_mode="r")
+    if len(manifest["segments"]) < 2:
+        return None
+    # Snapshots written before the live file existed, computed once per reload
+    all_ids = np.concatenate([np.load(os.path.join(directory, segment["name"] + ".ids.npy"))
+                              for segment in manifest["segments"]])
+    _, last_from_end = np.unique(all_ids[::-1], return_index=True)
+    live = np.zeros(len(all_ids), dtype=bool)
+    live[len(all_ids) - 1 - last_from_end] = True
+    return live
+
+
+def write_live(directory, manifest, segment):
+    """Live mask once segment is appended: rows of earlier segments re-exported in it are dead"""
+    previous = load_live(directory, manifest)
+    rows = sum(s["rows"] for s in manifest["segments"])
+    live = np.ones(rows, dtype=bool) if previous is None else np.array(previous)
+    if rows:
+        old_ids = np.concatenate([np.load(os.path.join(directory, s["name"] + ".ids.npy"))
+                                  for s in manifest["segments"]])
+        new_ids = np.load(os.path.join(directory, segment["name"] + ".ids.npy"))
+        live &= ~np.isin(old_ids, new_ids)
+    live = np.concatenate([live, np.ones(segment["rows"], dtype=bool)])
+    name = f"live-{segment['max_seq']:012d}"
+    write_atomic(os.path.join(directory, name + ".npy"), lambda f: np.save(f, live))
+    return name
+
+
+def build_snapshot(connection=None, directory=None, model=None):
+    """Full export into a single base segment, replacing any existing snapshot"""
+    directory = directory or snapshot_dir
+    model = model or face_model
+    segment = export_segment(get_db_connection(connection), directory, model, after_seq=0)
+    # Each record has one row in face_embeddings, so a single segment has no replaced rows
+    manifest = {
+        "model": model,
+        "dim": segment["dim"] if segment else None,
+        "watermark": segment["max_seq"] if segment else 0,
+        "segments": [segment] if segment else [],
+        "live": None,
+    }
+    write_manifest(directory, manifest)
+    remove_unreferenced(directory, manifest)
+    logging.info(f"Embedding snapshot built with {segment['rows'] if segment else 0} rows")
+    return manifest
+
+
+def append_delta(connection=None, directory=None):
+    """Append the rows inserted since the last export, compacting when there are too many deltas"""
+    directory = directory or snapshot_dir
+    manifest = load_manifest(directory)
+    if manifest is None:
+        return build_snapshot(connection, directory)
+    if len(manifest["segments"]) - 1 >= snapshot_settings['MAX_DELTA_SEGMENTS']:
+        return build_snapshot(connection, directory, manifest["model"])
+
+    segment = export_segment(get_db_connection(connection), directory, manifest["model"], manifest["watermark"])
+    if segment is None:
+        logging.info("Embedding snapshot is up to date")
+        return manifest
+    if manifest["dim"] is not None and segment["dim"] != manifest["dim"]:
+        raise ValueError(f"Delta has {segment['dim']}-d embeddings, snapshot has {manifest['dim']}-d")
+    # The mask is worked out here once per delta, readers only map it
+    # Earlier live files stay until the next compaction, readers of the previous manifest may still open one
+    live = write_live(directory, manifest, segment)
+    manifest["dim"] = segment["dim"]
+    manifest["watermark"] = segment["max_seq"]
+    manifest["segments"].append(segment)
+    manifest["live"] = live
+    write_manifest(directory, manifest)
+    return manifest
+
+
+class EmbeddingSnapshot:
+    """Read-only view over the memory-mapped segments, opening it reads only the manifest and the ids"""
+
+    def __init__(self, directory=None):
+        self.directory = directory or snapshot_dir
+        self.manifest = None
+        self.segments = []
+        self.reload()
+
+    def reload(self):
+        manifest = load_manifest(self.directory)
+        if manifest is None:
+            raise FileNotFoundError(f"No embedding snapshot in {self.directory}, run embedding_snapshot.py build")
+        segments = []
+        for segment in manifest["segments"]:
+            vectors = np.memmap(os.path.join(self.directory, segment["name"] + ".f32"), dtype="<f4", mode="r",
+                                shape=(segment["rows"], segment["dim"]))
+            ids = np.load(os.path.join(self.directory, segment["name"] + ".ids.npy"), mmap_mode="r")
+            segments.append((vectors, ids))
+        # A re-embedded record appears again in a later segment, only its newest row counts
+        self.live = load_live(self.directory, manifest)
+        self.manifest = manifest
+        self.segments = segments
+
+    def __len__(self):
+        return sum(len(ids) for _, ids in self.segments) if self.live is None else int(self.live.sum())
+
+    def search(self, embedding, top_k=5):
+        """Cosine similarity against every stored embedding, returns [(source_table, record_id, score)]"""
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / max(np.linalg.norm(query), 1e-12)
+        scores = np.concatenate([vectors @ query for vectors, _ in self.segments]) if self.segments else np.empty(0)
+        if self.live is not None:
+            scores[~self.live] = -np.inf
+        # Replaced rows are scored -inf and must not fill up the results
+        top_k = min(top_k, len(self))
+        if top_k == 0:
+            return []
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best])]
+        offsets = np.cumsum([0] + [len(ids) for _, ids in self.segments])
+        results = []
+        for index in best:
+            segment = np.searchsorted(offsets, index, side="right") - 1
+            row = self.segments[segment][1][index - offsets[segment]]
+            results.append((row["source_table"].decode(), row["record_id"].decode(), float(scores[index])))
+        return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export face embeddings into a memory-mapped snapshot")
+    parser.add_argument("command", choices=("build", "delta", "compact", "info"))
+    parser.add_argument("--dir", default=snapshot_dir)
+    args = parser.parse_args()
+
+    if args.command in ("build", "compact"):
+        manifest = build_snapshot(directory=args.dir)
+    elif args.command == "delta":
+        manifest = append_delta(directory=args.dir)
+    else:
+        manifest = load_manifest(args.dir)
+    if manifest is None:
+        print(f"No snapshot in {args.dir}")
+    else:
+        rows = sum(segment["rows"] for segment in manifest["segments"])
+        print(f"{len(manifest['segments'])} segments, {rows} rows, dim {manifest['dim']}, watermark {manifest['watermark']}")
@@ -1,13 +1,13 @@
 from deepface import DeepFace
 import cv2
+import numpy as np
 import os
 import logging
+from logging_setup import setup_logging
 from utils import file_exists, read_yaml
 
-logging_str = "[%(asctime)s: %(levelname)s: %(module)s]: %(message)s"
-log_dir = "logs"
-os.makedirs(log_dir, exist_ok=True)
-logging.basicConfig(filename=os.path.join(log_dir,"ekyc_logs.log"), level=logging.INFO, format=logging_str, filemode="a")
+# Logging configuration
+setup_logging()
 
 
 config_path = "config.yaml"
@@ -17,19 +17,29 @@ artifacts = config['artifacts']
 cascade_path = artifacts['HAARCASCADE_PATH']
 output_path = artifacts['INTERMIDEIATE_DIR']
 
-def detect_and_extract_face(img):
-    logging.info("Extracting face...")
-    # Read the image
-    # img = cv2.imread(image_path)
+# DeepFace.verify default, used by deepface_face_comparison
+VERIFY_MODEL = "VGG-Face"
+
+def load_face_cascade(path=None):
+    # Config paths are written with Windows separators
+    path = (path or cascade_path).replace("\\", os.sep)
+    return cv2.CascadeClassifier(path)
+
+face_cascade = None
+
+def largest_face_box(img, classifier=None):
+    """(x, y, w, h) of the largest detected face enlarged by 50%, or None. Pass a classifier per thread for concurrent use"""
+    global face_cascade
+    if classifier is None:
+        if face_cascade is None:
+            face_cascade = load_face_cascade()
+        classifier = face_cascade
 
     # Convert the image to grayscale (Haar cascade works better with grayscale images)
     gray_img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
 
-    # Load the Haar cascade classifier
-    face_cascade = cv2.CascadeClassifier(cascade_path)
-
     # Detect faces in the image
-    faces = face_cascade.detectMultiScale(gray_img, scaleFactor=1.1, minNeighbors=5)
+    faces = classifier.detectMultiScale(gray_img, scaleFactor=1.1, minNeighbors=5)
 
     # Find the face with the largest area
     max_area = 0
@@ -40,26 +50,38 @@ def detect_and_extract_face(img):
             max_area = area
             largest_face = (x, y, w, h)
 
+    if largest_face is None:
+        return None
+
+    (x, y, w, h) = largest_face
+    # extracted_face = img[y:y+h, x:x+w]
+    
+    # Increase dimensions by 50%
+    new_w = int(w * 1.50)
+    new_h = int(h * 1.50)
+    
+    # Calculate new (x, y) coordinates to keep the center of the face the same
+    new_x = max(0, x - int((new_w - w) / 2))
+    new_y = max(0, y - int((new_h - h) / 2))
+
+    # Clip to the image so the box can be stored and cut out again later
+    img_h, img_w = img.shape[:2]
+    return new_x, new_y, min(new_w, img_w - new_x), min(new_h, img_h - new_y)
+
+def crop_largest_face(img, classifier=None):
+    """Largest detected face enlarged by 50%, or None. Pass a classifier per thread for concurrent use"""
+    box = largest_face_box(img, classifier)
+    if box is None:
+        return None
+    x, y, w, h = box
+    return img[y:y+h, x:x+w]
+
+def detect_and_extract_face(img):
+    logging.info("Extracting face...")
+    extracted_face = crop_largest_face(img)
+
     # Extract the largest face
-    if largest_face is not None:
-        (x, y, w, h) = largest_face
-        # extracted_face = img[y:y+h, x:x+w]
-        
-        # Increase dimensions by 15%
-        new_w = int(w * 1.50)
-        new_h = int(h * 1.50)
-        
-        # Calculate new (x, y) coordinates to keep the center of the face the same
-        new_x = max(0, x - int((new_w - w) / 2))
-        new_y = max(0, y - int((new_h - h) / 2))
-
-        # Extract the enlarged face
-        extracted_face = img[new_y:new_y+new_h, new_x:new_x+new_w]
-
-        # Convert the extracted face to RGB
-        # extracted_face_rgb = cv2.cvtColor(extracted_face, cv2.COLOR_BGR2RGB)
-
-        
+    if extracted_face is not None:
         current_wd = os.getcwd()
         filename = os.path.join(current_wd, output_path, "extracted_face.jpg")
 
@@ -81,9 +103,9 @@ def detect_and_extract_face(img):
 
 # ---------- Debugging ----------------
 
-file_path="data/01_raw_data/pan.jpeg"
-img=cv2.imread(file_path)
-detect_and_extract_face(img)
+# file_path="data/01_raw_data/pan.jpeg"
+# img=cv2.imread(file_path)
+# detect_and_extract_face(img)
 
 
 def deepface_face_comparison(image1_path, image2_path):
@@ -113,7 +135,7 @@ def deepface_face_comparison(image1_path, image2_path):
 
 # print(deepface_face_comparison(file_path1,file_path2))
 
-def get_face_embeddings(image_path):
+def get_face_embeddings(image_path, model_name="Facenet"):
     logging.info(f"Retrieving face embeddings from image: {image_path}")
 
     # Check if image exists
@@ -121,8 +143,8 @@ def get_face_embeddings(image_path):
         logging.warning(f"Image path does not exist: {image_path}")
         return None
     
-    # Retrieve face embeddings using DeepFace library (Facenet model)
-    embedding_objs = DeepFace.represent(img_path=image_path, model_name="Facenet")
+    # Retrieve face embeddings using DeepFace library (Facenet model by default)
+    embedding_objs = DeepFace.represent(img_path=image_path, model_name=model_name)
 
     # Extract the embedding vector
     embedding = embedding_objs[0]["embedding"]
@@ -136,4 +158,65 @@ def get_face_embeddings(image_path):
     
 
 # file_path1="data/02_intermediate_data/face.jpg"
-# print(get_face_embeddings(file_path1))
\ No newline at end of file
+# print(get_face_embeddings(file_path1))
+
+
+# ---------- In-memory variants ----------
+# Same checks as above on BGR arrays, no intermediate files, so they are safe to call from several threads
+
+def verify_faces(img1, img2, model_name=VERIFY_MODEL):
+    try:
+        verification = DeepFace.verify(img1_path=img1, img2_path=img2, model_name=model_name)
+    except ValueError as e:
+        # Raised by DeepFace when no face is found in one of the images
+        logging.warning(f"Face verification could not run: {e}")
+        return False
+    return bool(verification.get('verified'))
+
+def embeddings_match(embedding1, embedding2, model_name=VERIFY_MODEL):
+    """The decision of verify_faces on precomputed embeddings: cosine distance within the model's threshold"""
+    if embedding1 is None or embedding2 is None:
+        return False
+    from deepface.modules.verification import find_cosine_distance, find_threshold
+    return bool(find_cosine_distance(np.array(embedding1), np.array(embedding2)) <= find_threshold(model_name, "cosine"))
+
+def embed_face(img, model_name="Facenet"):
+    try:
+        embedding_objs = DeepFace.represent(img_path=img, model_name=model_name)
+    except ValueError as e:
+        logging.warning(f"Failed to retrieve face embeddings: {e}")
+        return None
+    embedding = embedding_objs[0]["embedding"]
+    return embedding if len(embedding) > 0 else None
+
+def embed_faces(images, model_name="Facenet"):
+    """Embeddings for several images (paths or arrays) with one forward pass, None where no face is found"""
+    try:
+        # Internals of DeepFace.represent, split so that detection runs per image and the model once
+        from deepface.modules import detection, preprocessing
+        model = DeepFace.build_model(model_name)
+        target_size = model.input_shape
+        network = model.model
+    except (ImportError, AttributeError) as e:
+        logging.warning(f"Batched embeddings unavailable ({e}), embedding one image at a time")
+        return [embed_face(img, model_name) for img in images]
+
+    faces = []
+    for img in images:
+        try:
+            face_objs = detection.extract_faces(img_path=img, detector_backend="opencv", grayscale=False,
+                                                enforce_detection=True, align=True)
+        except ValueError as e:
+            logging.warning(f"Failed to retrieve face embeddings: {e}")
+            faces.append(None)
+            continue
+        # Same steps as represent: rgb to bgr, resize to the model input, default normalization
+        face = face_objs[0]["face"][:, :, ::-1]
+        face = preprocessing.resize_image(img=face, target_size=(target_size[1], target_size[0]))
+        faces.append(preprocessing.normalize_input(img=face, normalization="base"))
+
+    detected = [face for face in faces if face is not None]
+    if not detected:
+        return [None] * len(faces)
+    embeddings = iter(network(np.concatenate(detected), training=False).numpy())
+    return [next(embeddings).tolist() if face is not None else None for face in faces]
@@ -0,0 +1,120 @@
+import cv2
+import numpy as np
+import logging
+from functools import lru_cache
+from utils import read_yaml
+from preprocess import crop_id_card
+from ocr_engine import probe_card
+
+config_path = "config.yaml"
+config = read_yaml(config_path)
+
+pipeline_settings = config['pipeline']
+
+CARD_TYPES = ("PAN", "AADHAR", "COLLEGE ID")
+
+# Labelled sample cards the nearest-centroid classifier is fitted on
+REFERENCE_CARDS = {
+    "data/01_raw_data/pan.jpeg": "PAN",
+    "data/01_raw_data/pan_1.jpg": "PAN",
+    "data/01_raw_data/pan_2.jpg": "PAN",
+    "data/01_raw_data/aadhar.png": "AADHAR",
+    "data/01_raw_data/adhar_2.jpg": "AADHAR",
+    "data/01_raw_data/adhar_3.png": "AADHAR",
+    "data/01_raw_data/id_1.png": "COLLEGE ID",
+    "data/01_raw_data/id_2.png": "COLLEGE ID",
+}
+
+FEATURE_WIDTH = 160
+
+def card_features(image):
+    """Colour histogram and layout features of a card crop, a few milliseconds on CPU"""
+    height, width = image.shape[:2]
+    small = cv2.resize(image, (FEATURE_WIDTH, max(1, int(FEATURE_WIDTH * height / width))),
+                       interpolation=cv2.INTER_AREA)
+    hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+
+    # Whole card and header band histograms (hue x saturation), the header carries the issuer colours
+    band = hsv[: max(1, hsv.shape[0] // 5)]
+    features = []
+    for region in (hsv, band):
+        hist = cv2.calcHist([region], [0, 1], None, [8, 3], [0, 180, 0, 256]).flatten()
+        features.append(hist / max(hist.sum(), 1))
+
+    # Layout: aspect ratio and how much of the card is covered by edges (text density)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    edges = cv2.Canny(gray, 100, 200)
+    features.append(np.array([width / height, edges.mean() / 255], dtype=np.float32))
+    return np.concatenate(features).astype(np.float32)
+
+
+def fit_centroids(labelled_images):
+    """Nearest-centroid model from (card crop, card_type) pairs: per type means of standardized features.
+
+    Histogram bins are fractions while the aspect ratio is ~1.5, so without scaling the aspect ratio
+    alone would decide most distances.
+    """
+    vectors = np.array([card_features(image) for image, _ in labelled_images])
+    mean = vectors.mean(axis=0)
+    std = vectors.std(axis=0)
+    # Bins that never vary across the references carry no information, leave them unscaled
+    std[std < 1e-6] = 1.0
+    grouped = {}
+    for vector, (_, card_type) in zip((vectors - mean) / std, labelled_images):
+        grouped.setdefault(card_type, []).append(vector)
+    centroids = {card_type: np.mean(group, axis=0) for card_type, group in grouped.items()}
+    return {"mean": mean, "std": std, "centroids": centroids}
+
+
+def reference_crops():
+    """path -> (card crop, card_type) of every reference card, cropped as uploads are before classify_card"""
+    labelled = {}
+    for path, card_type in REFERENCE_CARDS.items():
+        image = cv2.imread(path)
+        if image is None:
+            logging.warning(f"Reference card missing: {path}")
+            continue
+        cropped = crop_id_card(image)
+        labelled[path] = (cropped[0] if cropped is not None else image, card_type)
+    return labelled
+
+
+@lru_cache(maxsize=1)
+def reference_centroids():
+    labelled = list(reference_crops().values())
+    model = fit_centroids(labelled)
+    logging.info(f"ID classifier fitted on {len(labelled)} reference cards")
+    return model
+
+
+def classify_by_features(image, model=None):
+    """Nearest centroid, returns the card type and a 0..1 margin over the runner-up"""
+    model = model or reference_centroids()
+    features = (card_features(image) - model["mean"]) / model["std"]
+    distances = sorted((float(np.linalg.norm(features - centroid)), card_type)
+                       for card_type, centroid in model["centroids"].items())
+    if len(distances) < 2:
+        return (distances[0][1] if distances else None), 0.0
+    (best_distance, best_type), (runner_up_distance, _) = distances[0], distances[1]
+    margin = 1 - best_distance / runner_up_distance if runner_up_distance > 0 else 0.0
+    return best_type, margin
+
+
+def classify_card(image, languages=['en']):
+    """Card type of a crop: colour/layout classifier, falling back to a keyword probe when unsure.
+
+    Returns (card_type, probe). probe is the CardProbe of the fallback, or None when colour/layout
+    decided. Reuse it instead of probing again: without an expected type a probe never reports a
+    mismatch, so it is the same probe the caller would run with the returned type.
+    """
+    card_type, margin = classify_by_features(image)
+    if margin >= pipeline_settings['CLASSIFIER_MIN_MARGIN']:
+        logging.info(f"ID card classified as {card_type} from colour/layout (margin {margin:.2f})")
+        return card_type, None
+
+    probe = probe_card(image, languages=languages)
+    if probe.card_type:
+        logging.info(f"ID card classified as {probe.card_type} from keywords {probe.keyword_hits}")
+        return probe.card_type, probe
+    logging.info(f"ID card keywords inconclusive, keeping colour/layout guess {card_type}")
+    return card_type, probe
@@ -0,0 +1,247 @@
+import re
+import logging
+import argparse
+import numpy as np
+from collections import defaultdict
+from datetime import date, datetime
+from logging_setup import setup_logging
+from utils import read_yaml
+
+# Logging configuration
+setup_logging()
+
+# Same-person matching across users, aadhar and college_ids, whose ids are hashes of different card
+# numbers. Records are blocked on (phonetic key of a name token, year of birth) and edit distance is
+# only computed, vectorized, against the handful of names in the query's blocks.
+
+config_path = "config.yaml"
+match_settings = read_yaml(config_path)['identity_matching']
+
+# Titles printed on some cards, never part of the name that other cards carry
+HONORIFICS = {"MR", "MRS", "MS", "MISS", "DR", "SHRI", "SMT", "KUMARI", "KUM", "SRI"}
+
+_NON_LETTERS = re.compile(r"[^A-Z ]+")
+
+
+def normalize_name(name):
+    """Upper case letters and single spaces, without honorifics"""
+    if not name:
+        return ""
+    tokens = _NON_LETTERS.sub(" ", str(name).upper()).split()
+    return " ".join(token for token in tokens if token not in HONORIFICS)
+
+
+_SOUNDEX_CODES = {letter: str(code) for code, letters in enumerate(
+    ("AEIOUYHW", "BFPV", "CGJKQSXZ", "DT", "L", "MN", "R")) for letter in letters}
+
+
+def soundex(token):
+    """Four character American Soundex, e.g. RAHUL -> R400, RAAHUL -> R400"""
+    if not token:
+        return ""
+    codes = [_SOUNDEX_CODES.get(letter, "0") for letter in token]
+    key, previous = token[0], codes[0]
+    for letter, code in zip(token[1:], codes[1:]):
+        if code != "0" and code != previous:
+            key += code
+        # H and W do not separate letters with the same code, vowels do
+        if letter not in "HW":
+            previous = code
+    return (key + "000")[:4]
+
+
+def phonetic_keys(normalized_name):
+    # First and last token, so a dropped or misread middle name still shares a block
+    tokens = normalized_name.split()
+    if not tokens:
+        return set()
+    return {soundex(tokens[0]), soundex(tokens[-1])}
+
+
+def dob_text(dob):
+    if dob is None or dob == "":
+        return None
+    if isinstance(dob, (date, datetime)):
+        return dob.strftime("%Y-%m-%d")
+    return str(dob)[:10]
+
+
+def birth_year(dob):
+    if dob is None or dob == "":
+        return None
+    if isinstance(dob, (date, datetime)):
+        return dob.year
+    try:
+        return int(str(dob)[:4])
+    except ValueError:
+        return None
+
+
+def levenshtein_many(query, names, lengths):
+    """Edit distance from query to every row of names (uint8, zero padded), one numpy step per query letter"""
+    count, width = names.shape
+    columns = np.arange(width + 1, dtype=np.int32)
+    previous = np.broadcast_to(columns, (count, width + 1))
+    for i, letter in enumerate(query.encode("ascii", "ignore"), 1):
+        cost = (names != letter).astype(np.int32)
+        substitute_or_delete = np.minimum(previous[:, :-1] + cost, previous[:, 1:] + 1)
+        base = np.concatenate([np.full((count, 1), i, dtype=np.int32), substitute_or_delete], axis=1)
+        # Insertions chain along the row: current[j] = min over t <= j of base[t] + (j - t)
+        previous = np.minimum.accumulate(base - columns, axis=1) + columns
+    return previous[np.arange(count), lengths]
+
+
+class IdentityIndex:
+    """Blocking index over normalized names and birth years of every stored record"""
+
+    def __init__(self, max_name_length=None, capacity=1024):
+        self.max_name_length = max_name_length or match_settings['MAX_NAME_LENGTH']
+        self.names = np.zeros((capacity, self.max_name_length), dtype=np.uint8)
+        self.lengths = np.zeros(capacity, dtype=np.int32)
+        self.dobs = []
+        self.records = []
+        self.blocks = defaultdict(list)
+        self.years_by_key = defaultdict(set)
+        self._block_arrays = {}
+
+    def __len__(self):
+        return len(self.records)
+
+    def _grow(self):
+        capacity = len(self.lengths) * 2
+        self.names = np.resize(self.names, (capacity, self.max_name_length))
+        self.lengths = np.resize(self.lengths, capacity)
+
+    def add(self, source_table, record_id, name, dob=None):
+        normalized = normalize_name(name)
+        if not normalized:
+            return
+        row = len(self.records)
+        if row == len(self.lengths):
+            self._grow()
+        encoded = normalized.encode("ascii", "ignore")[:self.max_name_length]
+        self.names[row] = 0
+        self.names[row, :len(encoded)] = np.frombuffer(encoded, dtype=np.uint8)
+        self.lengths[row] = len(encoded)
+        self.records.append((source_table, str(record_id), normalized))
+        self.dobs.append(dob_text(dob))
+
+        year = birth_year(dob)
+        for key in phonetic_keys(normalized):
+            self.blocks[(key, year)].append(row)
+            self.years_by_key[key].add(year)
+            self._block_arrays.pop((key, year), None)
+
+    def block(self, block_key):
+        # Row lists are turned into arrays once and reused until the block changes
+        rows = self._block_arrays.get(block_key)
+        if rows is None:
+            rows = self._block_arrays[block_key] = np.array(self.blocks.get(block_key, ()), dtype=np.int64)
+        return rows
+
+    def candidates(self, normalized, year, year_tolerance):
+        blocks = []
+        for key in phonetic_keys(normalized):
+            if year is None:
+                years = self.years_by_key.get(key, ())
+            else:
+                # Records without a date of birth (college IDs) can match any year
+                years = [y for y in range(year - year_tolerance, year + year_tolerance + 1)] + [None]
+            blocks.extend(self.block((key, y)) for y in years if (key, y) in self.blocks)
+        if not blocks:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(blocks))
+
+    def match(self, name, dob=None, top_k=5, min_similarity=None, year_tolerance=None, exclude=None):
+        """Likely same-person records, best first: [{source_table, record_id, name, dob, similarity, dob_match}]"""
+        min_similarity = match_settings['MIN_SIMILARITY'] if min_similarity is None else min_similarity
+        year_tolerance = match_settings['YEAR_TOLERANCE'] if year_tolerance is None else year_tolerance
+        normalized = normalize_name(name)[:self.max_name_length]
+        if not normalized:
+            return []
+
+        rows = self.candidates(normalized, birth_year(dob), year_tolerance)
+        if len(rows) == 0:
+            return []
+        lengths = self.lengths[rows]
+        longest = np.maximum(lengths, len(normalized))
+        # The edit distance is at least the length difference, drop names that cannot reach min_similarity
+        reachable = np.abs(lengths - len(normalized)) <= (1 - min_similarity) * longest
+        rows, lengths, longest = rows[reachable], lengths[reachable], longest[reachable]
+        if len(rows) == 0:
+            return []
+        # Columns past the longest candidate are padding
+        distances = levenshtein_many(normalized, self.names[rows, :int(lengths.max())], lengths)
+        similarity = 1.0 - distances / longest
+
+        order = np.argsort(-similarity, kind="stable")
+        dob = dob_text(dob)
+        matches = []
+        for index in order:
+            if similarity[index] < min_similarity or len(matches) == top_k:
+                break
+            row = rows[index]
+            source_table, record_id, stored_name = self.records[row]
+            if exclude and (source_table, record_id) == exclude:
+                continue
+            matches.append({
+                "source_table": source_table,
+                "record_id": record_id,
+                "name": stored_name,
+                "dob": self.dobs[row],
+                "similarity": round(float(similarity[index]), 4),
+                "dob_match": dob is not None and self.dobs[row] == dob,
+            })
+        # An exact date of birth outweighs small name differences
+        matches.sort(key=lambda match: (match["dob_match"], match["similarity"]), reverse=True)
+        return matches
+
+
+# ---------- Loading from the database ----------
+
+# Name and date of birth columns of each table, college IDs carry no date of birth
+IDENTITY_COLUMNS = {
+    "users": "id, name, dob",
+    "aadhar": "id, name, dob",
+    "college_ids": "id, name, NULL",
+}
+
+FETCH_BATCH_SIZE = 10000
+
+
+def load_identity_index(connection=None):
+    """Build the index from users, aadhar and college_ids"""
+    if connection is None:
+        # Imported here so the matching code itself does not need a database
+        from sql_connection import mydb as connection
+    index = IdentityIndex()
+    cursor = connection.cursor()
+    try:
+        for table, columns in IDENTITY_COLUMNS.items():
+            cursor.execute(f"SELECT {columns} FROM {table}")
+            while True:
+                rows = cursor.fetchmany(FETCH_BATCH_SIZE)
+                if not rows:
+                    break
+                for record_id, name, dob in rows:
+                    index.add(table, record_id, name, dob)
+    finally:
+        cursor.close()
+    logging.info(f"Identity index built over {len(index)} records in {len(index.blocks)} blocks")
+    return index
+
+
+def find_same_person(index, text_info, top_k=5):
+    """Matches for a freshly extracted card (PAN/Aadhaar keys "Name"/"DOB", college IDs "name")"""
+    return index.match(text_info.get("Name") or text_info.get("name"), text_info.get("DOB"), top_k=top_k)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Look up stored records that are likely the same person")
+    parser.add_argument("name")
+    parser.add_argument("--dob", default=None, help="YYYY-MM-DD")
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    for match in load_identity_index().match(args.name, args.dob, top_k=args.top_k):
+        print(match)
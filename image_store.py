@@ -0,0 +1,374 @@
+import os
+import cv2
+import json
+import glob
+import time
+import hashlib
+import logging
+import argparse
+import threading
+import numpy as np
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from logging_setup import setup_logging
+from utils import read_yaml, hash_bytes
+from profiling import worker_task
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: the in-process lock still serializes threads, run gc from a single process there
+    fcntl = None
+
+# Logging configuration
+setup_logging()
+
+# Content-addressed store for uploads and the crops taken from them.
+#
+#   objects/ab/cd/<hash>.webp   original upload, decoded and re-encoded once (FORMAT, QUALITY)
+#   objects/ab/cd/<hash>.json   sidecar: kind, reference count, size; crops also parent, bbox, rotation
+#
+# Originals are named by the SHA-256 of the uploaded bytes, the same value stored in image_hash and
+# face_hash, so a re-upload of the same file only adds a reference. Crops have no pixels of their own,
+# they name their parent and a box and are cut out on load. An object whose count drops to zero is
+# deleted by collect_garbage once it is older than GC_GRACE_S.
+
+config_path = "config.yaml"
+store_settings = read_yaml(config_path)['image_store']
+store_root = store_settings['ROOT']
+
+# text_info keys holding image store hashes, in the order they are created
+IMAGE_KEYS = ("Image Hash", "Face Hash", "Card Crop Hash", "Face Crop Hash")
+
+_lock = threading.Lock()
+
+
+@contextmanager
+def store_lock():
+    """Serializes sidecar updates across threads, and across processes where flock exists"""
+    with _lock:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(store_root, exist_ok=True)
+        with open(os.path.join(store_root, ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def object_dir(image_hash):
+    # Two levels of 256 directories keep every directory small at millions of objects
+    return os.path.join(store_root, "objects", image_hash[:2], image_hash[2:4])
+
+
+def payload_path(image_hash):
+    return os.path.join(object_dir(image_hash), image_hash + store_settings['FORMAT'])
+
+
+def sidecar_path(image_hash):
+    return os.path.join(object_dir(image_hash), image_hash + ".json")
+
+
+def write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def read_meta(image_hash):
+    path = sidecar_path(image_hash)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def write_meta(image_hash, meta):
+    write_atomic(sidecar_path(image_hash), json.dumps(meta).encode())
+
+
+def image_exists(image_hash):
+    return bool(image_hash) and os.path.exists(sidecar_path(image_hash))
+
+
+def encode_image(image):
+    if store_settings['FORMAT'] == ".webp":
+        params = [cv2.IMWRITE_WEBP_QUALITY, store_settings['QUALITY']]
+    else:
+        params = [cv2.IMWRITE_JPEG_QUALITY, store_settings['QUALITY']]
+    ok, encoded = cv2.imencode(store_settings['FORMAT'], image, params)
+    if not ok:
+        raise ValueError(f"Could not encode image as {store_settings['FORMAT']}")
+    return encoded.tobytes()
+
+
+def add_ref(image_hash, count=1):
+    with store_lock():
+        meta = read_meta(image_hash)
+        if meta is None:
+            raise KeyError(f"No stored image {image_hash}")
+        meta["refs"] += count
+        meta["updated"] = time.time()
+        write_meta(image_hash, meta)
+        return meta["refs"]
+
+
+def release(image_hash):
+    """Drop one reference, the object is deleted by the next collect_garbage once unreferenced"""
+    if not image_exists(image_hash):
+        return 0
+    return add_ref(image_hash, -1)
+
+
+def put_image(image_bytes, image_hash=None):
+    """Store an upload (or add a reference to the stored copy), returns its hash"""
+    image_hash = image_hash or hash_bytes(image_bytes)
+    with store_lock():
+        meta = read_meta(image_hash)
+        if meta is not None:
+            meta["refs"] += 1
+            meta["updated"] = time.time()
+            write_meta(image_hash, meta)
+            return image_hash
+
+    # Decoding and re-encoding happen outside the lock, a concurrent put of the same bytes writes the same payload
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError(f"Upload {image_hash} is not a readable image")
+    encoded = encode_image(image)
+    write_atomic(payload_path(image_hash), encoded)
+    with store_lock():
+        meta = read_meta(image_hash)
+        if meta is not None:
+            meta["refs"] += 1
+        else:
+            meta = {"kind": "original", "refs": 1, "width": image.shape[1], "height": image.shape[0],
+                    "upload_bytes": len(image_bytes), "stored_bytes": len(encoded)}
+        meta["updated"] = time.time()
+        write_meta(image_hash, meta)
+    logging.info(f"Image {image_hash[:12]} stored, {len(image_bytes)} -> {len(encoded)} bytes")
+    return image_hash
+
+
+# Clockwise rotations, matching CardProbe.rotation
+ROTATIONS = {90: cv2.ROTATE_90_CLOCKWISE, 180: cv2.ROTATE_180, 270: cv2.ROTATE_90_COUNTERCLOCKWISE}
+
+
+def crop_hash(parent_hash, bbox, rotation=0):
+    x, y, w, h = (int(v) for v in bbox)
+    return hashlib.sha256(f"{parent_hash}:{rotation}:{x},{y},{w},{h}".encode()).hexdigest()
+
+
+def put_crop(parent_hash, bbox, rotation=0):
+    """Record a crop of a stored image as (parent, box), returns its hash. rotation (degrees clockwise) is applied first"""
+    image_hash = crop_hash(parent_hash, bbox, rotation)
+    with store_lock():
+        meta = read_meta(image_hash)
+        if meta is not None:
+            meta["refs"] += 1
+        else:
+            parent = read_meta(parent_hash)
+            if parent is None:
+                raise KeyError(f"No stored image {parent_hash}")
+            # The crop keeps its parent alive
+            parent["refs"] += 1
+            parent["updated"] = time.time()
+            write_meta(parent_hash, parent)
+            meta = {"kind": "crop", "refs": 1, "parent": parent_hash,
+                    "bbox": [int(v) for v in bbox], "rotation": rotation}
+        meta["updated"] = time.time()
+        write_meta(image_hash, meta)
+    return image_hash
+
+
+def load_image(image_hash):
+    """BGR array of a stored original or crop, or None"""
+    meta = read_meta(image_hash) if image_hash else None
+    if meta is None:
+        logging.warning(f"No stored image for hash {image_hash}")
+        return None
+    if meta["kind"] == "original":
+        return cv2.imread(payload_path(image_hash), cv2.IMREAD_COLOR)
+    image = load_image(meta["parent"])
+    if image is None:
+        return None
+    if meta["rotation"]:
+        image = cv2.rotate(image, ROTATIONS[meta["rotation"]])
+    x, y, w, h = meta["bbox"]
+    return image[y:y+h, x:x+w]
+
+
+def load_image_in_worker(image_hash):
+    # Sampled by profiled runs while it decodes, see profiling.worker_task
+    with worker_task():
+        return load_image(image_hash)
+
+
+def stream_images(image_hashes, workers=None):
+    """Yield (hash, image) in order, decoding ahead on a thread pool (cv2 releases the GIL while decoding)"""
+    workers = workers or store_settings['STREAM_WORKERS']
+    # executor.map would submit every hash up front and hold all decoded images until they are consumed,
+    # at most `workers` loads are in flight or waiting here
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-stream") as executor:
+        for image_hash in image_hashes:
+            if len(pending) >= workers:
+                done_hash, future = pending.popleft()
+                yield done_hash, future.result()
+            pending.append((image_hash, executor.submit(load_image_in_worker, image_hash)))
+        while pending:
+            done_hash, future = pending.popleft()
+            yield done_hash, future.result()
+
+
+def store_record_images(text_info, source_images, crops=None):
+    """Store the uploads and crops of a record and put their hashes into text_info.
+
+    source_images maps a text_info key to the upload bytes, crops maps a key to
+    (parent key, bbox, rotation) where the parent key was stored before it.
+    """
+    for key, image_bytes in source_images.items():
+        text_info[key] = put_image(image_bytes)
+    for key, (parent_key, bbox, rotation) in (crops or {}).items():
+        text_info[key] = put_crop(text_info[parent_key], bbox, rotation)
+
+
+def release_record_images(text_info):
+    # Crops first, so their parents are released last
+    for key in reversed(IMAGE_KEYS):
+        if text_info.get(key):
+            release(text_info[key])
+
+
+# ---------- Reference counts and garbage collection ----------
+
+def iter_sidecars():
+    for path in glob.glob(os.path.join(store_root, "objects", "*", "*", "*.json")):
+        yield os.path.basename(path)[:-len(".json")]
+
+
+def recount_references(record_counts):
+    """Reset every count from the database: record_counts maps hash -> rows referencing it"""
+    with store_lock():
+        metas = {image_hash: read_meta(image_hash) for image_hash in iter_sidecars()}
+        refs = {image_hash: record_counts.get(image_hash, 0) for image_hash in metas}
+        # A crop holds its parent until collect_garbage deletes it, which is when the parent is released
+        for meta in metas.values():
+            if meta["kind"] == "crop" and meta["parent"] in refs:
+                refs[meta["parent"]] += 1
+        for image_hash, meta in metas.items():
+            if meta["refs"] != refs[image_hash]:
+                meta["refs"] = refs[image_hash]
+                write_meta(image_hash, meta)
+    logging.info(f"Image store references recounted for {len(metas)} objects")
+    return refs
+
+
+def collect_garbage(grace_s=None):
+    """Delete unreferenced objects older than the grace period, returns (objects, bytes) freed"""
+    grace_s = store_settings['GC_GRACE_S'] if grace_s is None else grace_s
+    removed = freed = 0
+    # First a sweep of the whole store, then only the parents released by deleted crops
+    candidates, released = None, set()
+    while True:
+        parents = []
+        with store_lock():
+            now = time.time()
+            for image_hash in list(iter_sidecars() if candidates is None else candidates):
+                meta = read_meta(image_hash)
+                if meta is None or meta["refs"] > 0:
+                    continue
+                # The released parents were only kept by a crop old enough to go, everything else
+                # (e.g. a fresh upload whose row is not committed yet) keeps its grace period
+                if image_hash not in released and now - meta.get("updated", 0) < grace_s:
+                    continue
+                if meta["kind"] == "original":
+                    # The payload may already be gone, e.g. after an interrupted gc
+                    if os.path.exists(payload_path(image_hash)):
+                        freed += os.path.getsize(payload_path(image_hash))
+                        os.remove(payload_path(image_hash))
+                else:
+                    parents.append(meta["parent"])
+                os.remove(sidecar_path(image_hash))
+                removed += 1
+        if not parents:
+            break
+        # A deleted crop releases its parent, which may now be collectable too
+        for parent_hash in parents:
+            release(parent_hash)
+        candidates = released = set(parents)
+    logging.info(f"Image store gc removed {removed} objects, {freed} bytes")
+    return removed, freed
+
+
+def database_reference_counts(connection=None):
+    """How many rows of users, aadhar and college_ids reference each hash"""
+    if connection is None:
+        # Imported here so the store itself does not need a database
+        from sql_connection import mydb as connection
+    from schema import KYC_TABLES
+    counts = {}
+    cursor = connection.cursor()
+    try:
+        for table in KYC_TABLES:
+            cursor.execute(f"SELECT image_hash, face_hash, card_crop_hash, face_crop_hash FROM {table}")
+            for row in cursor.fetchall():
+                for image_hash in row:
+                    if image_hash:
+                        counts[image_hash] = counts.get(image_hash, 0) + 1
+    finally:
+        cursor.close()
+    return counts
+
+
+def import_directory(directory):
+    """Copy uploads kept as <sha256>.<ext> (data/03_source_images) into the store"""
+    imported = 0
+    for path in sorted(glob.glob(os.path.join(directory, "*"))):
+        image_hash = os.path.splitext(os.path.basename(path))[0]
+        if len(image_hash) != 64 or image_exists(image_hash):
+            continue
+        with open(path, "rb") as f:
+            put_image(f.read(), image_hash)
+        imported += 1
+    logging.info(f"Imported {imported} images from {directory}")
+    return imported
+
+
+def store_stats():
+    stats = {"original": 0, "crop": 0, "unreferenced": 0, "upload_bytes": 0, "stored_bytes": 0}
+    for image_hash in iter_sidecars():
+        meta = read_meta(image_hash)
+        stats[meta["kind"]] += 1
+        stats["unreferenced"] += meta["refs"] <= 0
+        stats["upload_bytes"] += meta.get("upload_bytes", 0)
+        stats["stored_bytes"] += meta.get("stored_bytes", 0)
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Content-addressed image store maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("stats")
+    gc_parser = subparsers.add_parser("gc", help="delete unreferenced images")
+    gc_parser.add_argument("--from-db", action="store_true", help="recount references from the database first")
+    gc_parser.add_argument("--grace", type=float, default=None, help="seconds an unreferenced object is kept")
+    import_parser = subparsers.add_parser("import", help="import a directory of <sha256>.<ext> uploads")
+    import_parser.add_argument("directory")
+    args = parser.parse_args()
+
+    if args.command == "gc":
+        if args.from_db:
+            recount_references(database_reference_counts())
+        removed, freed = collect_garbage(args.grace)
+        print(f"Removed {removed} objects, freed {freed / 1e6:.1f} MB")
+    elif args.command == "import":
+        print(f"Imported {import_directory(args.directory)} images, run 'gc --from-db' to set their reference counts")
+    else:
+        print(store_stats())
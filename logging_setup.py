@@ -0,0 +1,107 @@
+import os
+import re
+import copy
+import json
+import random
+import queue
+import atexit
+import logging
+import contextvars
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from utils import read_yaml
+
+# One logging setup for every module: callers only enqueue records, a single listener thread
+# formats them as JSON lines and writes them to a rotating file.
+
+config_path = "config.yaml"
+log_settings = read_yaml(config_path)['logging']
+
+request_id_var = contextvars.ContextVar("request_id", default="-")
+_listener = None
+
+
+def new_request_id():
+    # Not a secret, so avoid uuid4/urandom which is a syscall per request
+    return "%012x" % random.getrandbits(48)
+
+
+def set_request_id(request_id=None):
+    """Tag every log record of the current thread/task with a request id, returns the id"""
+    request_id = request_id or new_request_id()
+    request_id_var.set(request_id)
+    return request_id
+
+
+_WORD = re.compile(r"[A-Za-z]+")
+_DIGITS = re.compile(r"\d")
+
+
+def redact(text):
+    """Mask OCR text for the logs: digits become '#', words keep only their first letter"""
+    if not text:
+        return text
+    text = _DIGITS.sub("#", text)
+    return _WORD.sub(lambda match: match.group(0)[0] + "*" * (len(match.group(0)) - 1), text)
+
+
+class RequestIdFilter(logging.Filter):
+    # Runs in the calling thread, where the request id context is set
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class RecordQueueHandler(QueueHandler):
+    def prepare(self, record):
+        # The stock prepare also runs the handler's formatter in the calling thread. Here only the
+        # message and traceback are resolved, on a shallow copy: other handlers and filters on the
+        # same logger (caplog, Sentry) still see the original args and exc_info.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "module": record.module,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def setup_logging():
+    """Install the queue handler on the root logger once per process"""
+    global _listener
+    if _listener is not None:
+        return
+
+    log_file = log_settings['LOG_FILE']
+    os.makedirs(os.path.dirname(log_file) or ".", exist_ok=True)
+    file_handler = RotatingFileHandler(log_file, maxBytes=log_settings['MAX_BYTES'],
+                                       backupCount=log_settings['BACKUP_COUNT'], encoding="utf-8")
+    file_handler.setFormatter(JsonFormatter())
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = RecordQueueHandler(log_queue)
+    queue_handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(log_settings['LEVEL'])
+
+    _listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    _listener.start()
+    # Flush whatever is still queued when the process exits
+    atexit.register(_listener.stop)
@@ -1,34 +1,299 @@
 import os
+import re
+import cv2
 import easyocr
 import logging
+import threading
+from logging_setup import setup_logging, redact
+import numpy as np
+from functools import lru_cache
+from typing import NamedTuple
+from utils import read_yaml
 
-logging_str = "[%(asctime)s: %(levelname)s: %(module)s]: %(message)s"
-log_dir = "logs"
-os.makedirs(log_dir, exist_ok=True)
-logging.basicConfig(filename=os.path.join(log_dir,"ekyc_logs.log"), level=logging.INFO, format=logging_str, filemode="a")
+# Logging configuration
+setup_logging()
 
+config_path = "config.yaml"
+config = read_yaml(config_path)
 
-def extract_text(image_path, confidence_threshold=0.3, languages=['en']):
+artifacts = config['artifacts']
+ocr_cache_dir = artifacts['OCR_CACHE_DIR']
+pipeline_settings = config['pipeline']
+
+
+@lru_cache(maxsize=None)
+def get_reader(languages):
+    # Building a Reader loads the detection and recognition models, so do it once per language set
+    logging.info(f"Loading EasyOCR reader for {languages}")
+    return easyocr.Reader(list(languages))
+
+
+class OCRTokens(NamedTuple):
+    """Struct-of-arrays view of an EasyOCR result"""
+    texts: list                # recognized strings, one per token
+    boxes: np.ndarray          # float32 (N, 4, 2) corner points, clockwise from top-left
+    confidences: np.ndarray    # float32 (N,)
+
+
+def tokens_from_readtext(result):
+    texts = [recognized_text for _, recognized_text, _ in result]
+    boxes = np.array([bounding_box for bounding_box, _, _ in result], dtype=np.float32).reshape(-1, 4, 2)
+    confidences = np.array([confidence for _, _, confidence in result], dtype=np.float32)
+    return OCRTokens(texts, boxes, confidences)
+
+
+def tokens_to_string(tokens, confidence_threshold=0.3):
+    # Legacy "|"-joined format expected by the postprocess parsers
+    filtered_text = "|"
+    for recognized_text, confidence in zip(tokens.texts, tokens.confidences):
+        if confidence > confidence_threshold:
+            filtered_text += recognized_text + "|"
+    return filtered_text
+
+
+def save_tokens(tokens, path):
+    # Texts are packed into one UTF-8 byte array plus offsets so the cache holds no Python objects
+    encoded = [text.encode("utf-8") for text in tokens.texts]
+    offsets = np.cumsum([0] + [len(e) for e in encoded]).astype(np.int32)
+    text_bytes = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez_compressed(f, text_bytes=text_bytes, offsets=offsets,
+                            boxes=tokens.boxes, confidences=tokens.confidences)
+    os.replace(tmp_path, path)
+    logging.info(f"OCR tokens cached at {path}")
+
+
+def load_tokens(path):
+    with np.load(path) as data:
+        raw = data["text_bytes"].tobytes()
+        offsets = data["offsets"]
+        texts = [raw[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+        return OCRTokens(texts, data["boxes"], data["confidences"])
+
+
+def ocr_cache_path(cache_key, languages):
+    return os.path.join(ocr_cache_dir, f"{cache_key}_{'-'.join(languages)}.npz")
+
+
+def extract_text(image_path, confidence_threshold=0.3, languages=['en'], return_tokens=False, cache_key=None):
     logging.info("Text Extraction Started...")
+
+    # Reuse the cached tokens of an image that was already read
+    cache_path = ocr_cache_path(cache_key, languages) if cache_key else None
+    if cache_path and os.path.exists(cache_path):
+        tokens = load_tokens(cache_path)
+        logging.info(f"OCR tokens loaded from cache {cache_path}")
+        filtered_text = tokens_to_string(tokens, confidence_threshold)
+        return (filtered_text, tokens) if return_tokens else filtered_text
+
     # Initialize EasyOCR reader
-    reader = easyocr.Reader(languages)
+    reader = get_reader(tuple(languages))
     
     try:
         logging.info("Inside Try-Catch...")
         # Read the image and extract text
         result = reader.readtext(image_path)
-        filtered_text = "|"  # Initialize an empty string to store filtered text
-        for text in result:
-            bounding_box, recognized_text, confidence = text
-            if confidence > confidence_threshold:
-                filtered_text += recognized_text + "|"  # Append filtered text with newline
-        logging.info(f"Extracted Text: {filtered_text}")
-        return filtered_text 
+        tokens = tokens_from_readtext(result)
+        filtered_text = tokens_to_string(tokens, confidence_threshold)
+        # OCR text is personal data: only logged at DEBUG, and redacted
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug(f"Extracted Text: {redact(filtered_text)}")
+        if cache_path:
+            save_tokens(tokens, cache_path)
+        return (filtered_text, tokens) if return_tokens else filtered_text
     except Exception as e:
         print("An error occurred during text extraction:", e)
         logging.info(f"An error occurred during text extraction: {e}")
-        return ""
-    
+        return ("", None) if return_tokens else ""
+
+
+def extract_tokens_batch(images, languages=['en'], width=1000, height=632):
+    """OCR tokens for several images with one batched detection pass (used by batching.py)"""
+    images = [cv2.imread(image) if isinstance(image, str) else image for image in images]
+    reader = get_reader(tuple(languages))
+    # readtext_batched resizes every image to width x height, boxes are mapped back to each original size
+    results = reader.readtext_batched(images, n_width=width, n_height=height)
+    batch_tokens = []
+    for image, result in zip(images, results):
+        tokens = tokens_from_readtext(result)
+        image_height, image_width = image.shape[:2]
+        tokens.boxes[..., 0] *= image_width / width
+        tokens.boxes[..., 1] *= image_height / height
+        batch_tokens.append(tokens)
+    return batch_tokens
+
+
+# ---------- Early-exit OCR cascade ----------
+# probe_card runs EasyOCR's text detector once and recognizes only a handful of the largest boxes to
+# decide orientation and card type. Wrong cards and blank uploads stop there; recognize_card then reads
+# the remaining boxes of a matching card without detecting again.
+
+CARD_KEYWORDS = {
+    "PAN": ["INCOME TAX", "PERMANENT ACCOUNT", "ACCOUNT NUMBER", "GOVT OF INDIA"],
+    "AADHAR": ["GOVERNMENT OF INDIA", "AADHAAR", "DOB", "MALE", "FEMALE", "YEAR OF BIRTH"],
+    "COLLEGE ID": ["COLLEGE", "UNIVERSITY", "INSTITUTE", "COURSE", "DEPARTMENT", "VALIDITY", "B TECH", "PROCTOR"],
+}
+CARD_PATTERNS = {
+    "PAN": re.compile(r"\b[A-Z]{5}\d{4}[A-Z]\b"),
+    "AADHAR": re.compile(r"\b\d{4} \d{4} \d{4}\b"),
+}
+
+
+class CardProbe(NamedTuple):
+    status: str                # "ok", "no_text" or "mismatch"
+    card_type: str             # best keyword match, None when nothing matched
+    rotation: int              # degrees clockwise applied to the input image
+    image: np.ndarray          # input image at that rotation
+    horizontal_list: list      # detector boxes in the rotated image
+    free_list: list
+    keyword_hits: dict
+
+
+def score_card_type(texts):
+    """Count keyword and ID-pattern hits per card type"""
+    joined = " ".join(texts).upper().replace(".", "")
+    hits = {card_type: sum(keyword in joined for keyword in keywords)
+            for card_type, keywords in CARD_KEYWORDS.items()}
+    for card_type, pattern in CARD_PATTERNS.items():
+        if pattern.search(joined):
+            hits[card_type] += 1
+    return hits
+
+
+def detect_text_boxes(reader, image):
+    horizontal_list, free_list = reader.detect(image)
+    return horizontal_list[0], free_list[0]
+
+
+def rotate_boxes_180(horizontal_list, free_list, width, height):
+    horizontal_list = [[width - x_max, width - x_min, height - y_max, height - y_min]
+                       for x_min, x_max, y_min, y_max in horizontal_list]
+    free_list = [[[width - x, height - y] for x, y in box] for box in free_list][::-1]
+    # Keep reading order (top to bottom, left to right) after flipping
+    horizontal_list.sort(key=lambda box: (box[2], box[0]))
+    return horizontal_list, free_list
+
+
+def probe_boxes(horizontal_list, probe_size):
+    # The largest boxes are the card headers, which carry the keywords we are looking for
+    by_area = sorted(horizontal_list, key=lambda box: (box[1] - box[0]) * (box[3] - box[2]), reverse=True)
+    return by_area[:probe_size]
+
+
+def probe_card(image, expected_type=None, languages=['en']):
+    """Detection-only pass plus recognition of a few boxes to decide orientation and card type"""
+    reader = get_reader(tuple(languages))
+    probe_size = pipeline_settings['OCR_PROBE_BOXES']
+    min_hits = pipeline_settings['OCR_MIN_KEYWORD_HITS']
+
+    rotation = 0
+    horizontal_list, free_list = detect_text_boxes(reader, image)
+
+    # Mostly tall boxes means the card was photographed sideways, detect again once it is upright
+    tall = sum((y_max - y_min) > (x_max - x_min) for x_min, x_max, y_min, y_max in horizontal_list)
+    if horizontal_list and tall > len(horizontal_list) / 2:
+        image = cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE)
+        rotation = 90
+        horizontal_list, free_list = detect_text_boxes(reader, image)
+
+    if len(horizontal_list) + len(free_list) < pipeline_settings['OCR_MIN_BOXES']:
+        logging.info("OCR probe found no text on the card")
+        return CardProbe("no_text", None, rotation, image, horizontal_list, free_list, {})
+
+    # Read the same few boxes upright and upside down, the orientation with more keyword hits wins
+    height, width = image.shape[:2]
+    flipped_horizontal, flipped_free = rotate_boxes_180(horizontal_list, free_list, width, height)
+    candidates = [
+        (rotation, image, horizontal_list, free_list),
+        ((rotation + 180) % 360, cv2.rotate(image, cv2.ROTATE_180), flipped_horizontal, flipped_free),
+    ]
+    best = None
+    for candidate_rotation, candidate_image, candidate_horizontal, candidate_free in candidates:
+        result = reader.recognize(candidate_image, horizontal_list=probe_boxes(candidate_horizontal, probe_size),
+                                  free_list=[])
+        hits = score_card_type([text for _, text, _ in result])
+        score = (max(hits.values()), float(np.mean([conf for _, _, conf in result])) if result else 0.0)
+        if best is None or score > best[0]:
+            best = (score, hits, candidate_rotation, candidate_image, candidate_horizontal, candidate_free)
+        if max(hits.values()) >= min_hits:
+            # Confident enough, no need to try the other orientation
+            break
+
+    _, hits, rotation, image, horizontal_list, free_list = best
+    card_type = max(hits, key=hits.get) if max(hits.values()) > 0 else None
+    logging.info(f"OCR probe: rotation {rotation}, keyword hits {hits}")
+
+    if expected_type and card_type and card_type != expected_type and hits[card_type] >= min_hits \
+            and hits.get(expected_type, 0) == 0:
+        logging.warning(f"Card looks like {card_type} but {expected_type} was selected")
+        return CardProbe("mismatch", card_type, rotation, image, horizontal_list, free_list, hits)
+    return CardProbe("ok", card_type, rotation, image, horizontal_list, free_list, hits)
+
+
+def card_cache_path(cache_key, languages):
+    # Own entries, extract_text reads the whole image and caches different tokens under the same key
+    return ocr_cache_path(f"{cache_key}_card", languages)
+
+
+def recognize_card(probe, confidence_threshold=0.3, languages=['en'], return_tokens=False, cache_key=None):
+    """Recognition over the boxes found by probe_card, same output as extract_text"""
+    cache_path = card_cache_path(cache_key, languages) if cache_key else None
+    if cache_path and os.path.exists(cache_path):
+        tokens = load_tokens(cache_path)
+        logging.info(f"OCR tokens loaded from cache {cache_path}")
+    else:
+        reader = get_reader(tuple(languages))
+        try:
+            result = reader.recognize(probe.image, horizontal_list=probe.horizontal_list, free_list=probe.free_list)
+        except Exception:
+            # The caller gets an empty record, which is easy to miss without the traceback
+            logging.exception("Text recognition failed, returning no text")
+            return ("", None) if return_tokens else ""
+        tokens = tokens_from_readtext(result)
+        if cache_path:
+            save_tokens(tokens, cache_path)
+
+    filtered_text = tokens_to_string(tokens, confidence_threshold)
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug(f"Extracted Text: {redact(filtered_text)}")
+    return (filtered_text, tokens) if return_tokens else filtered_text
+
+
+def recognize_cards(probes, languages=['en']):
+    """OCR tokens for the boxes of several probes with one recognizer pass (used by batching.py)"""
+    reader = get_reader(tuple(languages))
+    try:
+        # Internals of Reader.recognize, which on CPU runs the recognizer once per box
+        from easyocr.easyocr import imgH
+        from easyocr.recognition import get_text
+        from easyocr.utils import get_image_list, reformat_input
+    except ImportError as e:
+        logging.warning(f"Batched recognition unavailable ({e}), recognizing one card at a time")
+        return [tokens_from_readtext(reader.recognize(probe.image, horizontal_list=probe.horizontal_list,
+                                                      free_list=probe.free_list)) for probe in probes]
+
+    image_lists, max_width = [], 0
+    for probe in probes:
+        _, image_grey = reformat_input(probe.image)
+        # Unsorted, in box order like the per-box loop Reader.recognize runs on CPU
+        image_list, width = get_image_list(probe.horizontal_list, probe.free_list, image_grey, model_height=imgH,
+                                           sort_output=False)
+        image_lists.append(image_list)
+        max_width = max(max_width, width)
+    crops = [crop for image_list in image_lists for crop in image_list]
+    result = []
+    if crops:
+        # Same defaults as Reader.recognize, every box of every card in one batch padded to the widest
+        ignore_char = "".join(set(reader.character) - set(reader.lang_char))
+        result = get_text(reader.character, imgH, int(max_width), reader.recognizer, reader.converter, crops,
+                          ignore_char=ignore_char, batch_size=len(crops), workers=0, device=reader.device)
+    batch_tokens, start = [], 0
+    for image_list in image_lists:
+        batch_tokens.append(tokens_from_readtext(result[start:start + len(image_list)]))
+        start += len(image_list)
+    return batch_tokens
 
 
 # # Example image path
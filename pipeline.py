@@ -0,0 +1,243 @@
+import logging
+import threading
+from runtime_config import configure_threads
+
+# No-op when the hosting process (e.g. an API worker) already set its budget. Runs on import, before the
+# imports below load numpy, torch and TensorFlow, whose thread pools are sized when they load
+configure_threads()
+
+import cv2
+import numpy as np
+import mysql.connector
+from mysql.connector import errorcode
+from datetime import datetime
+from deepface import DeepFace
+from logging_setup import setup_logging, set_request_id
+from preprocess import crop_id_card
+from ocr_engine import get_reader, probe_card, recognize_card
+from postprocess import PARSERS
+from face_verification import VERIFY_MODEL, load_face_cascade, largest_face_box, verify_faces, embed_face
+from id_classifier import classify_card, reference_centroids
+from utils import read_yaml, hash_id, hash_bytes
+from versioning import pipeline_fingerprint, stamp_pipeline_info
+from image_store import release_record_images
+from batching import batched_face_embedding, batched_verify_faces, batched_recognize_card
+from profiling import profiled
+
+# Logging configuration
+setup_logging()
+
+# Everything a request produces lives in local variables of process(), nothing is written to the shared
+# intermediate directory, so one KYCPipeline can serve many threads at once.
+
+
+def decode_image(image):
+    """BGR array and the original bytes from either encoded bytes or an already decoded array"""
+    if isinstance(image, np.ndarray):
+        ok, encoded = cv2.imencode(".png", image)
+        return image, (encoded.tobytes() if ok else b""), ".png"
+    image_bytes = bytes(image)
+    decoded = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    return decoded, image_bytes, ".jpg"
+
+
+def normalize_dates(text_info):
+    # DATE columns take ISO strings, anything unparseable is stored as NULL
+    if text_info.get("DOB"):
+        if isinstance(text_info["DOB"], str):
+            text_info["DOB"] = datetime.strptime(text_info["DOB"], "%Y-%m-%d")
+        text_info["DOB"] = text_info["DOB"].strftime('%Y-%m-%d')
+    if text_info.get("validity"):
+        # extract_college_info already returns ISO dates, older OCR output used month/day/year
+        for date_format in ("%Y-%m-%d", "%m/%d/%Y"):
+            try:
+                text_info["validity"] = datetime.strptime(text_info["validity"], date_format).strftime('%Y-%m-%d')
+                break
+            except ValueError:
+                continue
+        else:
+            text_info["validity"] = None
+    for key in ("DOB", "validity"):
+        if key in text_info and not text_info[key]:
+            text_info[key] = None
+    return text_info
+
+
+def record_id(card_type, text_info):
+    if card_type == "COLLEGE ID":
+        return hash_id(text_info.get("contact_no", "") + hash_id(text_info.get("name", "")))
+    return hash_id(text_info["ID"])
+
+
+class KYCPipeline:
+    """Loaded models, face detector, DB pool and config shared by concurrent KYC requests"""
+
+    def __init__(self, config_path="config.yaml", use_database=True, pool_size=None, ocr_cache=True):
+        # The budget set when this module was imported
+        self.thread_budget = configure_threads()
+        config = read_yaml(config_path)
+        self.settings = config['pipeline']
+        self.cascade_path = config['artifacts']['HAARCASCADE_PATH']
+        self.languages = list(self.settings['OCR_LANGUAGES'])
+        self.fingerprint = pipeline_fingerprint()
+        self.ocr_cache = ocr_cache
+        # With batching on, the face models and the OCR recognizer run once per batch of concurrent requests
+        batching_enabled = config['batching']['ENABLED']
+        self.embed_face = batched_face_embedding if batching_enabled else embed_face
+        self.verify_faces = batched_verify_faces if batching_enabled else verify_faces
+        self.recognize_card = batched_recognize_card if batching_enabled else recognize_card
+
+        # Load every model before the first request so concurrent requests never race to build them
+        get_reader(tuple(self.languages))
+        for model_name in {VERIFY_MODEL, self.settings['FACE_MODEL']}:
+            DeepFace.build_model(model_name)
+        reference_centroids()
+
+        # Haar cascades are not safe to share between threads, each thread loads its own
+        self._local = threading.local()
+
+        self.pool = None
+        self.record_functions = {}
+        if use_database:
+            # Imported here so extraction-only pipelines do not need a database
+            import sql_connection
+            self.pool = sql_connection.create_pool(pool_size)
+            # get_connection raises PoolError instead of waiting, so requests queue here for a free connection
+            self.pool_slots = threading.BoundedSemaphore(self.pool.pool_size)
+            self.record_functions = {
+                "PAN": (sql_connection.check_duplicacy, sql_connection.insert_records),
+                "AADHAR": (sql_connection.check_duplicacy_aadhar, sql_connection.insert_records_aadhar),
+                "COLLEGE ID": (sql_connection.check_college_duplicacy, sql_connection.insert_college_id),
+            }
+        logging.info(f"KYC pipeline ready, fingerprint {self.fingerprint}")
+
+    def face_classifier(self):
+        classifier = getattr(self._local, "face_cascade", None)
+        if classifier is None:
+            classifier = self._local.face_cascade = load_face_cascade(self.cascade_path)
+        return classifier
+
+    def probe(self, card, id_type=None):
+        """Crop, classify and probe a decoded card, returns (status, probe, card_type, card_box)"""
+        cropped = crop_id_card(card)
+        if cropped is None:
+            return "no_card", None, id_type, None
+        card_roi, card_box = cropped
+
+        card_type, probe = (id_type, None) if id_type else classify_card(card_roi, languages=self.languages)
+        if probe is None:
+            probe = probe_card(card_roi, expected_type=card_type, languages=self.languages)
+        if probe.status == "no_text":
+            return "no_text", probe, card_type, card_box
+        if probe.status == "mismatch":
+            if id_type:
+                return "type_mismatch", probe, probe.card_type, card_box
+            card_type = probe.card_type
+        return "ok", probe, card_type, card_box
+
+    def verify_selfie(self, card_roi, selfie):
+        """Face box on the card when it matches the selfie, else None"""
+        face_box = largest_face_box(card_roi, classifier=self.face_classifier())
+        if face_box is None:
+            return None
+        x, y, w, h = face_box
+        return face_box if self.verify_faces(selfie, card_roi[y:y+h, x:x+w]) else None
+
+    def recognize(self, probe, card_type, card_hash):
+        extracted_text, tokens = self.recognize_card(
+            probe,
+            confidence_threshold=self.settings['OCR_CONFIDENCE'],
+            languages=self.languages,
+            return_tokens=True,
+            cache_key=f"{card_hash}_{self.fingerprint}" if self.ocr_cache else None
+        )
+        text_info = PARSERS[card_type](extracted_text, tokens)
+        text_info["ID"] = record_id(card_type, text_info)
+        return text_info
+
+    def verify(self, card_image, selfie_image):
+        """True when the face on the card matches the selfie"""
+        card, _, _ = decode_image(card_image)
+        selfie, _, _ = decode_image(selfie_image)
+        if card is None or selfie is None:
+            return False
+        cropped = crop_id_card(card)
+        if cropped is None:
+            return False
+        return self.verify_selfie(cropped[0], selfie) is not None
+
+    def extract(self, card_image, id_type=None, request_id=None):
+        """OCR fields of a card without face verification or storage"""
+        request_id = set_request_id(request_id)
+        card, card_bytes, _ = decode_image(card_image)
+        if card is None:
+            return {"status": "invalid_image", "id_type": id_type, "request_id": request_id}
+        status, probe, card_type, _ = self.probe(card, id_type)
+        if status != "ok":
+            return {"status": status, "id_type": card_type, "request_id": request_id}
+        text_info = normalize_dates(self.recognize(probe, card_type, hash_bytes(card_bytes)))
+        return {"status": "extracted", "id_type": card_type, "record": text_info, "request_id": request_id}
+
+    @profiled("pipeline_process")
+    def process(self, card_image, selfie_image, id_type=None, register=True, request_id=None):
+        """Full KYC for one card and selfie (bytes or BGR arrays), safe to call from many threads.
+
+        Returns a dict with a status of invalid_image, no_card, no_text, type_mismatch, face_mismatch,
+        duplicate, extracted (register=False) or registered, plus the id type and the record.
+        """
+        request_id = set_request_id(request_id)
+        card, card_bytes, _ = decode_image(card_image)
+        selfie, selfie_bytes, _ = decode_image(selfie_image)
+        if card is None or selfie is None:
+            return {"status": "invalid_image", "id_type": id_type, "request_id": request_id}
+
+        status, probe, card_type, card_box = self.probe(card, id_type)
+        if status != "ok":
+            logging.info(f"KYC request stopped: {status}")
+            return {"status": status, "id_type": card_type, "request_id": request_id}
+
+        # Face check before the expensive recognition pass
+        face_box = self.verify_selfie(probe.image, selfie)
+        if face_box is None:
+            logging.info("KYC request stopped: face verification failed")
+            return {"status": "face_mismatch", "id_type": card_type, "request_id": request_id}
+
+        text_info = self.recognize(probe, card_type, hash_bytes(card_bytes))
+        text_info["Embedding"] = self.embed_face(selfie, model_name=self.settings['FACE_MODEL'])
+        # probe.image is the card crop turned upright, the face box is on that image
+        stamp_pipeline_info(text_info, {"Image Hash": card_bytes, "Face Hash": selfie_bytes}, {
+            "Card Crop Hash": ("Image Hash", card_box, 0),
+            "Face Crop Hash": ("Card Crop Hash", face_box, probe.rotation),
+        })
+        normalize_dates(text_info)
+
+        status = self.register(card_type, text_info) if register and self.pool else "extracted"
+        if status != "registered":
+            # Only stored records hold references, the rest is collected after GC_GRACE_S
+            release_record_images(text_info)
+        logging.info(f"KYC request finished: {status}")
+        return {"status": status, "id_type": card_type, "record": text_info, "request_id": request_id}
+
+    def register(self, card_type, text_info):
+        """Duplicate check and insert on a connection borrowed from the pool"""
+        check_duplicate, insert = self.record_functions[card_type]
+        with self.pool_slots:
+            connection = self.pool.get_connection()
+            try:
+                if check_duplicate(text_info, connection=connection):
+                    return "duplicate"
+                try:
+                    insert(text_info, connection=connection)
+                except ValueError:
+                    # insert_college_id's unique_college_id violation
+                    return "duplicate"
+                except mysql.connector.IntegrityError as e:
+                    # A concurrent request inserted the same card between the check and the insert. NOT NULL,
+                    # foreign key and other integrity failures are real errors
+                    if e.errno != errorcode.ER_DUP_ENTRY:
+                        raise
+                    return "duplicate"
+                return "registered"
+            finally:
+                # Returns the connection to the pool
+                connection.close()
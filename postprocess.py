@@ -1,7 +1,11 @@
 import pandas as pd
+import numpy as np
 from datetime import datetime
 import re
 
+# Bump whenever the parsing logic below changes so stored records get picked up by reverify.py
+PARSER_VERSION = "2"
+
 def filter_lines(lines):
     start_index = None
     end_index = None
@@ -38,7 +42,62 @@ def create_dataframe(texts):
     df = pd.DataFrame(data)
     return df
 
-def extract_information(data_string):
+# ---------- Spatial lookup on OCR tokens ----------
+# ocr_engine.extract_text(..., return_tokens=True) also returns the boxes of every token, which lets
+# the parsers find a field by where it sits relative to its label instead of by list position
+
+def find_label(tokens, label):
+    label = label.lower()
+    for i, text in enumerate(tokens.texts):
+        cleaned = text.strip().lower()
+        if cleaned == label or cleaned.startswith(label + ":") or cleaned.startswith(label + " "):
+            return i
+    return -1
+
+def value_near_label(tokens, label, confidence_threshold=0.3):
+    """Text of the token right of the label on the same line, else the one just below it"""
+    index = find_label(tokens, label)
+    if index == -1:
+        return ""
+
+    # Label and value recognized as one token, e.g. "Name: Yash"
+    label_text = tokens.texts[index]
+    if ":" in label_text and label_text.split(":", 1)[1].strip():
+        return label_text.split(":", 1)[1].strip()
+
+    boxes = tokens.boxes
+    x_min, y_min = boxes[:, :, 0].min(axis=1), boxes[:, :, 1].min(axis=1)
+    x_max, y_max = boxes[:, :, 0].max(axis=1), boxes[:, :, 1].max(axis=1)
+    cy = (y_min + y_max) / 2
+    height = y_max[index] - y_min[index]
+    usable = tokens.confidences > confidence_threshold
+    usable[index] = False
+
+    same_line = usable & (np.abs(cy - cy[index]) < 0.6 * height) & (x_min >= x_max[index] - 0.2 * height)
+    if same_line.any():
+        candidates = np.flatnonzero(same_line)
+        return tokens.texts[candidates[np.argmin(x_min[candidates])]].strip(" :")
+
+    overlaps = (x_min < x_max[index]) & (x_max > x_min[index])
+    below = usable & overlaps & (y_min >= y_max[index] - 0.2 * height) & (y_min - y_max[index] < 2.5 * height)
+    if below.any():
+        candidates = np.flatnonzero(below)
+        return tokens.texts[candidates[np.argmin(y_min[candidates])]].strip(" :")
+    return ""
+
+def fill_from_layout(extracted_info, tokens, field_labels):
+    """Overwrite fields with the value found next to their label, when there is one"""
+    if tokens is None or len(tokens.texts) == 0:
+        return extracted_info
+    for field, labels in field_labels.items():
+        for label in labels:
+            value = value_near_label(tokens, label)
+            if value:
+                extracted_info[field] = value
+                break
+    return extracted_info
+
+def extract_information(data_string, tokens=None):
     updated_data_string = data_string.replace(".", "")
     words = [word.strip() for word in updated_data_string.split("|") if len(word.strip()) > 2]
     
@@ -67,11 +126,17 @@ def extract_information(data_string):
                 break
             except ValueError:
                 continue
+        fill_from_layout(extracted_info, tokens, {
+            "ID": ["Permanent Account Number"],
+            "Name": ["Name"],
+            "Father's Name": ["Father's Name", "Fathers Name"],
+        })
     except Exception as e:
         print(f"Error processing PAN card: {e}")
     return extracted_info
 
-def extract_information1(data_string):
+def extract_information1(data_string, tokens=None):
+    # Aadhaar fronts carry no field labels besides DOB, tokens are accepted for a uniform parser interface
     updated_data_string = data_string.replace(".", "")
     words = [word.strip() for word in updated_data_string.split("|") if len(word.strip()) > 2]
     
@@ -110,7 +175,7 @@ def extract_information1(data_string):
     
     return extracted_info
 
-def extract_college_info(data_string):
+def extract_college_info(data_string, tokens=None):
     updated_data_string = data_string.replace(".", "")
     words = [word.strip() for word in updated_data_string.split("|") if len(word.strip()) > 2]
     
@@ -181,7 +246,26 @@ def extract_college_info(data_string):
             if father_match:
                 extracted_info["father_name"] = father_match.group(2)
 
+        layout_info = fill_from_layout({}, tokens, {
+            "name": ["Name"],
+            "department": ["Department", "Dept"],
+            "contact_no": ["Contact No", "Phone"],
+        })
+        if layout_info.get("name"):
+            extracted_info["name"] = layout_info["name"]
+        if layout_info.get("department"):
+            extracted_info["department"] = layout_info["department"]
+        if re.sub(r'\D', '', layout_info.get("contact_no", "")):
+            extracted_info["contact_no"] = re.sub(r'\D', '', layout_info["contact_no"])
+
     except Exception as e:
         print(f"Error processing College ID card: {e}")
     
-    return extracted_info
\ No newline at end of file
+    return extracted_info
+
+# Parser for each card type, used to route a classified card without the user picking the type
+PARSERS = {
+    "PAN": extract_information,
+    "AADHAR": extract_information1,
+    "COLLEGE ID": extract_college_info,
+}
@@ -2,13 +2,11 @@ import cv2
 import numpy as np
 import os
 import logging
+from logging_setup import setup_logging
 from utils import read_yaml, file_exists
 
 # Logging configuration
-logging_str = "[%(asctime)s: %(levelname)s: %(module)s]: %(message)s"
-log_dir = "logs"
-os.makedirs(log_dir, exist_ok=True)
-logging.basicConfig(filename=os.path.join(log_dir, "ekyc_logs.log"), level=logging.INFO, format=logging_str, filemode="a")
+setup_logging()
 
 # ---------------DEBUGGING--------------
 # Testing the functionality of logging (Easier for Debugging)
@@ -66,7 +64,8 @@ def read_image(image_path, is_uploaded=False):
 #     print("Failed to load image.")
 
 
-def extract_id_card(img):
+def crop_id_card(img):
+    # Returns the card crop and its (x, y, w, h) box without touching the disk
 
     # Convert image to grayscale
     # ---------------------- Reduces Computational Complexity involved ----------------
@@ -104,7 +103,7 @@ def extract_id_card(img):
             largest_area = area
 
     # If no large contour is found, assume no ID card is present
-    if not largest_contour.any():
+    if largest_contour is None:
         return None
 
     # Get bounding rectangle of the largest contour
@@ -113,13 +112,21 @@ def extract_id_card(img):
     logging.info(f"contours are found at, {(x, y, w, h)}")
     # logging.info("Area largest_area)
 
+    return img[y:y+h, x:x+w], (x, y, w, h)
+
+
+def extract_id_card(img):
+    cropped = crop_id_card(img)
+    if cropped is None:
+        return None
+    contour_id, _ = cropped
+
     # Apply additional filtering (optional):
     # - Apply bilateral filtering for noise reduction
     # filtered_img = cv2.bilateralFiltering(img[y:y+h, x:x+w], 9, 75, 75)
     # - Morphological operations (e.g., erosion, dilation) for shape refinement
     current_wd = os.getcwd()
     filename = os.path.join(current_wd,intermediate_dir_path, conour_file_name)
-    contour_id = img[y:y+h, x:x+w]
     is_exists = file_exists(filename)
     if is_exists:
         # Remove the existing file
@@ -170,3 +177,7 @@ def save_image(image, filename, path="."):
 
 # # Save the image
 # saved_path = save_image(image, "black_square.jpg", "images")
+
+
+# Extensions accepted for uploads read from disk (bulk_process.py)
+SOURCE_IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
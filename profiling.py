@@ -0,0 +1,357 @@
+import os
+import sys
+import glob
+import json
+import time
+import logging
+import argparse
+import threading
+import tracemalloc
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+from logging_setup import setup_logging, request_id_var, new_request_id
+from utils import read_yaml
+
+# Logging configuration
+setup_logging()
+
+# Opt-in profiling of whole KYC runs. A daemon thread samples the Python stack of the profiled thread
+# every INTERVAL_MS through sys._current_frames(), plus the worker threads that are inside worker_task()
+# (the MicroBatcher threads, the stream_images pool) under a "[thread name]" root frame. Native work
+# (EasyOCR/torch, TensorFlow, Haar scans, MySQL) is charged to the Python frame that called it.
+# Each run writes to profiling.DIR:
+#
+#   <name>-<time>-<request id>.collapsed   "root;...;leaf <ms>" lines, opens in speedscope or flamegraph.pl
+#   <name>-<time>-<request id>.json        wall time, sample count and the top tracemalloc allocations
+#
+# `python profiling.py` aggregates the hotspots of every saved run.
+
+config_path = "config.yaml"
+profile_settings = read_yaml(config_path)['profiling']
+
+PROFILE_ENV = "EKYC_PROFILE"
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+_local = threading.local()
+
+
+def profiling_enabled():
+    """EKYC_PROFILE=1 (or 0) overrides profiling.ENABLED"""
+    value = os.environ.get(PROFILE_ENV)
+    if value is not None:
+        return value.strip().lower() not in ("", "0", "false", "no", "off")
+    return bool(profile_settings['ENABLED'])
+
+
+def short_path(path):
+    # Packages by their import path, project modules relative to the root, the rest by file name
+    if "site-packages" in path:
+        path = path.rsplit("site-packages", 1)[1].lstrip("/\\")
+    elif path.startswith(PROJECT_ROOT):
+        path = os.path.relpath(path, PROJECT_ROOT)
+    else:
+        path = os.path.basename(path)
+    return path.replace("\\", "/")
+
+
+_labels = {}
+
+
+def frame_label(code):
+    label = _labels.get(code)
+    if label is None:
+        label = _labels[code] = f"{short_path(code.co_filename)}:{code.co_name}"
+    return label
+
+
+# ---------- Worker threads ----------
+# Work handed to shared threads is sampled only while it runs inside worker_task(), an idle worker
+# blocked in a C call cannot be told apart from a busy one. Such work, e.g. a batch serving several
+# requests, is charged to every run active at the time.
+
+_busy_workers = {}
+
+
+@contextmanager
+def worker_task():
+    thread = threading.current_thread()
+    _busy_workers[thread.ident] = thread.name
+    try:
+        yield
+    finally:
+        _busy_workers.pop(thread.ident, None)
+
+
+def stack_of(frame):
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class StackSampler:
+    """Samples the Python stack of one thread and of the busy worker threads from a daemon thread,
+    each stack weighted in milliseconds"""
+
+    def __init__(self, thread_id, interval_ms=None):
+        self.thread_id = thread_id
+        self.interval = (interval_ms or profile_settings['INTERVAL_MS']) / 1000
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            frames = sys._current_frames()
+            frame = frames.get(self.thread_id)
+            if frame is None:
+                break
+            # The sampler only wakes when it gets the GIL, so weigh by the time since the last sample
+            # rather than counting samples, or long GIL-holding native calls would be under-reported
+            weight = (now - last) * 1000
+            self.stacks[stack_of(frame)] += weight
+            for thread_id, name in list(_busy_workers.items()):
+                frame = frames.get(thread_id)
+                if frame is not None and thread_id != self.thread_id:
+                    self.stacks[f"[{name}];{stack_of(frame)}"] += weight
+            # Holding on to the frames until the next sample would keep them alive after they return
+            del frames, frame
+            self.samples += 1
+            last = now
+
+
+# ---------- Allocations ----------
+
+# Allocations made by the profiler and its sampler thread are not part of the run
+_TRACE_FILTERS = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__),
+                  tracemalloc.Filter(False, threading.__file__)]
+
+
+_tracing_lock = threading.Lock()
+_tracing_runs = 0
+_started_tracing = False
+
+
+def start_tracemalloc():
+    global _tracing_runs, _started_tracing
+    with _tracing_lock:
+        if _tracing_runs == 0 and not tracemalloc.is_tracing():
+            # One frame per trace is all the per-line statistics need, every extra frame multiplies the cost
+            tracemalloc.start(1)
+            _started_tracing = True
+        _tracing_runs += 1
+
+
+def stop_tracemalloc():
+    # Concurrent runs share the traces, tracing stops with the last of them unless it was on before
+    global _tracing_runs, _started_tracing
+    with _tracing_lock:
+        _tracing_runs -= 1
+        if _tracing_runs == 0 and _started_tracing:
+            tracemalloc.stop()
+            _started_tracing = False
+
+
+def top_allocations(before, after, limit=None):
+    """Source lines whose live allocations grew the most between two snapshots"""
+    limit = limit or profile_settings['TOP_ALLOCATIONS']
+    stats = after.filter_traces(_TRACE_FILTERS).compare_to(before.filter_traces(_TRACE_FILTERS), "lineno")
+    top = []
+    for stat in sorted(stats, key=lambda stat: stat.size_diff, reverse=True)[:limit]:
+        if stat.size_diff <= 0:
+            break
+        frame = stat.traceback[0]
+        top.append({
+            "location": f"{short_path(frame.filename)}:{frame.lineno}",
+            "size_diff_kb": round(stat.size_diff / 1024, 1),
+            "count_diff": stat.count_diff,
+        })
+    return top
+
+
+# ---------- Profiled runs ----------
+
+def write_profile(name, stacks, report):
+    directory = profile_settings['DIR']
+    os.makedirs(directory, exist_ok=True)
+    stem = os.path.join(directory, f"{name}-{datetime.now():%Y%m%d-%H%M%S}-{report['request_id']}")
+    with open(stem + ".collapsed", "w") as f:
+        for stack, ms in stacks.most_common():
+            f.write(f"{stack} {max(1, round(ms))}\n")
+    with open(stem + ".json", "w") as f:
+        json.dump(report, f, indent=1)
+    return stem
+
+
+@contextmanager
+def profile_run(name, force=False):
+    """Profile the calling thread and busy worker threads for the duration of the block when profiling is enabled.
+
+    tracemalloc is process wide, so the allocations of runs overlapping in other threads are
+    included in each other's reports. It runs only while a profiled run needs it. A run nested in
+    another profiled run is not profiled again.
+    """
+    if not (force or profiling_enabled()) or getattr(_local, "active", False):
+        yield
+        return
+    _local.active = True
+    use_tracemalloc = profile_settings['TRACEMALLOC']
+    if use_tracemalloc:
+        start_tracemalloc()
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.take_snapshot()
+        start_memory = tracemalloc.get_traced_memory()[0]
+
+    # Snapshots are taken outside the sampled and timed window
+    sampler = StackSampler(threading.get_ident()).start()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        wall_ms = (time.perf_counter() - start) * 1000
+        stacks = sampler.stop()
+        request_id = request_id_var.get()
+        report = {
+            "name": name,
+            "request_id": new_request_id() if request_id == "-" else request_id,
+            "wall_ms": round(wall_ms, 1),
+            "sampled_ms": round(sum(stacks.values()), 1),
+            "samples": sampler.samples,
+        }
+        if use_tracemalloc:
+            current, peak = tracemalloc.get_traced_memory()
+            report["allocated_kb"] = round((current - start_memory) / 1024, 1)
+            report["peak_kb"] = round((peak - start_memory) / 1024, 1)
+            report["top_allocations"] = top_allocations(baseline, tracemalloc.take_snapshot())
+            stop_tracemalloc()
+        _local.active = False
+        try:
+            stem = write_profile(name, stacks, report)
+            logging.info(f"Profile of {name} ({report['wall_ms']} ms) written to {stem}.collapsed")
+        except OSError as e:
+            logging.warning(f"Could not write the profile of {name}: {e}")
+
+
+def profiled(name=None):
+    """Decorator form of profile_run. With profiling off at import time the function is returned as is"""
+    def decorate(function):
+        if not profiling_enabled():
+            return function
+        label = name or function.__name__
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with profile_run(label, force=True):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# ---------- Summarizing many runs ----------
+
+def load_profiles(directory=None, name=None):
+    """Yield (stacks, report) for every saved run, optionally only those of one name"""
+    directory = directory or profile_settings['DIR']
+    pattern = f"{name}-*.collapsed" if name else "*.collapsed"
+    for path in sorted(glob.glob(os.path.join(directory, pattern))):
+        stacks = Counter()
+        with open(path) as f:
+            for line in f:
+                stack, _, ms = line.rstrip("\n").rpartition(" ")
+                if stack:
+                    stacks[stack] += float(ms)
+        report_path = path[:-len(".collapsed")] + ".json"
+        report = {}
+        if os.path.exists(report_path):
+            with open(report_path) as f:
+                report = json.load(f)
+        yield stacks, report
+
+
+def package_of(label):
+    # "easyocr/recognition.py:recognize" -> "easyocr", "face_verification.py:largest_face_box" -> "face_verification.py"
+    return label.rsplit(":", 1)[0].split("/")[0]
+
+
+def summarize(directory=None, name=None, top=20):
+    """Self time, inclusive time, self time per package and allocation growth, summed over runs"""
+    self_ms, total_ms, package_ms, merged = Counter(), Counter(), Counter(), Counter()
+    allocations = defaultdict(lambda: [0.0, 0])
+    runs, wall_ms, peak_kb = 0, 0.0, 0.0
+    for stacks, report in load_profiles(directory, name):
+        runs += 1
+        wall_ms += report.get("wall_ms", 0)
+        peak_kb = max(peak_kb, report.get("peak_kb", 0))
+        for stack, ms in stacks.items():
+            frames = stack.split(";")
+            merged[stack] += ms
+            self_ms[frames[-1]] += ms
+            package_ms[package_of(frames[-1])] += ms
+            # Recursive frames count once per stack
+            for label in set(frames):
+                total_ms[label] += ms
+        for allocation in report.get("top_allocations", ()):
+            entry = allocations[allocation["location"]]
+            entry[0] += allocation["size_diff_kb"]
+            entry[1] += 1
+    return {
+        "runs": runs,
+        "wall_ms": wall_ms,
+        "sampled_ms": sum(self_ms.values()),
+        "peak_kb": peak_kb,
+        "self": self_ms.most_common(top),
+        "total": total_ms.most_common(top),
+        "packages": package_ms.most_common(top),
+        "allocations": sorted(allocations.items(), key=lambda item: item[1][0], reverse=True)[:top],
+        "stacks": merged,
+    }
+
+
+def print_summary(summary):
+    sampled = summary["sampled_ms"] or 1
+    print(f"{summary['runs']} runs, {summary['wall_ms'] / 1000:.1f} s wall, {sampled / 1000:.1f} s sampled, "
+          f"largest traced peak {summary['peak_kb'] / 1024:.1f} MB")
+    for title, rows in (("Self time", summary["self"]), ("Inclusive time", summary["total"]),
+                        ("Self time by package", summary["packages"])):
+        print(f"\n{title}")
+        for label, ms in rows:
+            print(f"{ms / sampled:7.1%} {ms / 1000:9.2f} s  {label}")
+    if summary["allocations"]:
+        print("\nAllocation growth (in the top list of n runs)")
+        for location, (kb, count) in summary["allocations"]:
+            print(f"{kb / 1024:9.1f} MB {count:5}  {location}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Aggregate the hotspots of saved profiles")
+    parser.add_argument("--dir", default=None, help=f"defaults to {profile_settings['DIR']}")
+    parser.add_argument("--name", default=None, help="only runs of this name, e.g. main_content or bulk_card")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--merge", default=None, help="also write every run as one collapsed file")
+    args = parser.parse_args()
+
+    summary = summarize(args.dir, args.name, args.top)
+    if not summary["runs"]:
+        print(f"No profiles found, run with {PROFILE_ENV}=1 first")
+    else:
+        print_summary(summary)
+    if args.merge and summary["runs"]:
+        with open(args.merge, "w") as f:
+            for stack, ms in summary["stacks"].most_common():
+                f.write(f"{stack} {max(1, round(ms))}\n")
+        print(f"\nMerged stacks written to {args.merge}")
@@ -0,0 +1,157 @@
+import os
+import json
+import logging
+from logging_setup import setup_logging, set_request_id
+import argparse
+from runtime_config import configure_threads
+
+if __name__ == "__main__":
+    # Before numpy, torch (EasyOCR) and TensorFlow (DeepFace) are imported below, they size their pools on import
+    configure_threads()
+
+from preprocess import crop_id_card
+from ocr_engine import probe_card, recognize_card
+from postprocess import PARSERS
+from face_verification import embed_face
+from image_store import stream_images
+from sql_connection import (REVERIFY_TABLES, ID_TYPE_TABLES, mark_stale_records, fetch_stale_records,
+                            update_reprocessed_record)
+from profiling import profiled
+from versioning import config, pipeline_settings, pipeline_fingerprint
+
+# Logging configuration
+setup_logging()
+
+reverify_config = config['reverify']
+
+# Card type of the records in each table, selects the parser and the expected type of the OCR probe
+TABLE_ID_TYPES = {table: id_type for id_type, table in ID_TYPE_TABLES.items()}
+
+# users and aadhar are keyed by a SHA-256 string, college_ids by an auto increment integer
+INITIAL_IDS = {
+    "users": "",
+    "aadhar": "",
+    "college_ids": 0,
+}
+
+def load_checkpoint(checkpoint_path, fingerprint):
+    """Return the last processed id and the failed ids per table, or a fresh checkpoint if the fingerprint changed"""
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get("fingerprint") == fingerprint:
+            logging.info(f"Resuming reverify from checkpoint {checkpoint_path}")
+            checkpoint.setdefault("failed", {})
+            return checkpoint
+    return {"fingerprint": fingerprint, "last_ids": {}, "failed": {}, "updated": 0, "skipped": 0}
+
+def save_checkpoint(checkpoint_path, checkpoint):
+    """Write the checkpoint atomically so an interrupted run never leaves a partial file"""
+    os.makedirs(os.path.dirname(checkpoint_path) or ".", exist_ok=True)
+    tmp_path = checkpoint_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, checkpoint_path)
+
+@profiled("reverify_record")
+def reprocess_record(table, image_hash, card_image, face_image):
+    """Run the current pipeline on the stored source images of a record"""
+    if card_image is None or face_image is None:
+        return None
+
+    cropped = crop_id_card(card_image)
+    if cropped is None:
+        logging.warning(f"No ID card found in source image {image_hash}")
+        return None
+    image_roi, _ = cropped
+
+    # Same probe and recognition passes as the app, bulk and pipeline paths, so rotated cards are turned
+    # upright and the OCR cache entries are the ones those paths read and write
+    card_type = TABLE_ID_TYPES[table]
+    languages = pipeline_settings['OCR_LANGUAGES']
+    probe = probe_card(image_roi, expected_type=card_type, languages=languages)
+    if probe.status == "no_text":
+        logging.warning(f"No text found on source image {image_hash}")
+        return None
+    if probe.status == "mismatch":
+        # The record cannot move to another table, keep the stored row
+        logging.warning(f"Source image {image_hash} of {table} table now reads as a {probe.card_type} card")
+        return None
+    extracted_text, tokens = recognize_card(
+        probe,
+        confidence_threshold=pipeline_settings['OCR_CONFIDENCE'],
+        languages=languages,
+        return_tokens=True,
+        cache_key=f"{image_hash}_{pipeline_fingerprint()}"
+    )
+    text_info = PARSERS[card_type](extracted_text, tokens)
+    text_info["Embedding"] = embed_face(face_image, model_name=pipeline_settings['FACE_MODEL'])
+
+    # Empty dates cannot be stored in DATE columns
+    for key in ("DOB", "validity"):
+        if key in text_info and not text_info[key]:
+            text_info[key] = None
+    return text_info
+
+def run_reverify(tables=REVERIFY_TABLES, batch_size=None, checkpoint_path=None):
+    """Reprocess every stale record of the given tables in batches, checkpointing after each batch"""
+    batch_size = batch_size or reverify_config['BATCH_SIZE']
+    checkpoint_path = checkpoint_path or reverify_config['CHECKPOINT_FILE']
+    fingerprint = pipeline_fingerprint()
+    checkpoint = load_checkpoint(checkpoint_path, fingerprint)
+
+    for table in tables:
+        mark_stale_records(table, fingerprint)
+        last_id = checkpoint["last_ids"].get(table, INITIAL_IDS[table])
+        # Skipped and failed rows stay flagged, they are listed here and picked up again by the next run
+        failed = checkpoint["failed"].setdefault(table, {})
+        while True:
+            rows = fetch_stale_records(table, last_id, batch_size)
+            if not rows:
+                break
+            # The next images are decoded from the store while the current record runs through OCR
+            images = stream_images([h for _, image_hash, face_hash in rows for h in (image_hash, face_hash)])
+            for record_id, image_hash, face_hash in rows:
+                (_, card_image), (_, face_image) = next(images), next(images)
+                set_request_id()
+                try:
+                    text_info = reprocess_record(table, image_hash, card_image, face_image)
+                    if text_info is None:
+                        checkpoint["skipped"] += 1
+                        failed[str(record_id)] = "skipped"
+                    else:
+                        update_reprocessed_record(table, record_id, text_info, fingerprint)
+                        checkpoint["updated"] += 1
+                        failed.pop(str(record_id), None)
+                except Exception as e:
+                    logging.error(f"Error reprocessing record {record_id} of {table} table: {e}")
+                    checkpoint["skipped"] += 1
+                    failed[str(record_id)] = "error"
+                last_id = record_id
+            checkpoint["last_ids"][table] = last_id
+            save_checkpoint(checkpoint_path, checkpoint)
+            logging.info(f"Reverify progress on {table}: last id {last_id}, "
+                         f"{checkpoint['updated']} updated, {checkpoint['skipped']} skipped")
+        # The table is done, the next run pages from the start again and only finds the rows still flagged
+        checkpoint["last_ids"].pop(table, None)
+        save_checkpoint(checkpoint_path, checkpoint)
+        if failed:
+            logging.warning(f"Reverify left {len(failed)} records of {table} table to retry")
+
+    logging.info(f"Reverify finished for fingerprint {fingerprint}")
+    return checkpoint
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reprocess stored records produced by an older pipeline")
+    parser.add_argument("--tables", nargs="+", choices=REVERIFY_TABLES, default=list(REVERIFY_TABLES))
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--reset", action="store_true", help="ignore any existing checkpoint")
+    args = parser.parse_args()
+
+    if args.reset and os.path.exists(reverify_config['CHECKPOINT_FILE']):
+        os.remove(reverify_config['CHECKPOINT_FILE'])
+
+    result = run_reverify(tables=args.tables, batch_size=args.batch_size)
+    failed = sum(len(ids) for ids in result['failed'].values())
+    print(f"Fingerprint {result['fingerprint']}: {result['updated']} updated, {result['skipped']} skipped, "
+          f"{failed} left to retry (ids in {reverify_config['CHECKPOINT_FILE']})")
@@ -0,0 +1,85 @@
+import os
+import logging
+from logging_setup import setup_logging
+from utils import read_yaml
+
+# Logging configuration
+setup_logging()
+
+# OpenCV, TensorFlow (DeepFace) and PyTorch (EasyOCR) each size their thread pools to every core by
+# default. With several workers per host that oversubscribes the CPU many times over, so every process
+# gets one thread budget and all three runtimes are capped to it.
+#
+# OpenMP, MKL and OpenBLAS size their pools from the environment when numpy, torch or TensorFlow is first
+# imported, so entry points call configure_threads() before importing anything that pulls those in.
+
+config_path = "config.yaml"
+thread_settings = read_yaml(config_path)['threads']
+
+_budget = None
+
+
+def available_cpus():
+    # Honours taskset / container cpusets where the platform exposes them
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def thread_budget(workers=1, threads=None):
+    """Threads per worker: a number from config, or "auto" to split the cores evenly between workers"""
+    threads = threads if threads is not None else thread_settings['PER_WORKER']
+    if threads == "auto":
+        return max(1, available_cpus() // max(1, workers))
+    return max(1, int(threads))
+
+
+def set_thread_environment(workers=1, threads=None):
+    """Only the environment variables, without importing any runtime. Child processes inherit them"""
+    budget = thread_budget(workers, threads)
+    inter_op = max(1, min(thread_settings['INTER_OP'], budget))
+    for variable in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "TF_NUM_INTRAOP_THREADS"):
+        os.environ[variable] = str(budget)
+    os.environ["TF_NUM_INTEROP_THREADS"] = str(inter_op)
+    return budget, inter_op
+
+
+def configure_threads(workers=1, threads=None):
+    """Cap OpenCV, TensorFlow and PyTorch to one budget, call before numpy, torch or TensorFlow is imported.
+    Returns the budget"""
+    global _budget
+    if _budget is not None:
+        return _budget
+    budget, inter_op = set_thread_environment(workers, threads)
+
+    try:
+        import cv2
+        cv2.setNumThreads(budget)
+    except ImportError:
+        pass
+
+    try:
+        import torch
+        torch.set_num_threads(budget)
+        try:
+            torch.set_num_interop_threads(inter_op)
+        except RuntimeError as e:
+            # Only allowed before the first parallel op
+            logging.warning(f"PyTorch inter-op threads already fixed: {e}")
+    except ImportError:
+        pass
+
+    try:
+        import tensorflow as tf
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(budget)
+            tf.config.threading.set_inter_op_parallelism_threads(inter_op)
+        except RuntimeError as e:
+            # Raised once the TensorFlow context exists, the environment variables above still apply
+            logging.warning(f"TensorFlow threads already fixed: {e}")
+    except ImportError:
+        pass
+
+    _budget = budget
+    logging.info(f"Thread budget {budget} (inter-op {inter_op}) for {workers} worker(s) on {available_cpus()} CPUs")
+    return budget
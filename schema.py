@@ -0,0 +1,248 @@
+import ast
+import logging
+import numpy as np
+
+# Versioned schema for the KYC database. Each migration runs once, in order, and is recorded in
+# schema_version; add new ones at the end of MIGRATIONS and never edit one that has shipped.
+
+KYC_TABLES = ("users", "aadhar", "college_ids")
+
+# Rows copied per round trip when moving embeddings into the side table
+COPY_BATCH_SIZE = 1000
+
+# What str() of a missing embedding looked like in the old TEXT column, these rows have nothing to copy
+EMPTY_EMBEDDINGS = ("", "None", "[]")
+
+
+def column_exists(cursor, table, column):
+    cursor.execute(
+        "SELECT 1 FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s",
+        (table, column)
+    )
+    return len(cursor.fetchall()) > 0
+
+
+def index_exists(cursor, table, index):
+    cursor.execute(
+        "SELECT 1 FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s",
+        (table, index)
+    )
+    return len(cursor.fetchall()) > 0
+
+
+def embedding_to_blob(embedding):
+    """Little-endian float32 bytes, 512 bytes for a Facenet embedding instead of ~2.5 KB of text"""
+    return np.asarray(embedding, dtype="<f4").tobytes()
+
+
+def blob_to_embedding(blob):
+    return np.frombuffer(blob, dtype="<f4")
+
+
+# ---------- Migrations ----------
+
+def create_kyc_tables(cursor):
+    # users and aadhar used to be created by hand, IF NOT EXISTS keeps existing installs untouched
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS users (
+        id CHAR(64) PRIMARY KEY,
+        name VARCHAR(255),
+        father_name VARCHAR(255),
+        dob DATE,
+        id_type VARCHAR(20) DEFAULT 'PAN',
+        embedding TEXT
+    )
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS aadhar (
+        id CHAR(64) PRIMARY KEY,
+        name VARCHAR(255),
+        gender VARCHAR(10),
+        dob DATE,
+        id_type VARCHAR(20) DEFAULT 'AADHAR',
+        embedding TEXT
+    )
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS college_ids (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        course VARCHAR(100),
+        department VARCHAR(100),
+        contact_no VARCHAR(20),
+        validity DATE,
+        address TEXT,
+        father_name VARCHAR(255),
+        id_type VARCHAR(20) DEFAULT 'COLLEGE ID',
+        embedding TEXT,
+        extraction_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE KEY unique_college_id (name, contact_no)
+    )
+    """)
+
+
+def add_reverify_columns(cursor):
+    for table in KYC_TABLES:
+        if not column_exists(cursor, table, "pipeline_fingerprint"):
+            cursor.execute(f"""
+            ALTER TABLE {table}
+                ADD COLUMN pipeline_fingerprint CHAR(16),
+                ADD COLUMN image_hash CHAR(64),
+                ADD COLUMN face_hash CHAR(64)
+            """)
+
+
+def add_lookup_indexes(cursor):
+    # fetch_college_records looks up by contact_no alone or by name AND father_name
+    if not index_exists(cursor, "college_ids", "idx_college_contact"):
+        cursor.execute("ALTER TABLE college_ids ADD INDEX idx_college_contact (contact_no)")
+    if not index_exists(cursor, "college_ids", "idx_college_name_father"):
+        cursor.execute("ALTER TABLE college_ids ADD INDEX idx_college_name_father (name, father_name)")
+
+    # The fingerprint range is scanned by mark_stale_records, paging itself uses idx_<table>_pending (migration 7)
+    for table in KYC_TABLES:
+        if index_exists(cursor, table, f"idx_{table}_fingerprint"):
+            cursor.execute(f"ALTER TABLE {table} DROP INDEX idx_{table}_fingerprint")
+        cursor.execute(
+            f"ALTER TABLE {table} ADD INDEX idx_{table}_fingerprint (pipeline_fingerprint, id, image_hash, face_hash)"
+        )
+
+
+def move_embeddings_to_side_table(cursor):
+    # Embeddings are only needed for face matching, keeping them out of the hot rows keeps lookups
+    # on small pages. They are stored as float32 blobs instead of str(list).
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS face_embeddings (
+        source_table VARCHAR(16) NOT NULL,
+        record_id VARCHAR(64) NOT NULL,
+        model VARCHAR(32) NOT NULL DEFAULT 'Facenet',
+        embedding BLOB NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (source_table, record_id)
+    )
+    """)
+    for table in KYC_TABLES:
+        if not column_exists(cursor, table, "embedding"):
+            continue
+        last_id = 0 if table == "college_ids" else ""
+        unparsed = []
+        while True:
+            cursor.execute(
+                f"SELECT id, embedding FROM {table} WHERE id > %s AND embedding IS NOT NULL ORDER BY id LIMIT %s",
+                (last_id, COPY_BATCH_SIZE)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            values = []
+            for record_id, embedding in rows:
+                if embedding.strip() in EMPTY_EMBEDDINGS:
+                    continue
+                try:
+                    values.append((table, str(record_id), embedding_to_blob(ast.literal_eval(embedding))))
+                except (ValueError, SyntaxError, TypeError):
+                    unparsed.append(record_id)
+            if values:
+                cursor.executemany(
+                    "INSERT IGNORE INTO face_embeddings (source_table, record_id, embedding) VALUES (%s, %s, %s)",
+                    values
+                )
+            last_id = rows[-1][0]
+        if unparsed:
+            # DROP COLUMN cannot be rolled back, keep the column until every embedding has been copied.
+            # Copied rows are INSERT IGNOREd, so the migration can simply run again once these are fixed.
+            logging.error(f"Unparseable embeddings in {table}, ids: {unparsed}")
+            raise ValueError(f"{len(unparsed)} embeddings in {table} could not be parsed, fix or NULL them "
+                             f"and run the migration again, the embedding column was not dropped")
+        cursor.execute(f"ALTER TABLE {table} DROP COLUMN embedding")
+
+
+def add_embedding_sequence(cursor):
+    # Monotonic row counter for embedding_snapshot.py: rows with seq above a snapshot's watermark are
+    # the ones it has not exported yet. Embeddings are written with REPLACE, so a changed one gets a new seq.
+    if not column_exists(cursor, "face_embeddings", "seq"):
+        cursor.execute("""
+        ALTER TABLE face_embeddings
+            ADD COLUMN seq BIGINT NOT NULL AUTO_INCREMENT,
+            ADD UNIQUE KEY idx_embeddings_seq (seq)
+        """)
+
+
+def add_crop_hash_columns(cursor):
+    # Crops are kept in the image store as (parent, box) references, these link a record to them
+    for table in KYC_TABLES:
+        if not column_exists(cursor, table, "card_crop_hash"):
+            cursor.execute(f"""
+            ALTER TABLE {table}
+                ADD COLUMN card_crop_hash CHAR(64),
+                ADD COLUMN face_crop_hash CHAR(64)
+            """)
+
+
+def add_reverify_pending_flag(cursor):
+    # "fingerprint <> current" is a range predicate, so paging on it filesorts every stale row per batch.
+    # reverify.py flags the stale rows once per run and pages on (reverify_pending = 1, id > last) instead.
+    for table in KYC_TABLES:
+        if not column_exists(cursor, table, "reverify_pending"):
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN reverify_pending TINYINT NOT NULL DEFAULT 0")
+        if not index_exists(cursor, table, f"idx_{table}_pending"):
+            cursor.execute(
+                f"ALTER TABLE {table} ADD INDEX idx_{table}_pending (reverify_pending, id, image_hash, face_hash)"
+            )
+
+
+MIGRATIONS = [
+    (1, "create users, aadhar and college_ids", create_kyc_tables),
+    (2, "pipeline fingerprint and source image hash columns", add_reverify_columns),
+    (3, "indexes for every lookup in sql_connection", add_lookup_indexes),
+    (4, "move embeddings to face_embeddings", move_embeddings_to_side_table),
+    (5, "sequence number on face_embeddings for snapshot deltas", add_embedding_sequence),
+    (6, "card and face crop hashes", add_crop_hash_columns),
+    (7, "reverify pending flag for keyset paging", add_reverify_pending_flag),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INT PRIMARY KEY,
+        description VARCHAR(255),
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    return cursor.fetchall()[0][0]
+
+
+def apply_migrations(connection):
+    """Bring the database up to SCHEMA_VERSION, returns the version it was at before"""
+    cursor = connection.cursor()
+    try:
+        version = current_version(cursor)
+        for migration_version, description, migrate in MIGRATIONS:
+            if migration_version <= version:
+                continue
+            logging.info(f"Applying schema migration {migration_version}: {description}")
+            migrate(cursor)
+            cursor.execute(
+                "INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                (migration_version, description)
+            )
+            connection.commit()
+        if version < SCHEMA_VERSION:
+            logging.info(f"Schema migrated from version {version} to {SCHEMA_VERSION}")
+        return version
+    except Exception as e:
+        connection.rollback()
+        logging.error(f"Error applying schema migrations: {e}")
+        raise
+    finally:
+        cursor.close()
+
+
+if __name__ == "__main__":
+    # Importing sql_connection connects and applies any pending migration
+    import sql_connection
+    print(f"Schema at version {SCHEMA_VERSION}")
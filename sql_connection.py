@@ -1,14 +1,15 @@
 import mysql.connector
+from mysql.connector import pooling
 import pandas as pd
 import logging
+from logging_setup import setup_logging
 import os 
 import toml
+from schema import KYC_TABLES, apply_migrations, embedding_to_blob, blob_to_embedding
+from utils import read_yaml
 
 # Logging configuration
-logging_str = "[%(asctime)s: %(levelname)s: %(module)s]: %(message)s"
-log_dir = "logs"
-os.makedirs(log_dir, exist_ok=True)
-logging.basicConfig(filename=os.path.join(log_dir, "ekyc_logs.log"), level=logging.INFO, format=logging_str, filemode="a")
+setup_logging()
 
 # Load database configuration from config.toml
 config = toml.load("config.toml")
@@ -19,6 +20,13 @@ db_password = db_config.get("password")
 db_host = db_config.get("host", "localhost")
 db_name = db_config.get("database")
 
+# Rows per transaction for insert_many, connections per pool for concurrent pipelines
+database_settings = read_yaml("config.yaml")['database']
+INSERT_BATCH_SIZE = database_settings['INSERT_BATCH_SIZE']
+DB_POOL_SIZE = database_settings['DB_POOL_SIZE']
+# Model the pipeline embeds faces with, stored next to each embedding for embedding_snapshot.py
+FACE_MODEL = read_yaml("config.yaml")['pipeline']['FACE_MODEL']
+
 if not db_user or not db_password:
     logging.error("Database user or password not found in config.toml")
     raise ValueError("Database user or password not found in config.toml")
@@ -37,92 +45,155 @@ except mysql.connector.Error as err:
     logging.error(f"Error connecting to the database: {err}")
     raise
 
-def create_college_id_table():
-    """Create the college_ids table if it doesn't exist"""
+# Create or upgrade users, aadhar, college_ids and face_embeddings when the module loads
+apply_migrations(mydb)
+
+# Tables whose rows can be reprocessed by reverify.py
+REVERIFY_TABLES = KYC_TABLES
+
+def create_pool(pool_size=None, pool_name="kyc_pool"):
+    """Connection pool for concurrent callers, each request borrows one with pool.get_connection()"""
+    pool = pooling.MySQLConnectionPool(
+        pool_name=pool_name,
+        pool_size=pool_size or DB_POOL_SIZE,
+        host=db_host,
+        user=db_user,
+        password=db_password,
+        database=db_name
+    )
+    logging.info(f"Connection pool {pool_name} created with {pool.pool_size} connections")
+    return pool
+
+def get_cursor(connection=None):
+    """The module connection unless a pooled one is passed, with a fresh cursor the caller closes"""
+    db = connection or mydb
+    return db, db.cursor()
+
+def insert_embedding(cursor, source_table, record_id, embedding, model=None):
+    """Store a face embedding in the side table, committed together with its record by the caller"""
+    if embedding is None or len(embedding) == 0:
+        return
+    # REPLACE rather than an upsert so a changed embedding gets a new seq and reaches snapshot deltas
+    sql = "REPLACE INTO face_embeddings (source_table, record_id, model, embedding) VALUES (%s, %s, %s, %s)"
+    cursor.execute(sql, (source_table, str(record_id), model or FACE_MODEL, embedding_to_blob(embedding)))
+
+def fetch_embedding(source_table, record_id, connection=None):
+    db, cursor = get_cursor(connection)
     try:
-        sql = """
-        CREATE TABLE IF NOT EXISTS college_ids (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            name VARCHAR(255) NOT NULL,
-            course VARCHAR(100),
-            department VARCHAR(100),
-            contact_no VARCHAR(20),
-            validity DATE,
-            address TEXT,
-            father_name VARCHAR(255),
-            id_type VARCHAR(20) DEFAULT 'COLLEGE ID',
-            embedding TEXT,
-            extraction_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE KEY unique_college_id (name, contact_no)
-        )
-        """
-        mycursor.execute(sql)
-        mydb.commit()
-        logging.info("College ID table created or already exists")
+        sql = "SELECT embedding FROM face_embeddings WHERE source_table = %s AND record_id = %s"
+        cursor.execute(sql, (source_table, str(record_id)))
+        rows = cursor.fetchall()
+        return blob_to_embedding(rows[0][0]) if rows else None
     except Exception as e:
-        logging.error(f"Error creating college_ids table: {e}")
-        raise
+        logging.error(f"Error fetching embedding: {e}")
+        return None
+    finally:
+        cursor.close()
 
-# Call the function to ensure table exists when module loads
-create_college_id_table()
+def record_exists(cursor, sql, values):
+    # Existence checks select only indexed columns so they are answered from the index alone
+    cursor.execute(sql, values)
+    return len(cursor.fetchall()) > 0
 
-def insert_records(text_info):
+# Column order of each INSERT, record_values builds the matching tuple from a text_info dict
+INSERT_SQL = {
+    "users": """
+        INSERT INTO users(id, name, father_name, dob, id_type, pipeline_fingerprint, image_hash, face_hash,
+                          card_crop_hash, face_crop_hash)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """,
+    "aadhar": """
+        INSERT INTO aadhar(id, name, gender, dob, id_type, pipeline_fingerprint, image_hash, face_hash,
+                           card_crop_hash, face_crop_hash)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """,
+    "college_ids": """
+        INSERT INTO college_ids 
+        (name, course, department, contact_no, validity, address, father_name, id_type,
+         pipeline_fingerprint, image_hash, face_hash, card_crop_hash, face_crop_hash)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """,
+}
+
+# Table each card type is stored in
+ID_TYPE_TABLES = {"PAN": "users", "AADHAR": "aadhar", "COLLEGE ID": "college_ids"}
+
+def record_values(table, text_info):
+    if table == "users":
+        return (text_info['ID'],
+                text_info['Name'],
+                text_info["Father's Name"],
+                text_info['DOB'],
+                text_info['ID Type'],
+                text_info.get('Fingerprint'),
+                text_info.get('Image Hash'),
+                text_info.get('Face Hash'),
+                text_info.get('Card Crop Hash'),
+                text_info.get('Face Crop Hash'))
+    if table == "aadhar":
+        return (text_info['ID'],
+                text_info['Name'],
+                text_info["Gender"],
+                text_info['DOB'],
+                text_info['ID Type'],
+                text_info.get('Fingerprint'),
+                text_info.get('Image Hash'),
+                text_info.get('Face Hash'),
+                text_info.get('Card Crop Hash'),
+                text_info.get('Face Crop Hash'))
+    if table == "college_ids":
+        return (text_info.get('name', ''),
+                text_info.get('course', ''),
+                text_info.get('department', ''),
+                text_info.get('contact_no', ''),
+                text_info.get('validity', None),
+                text_info.get('address', ''),
+                text_info.get('father_name', ''),
+                text_info.get('ID Type', 'COLLEGE ID'),
+                text_info.get('Fingerprint'),
+                text_info.get('Image Hash'),
+                text_info.get('Face Hash'),
+                text_info.get('Card Crop Hash'),
+                text_info.get('Face Crop Hash'))
+    raise ValueError(f"Unknown table: {table}")
+
+def insert_records(text_info, connection=None):
+    db, cursor = get_cursor(connection)
     try:
-        sql = "INSERT INTO users(id, name, father_name, dob, id_type, embedding) VALUES (%s, %s, %s, %s, %s, %s)"
-        values = (text_info['ID'],
-                  text_info['Name'],
-                  text_info["Father's Name"],
-                  text_info['DOB'],
-                  text_info['ID Type'],
-                  str(text_info['Embedding']))
-        
-        mycursor.execute(sql, values)
-        mydb.commit()
+        cursor.execute(INSERT_SQL["users"], record_values("users", text_info))
+        insert_embedding(cursor, "users", text_info['ID'], text_info.get('Embedding'))
+        db.commit()
         logging.info("Inserted records successfully into users table.")
     except Exception as e:
+        db.rollback()
         logging.error(f"Error inserting records into users table: {e}")
         raise
+    finally:
+        cursor.close()
 
-def insert_records_aadhar(text_info):
+def insert_records_aadhar(text_info, connection=None):
+    db, cursor = get_cursor(connection)
     try:
-        sql = "INSERT INTO aadhar(id, name, gender, dob, id_type, embedding) VALUES (%s, %s, %s, %s, %s, %s)"
-        values = (text_info['ID'],
-                  text_info['Name'],
-                  text_info["Gender"],
-                  text_info['DOB'],
-                  text_info['ID Type'],
-                  str(text_info['Embedding']))
-        
-        mycursor.execute(sql, values)
-        mydb.commit()
+        cursor.execute(INSERT_SQL["aadhar"], record_values("aadhar", text_info))
+        insert_embedding(cursor, "aadhar", text_info['ID'], text_info.get('Embedding'))
+        db.commit()
         logging.info("Inserted records successfully into aadhar table.")
     except Exception as e:
+        db.rollback()
         logging.error(f"Error inserting records into aadhar table: {e}")
         raise
+    finally:
+        cursor.close()
 
-def insert_college_id(text_info):
+def insert_college_id(text_info, connection=None):
+    db, cursor = get_cursor(connection)
     try:
-        sql = """
-        INSERT INTO college_ids 
-        (name, course, department, contact_no, validity, address, father_name, id_type, embedding)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """
-        values = (
-            text_info.get('name', ''),
-            text_info.get('course', ''),
-            text_info.get('department', ''),
-            text_info.get('contact_no', ''),
-            text_info.get('validity', None),
-            text_info.get('address', ''),
-            text_info.get('father_name', ''),
-            text_info.get('ID Type', 'COLLEGE ID'),
-            str(text_info.get('Embedding', ''))
-        )
-        
-        mycursor.execute(sql, values)
-        mydb.commit()
+        cursor.execute(INSERT_SQL["college_ids"], record_values("college_ids", text_info))
+        insert_embedding(cursor, "college_ids", cursor.lastrowid, text_info.get('Embedding'))
+        db.commit()
         logging.info("Inserted records successfully into college_ids table.")
     except mysql.connector.IntegrityError as e:
+        db.rollback()
         if "unique_college_id" in str(e):
             logging.warning("Duplicate college ID detected (same name and contact number)")
             raise ValueError("This college ID already exists in the system")
@@ -130,17 +201,142 @@ def insert_college_id(text_info):
             logging.error(f"Integrity error inserting college ID: {e}")
             raise
     except Exception as e:
+        db.rollback()
         logging.error(f"Error inserting records into college_ids table: {e}")
         raise
+    finally:
+        cursor.close()
+
+def college_record_ids(cursor, records):
+    # Multi-row inserts do not report every auto increment id, look them up through unique_college_id
+    keys = [(r.get('name', ''), r.get('contact_no', '')) for r in records]
+    placeholders = ", ".join(["(%s, %s)"] * len(keys))
+    cursor.execute(f"SELECT name, contact_no, id FROM college_ids WHERE (name, contact_no) IN ({placeholders})",
+                   [value for key in keys for value in key])
+    ids = {(name, contact_no): record_id for name, contact_no, record_id in cursor.fetchall()}
+    return [ids.get(key) for key in keys]
+
+def insert_embeddings_many(cursor, table, record_ids, records, model=None):
+    values = [(table, str(record_id), model or FACE_MODEL, embedding_to_blob(r['Embedding']))
+              for record_id, r in zip(record_ids, records)
+              if record_id is not None and r.get('Embedding') is not None and len(r['Embedding']) > 0]
+    if values:
+        cursor.executemany(
+            "REPLACE INTO face_embeddings (source_table, record_id, model, embedding) VALUES (%s, %s, %s, %s)",
+            values)
 
-def fetch_records(text_info):
+def college_duplicates(cursor, records):
+    """Positions of the records check_college_duplicacy would reject, against stored rows and earlier records.
+
+    Like check_college_duplicacy, a record matches on contact_no when it has one and on name and
+    father_name otherwise. Two queries per batch instead of one per record.
+    """
+    contacts = {r['contact_no'] for r in records if r.get('contact_no')}
+    names = {(r.get('name', ''), r.get('father_name', '')) for r in records if not r.get('contact_no')}
+    seen_contacts, seen_names = set(), set()
+    if contacts:
+        placeholders = ", ".join(["%s"] * len(contacts))
+        cursor.execute(f"SELECT contact_no FROM college_ids WHERE contact_no IN ({placeholders})", list(contacts))
+        seen_contacts = {contact_no for contact_no, in cursor.fetchall()}
+    if names:
+        placeholders = ", ".join(["(%s, %s)"] * len(names))
+        cursor.execute(f"SELECT name, father_name FROM college_ids WHERE (name, father_name) IN ({placeholders})",
+                       [value for key in names for value in key])
+        seen_names = set(cursor.fetchall())
+
+    duplicates = set()
+    for position, record in enumerate(records):
+        if record.get('contact_no'):
+            key, seen = record['contact_no'], seen_contacts
+        else:
+            key, seen = (record.get('name', ''), record.get('father_name', '')), seen_names
+        if key in seen:
+            duplicates.add(position)
+        seen.add(key)
+    return duplicates
+
+def insert_many(table, records, batch_size=None, connection=None):
+    """Insert records with one multi-row INSERT and one commit per batch.
+
+    A batch that the server rejects is rolled back and retried row by row in a single transaction, so
+    only the offending rows are left out. Returns one status per record: "inserted", "duplicate", or
+    "failed" for rows the table rejects (e.g. a DataError). Connection errors are raised.
+    """
+    if table not in INSERT_SQL:
+        raise ValueError(f"Unknown table: {table}")
+    batch_size = batch_size or INSERT_BATCH_SIZE
+    connection = connection or mydb
+    cursor = connection.cursor()
+    statuses = []
+    try:
+        for start in range(0, len(records), batch_size):
+            batch = records[start:start + batch_size]
+            batch_statuses = ["duplicate"] * len(batch)
+            # College IDs are deduplicated like check_college_duplicacy, users and aadhar by their primary key
+            duplicates = college_duplicates(cursor, batch) if table == "college_ids" else set()
+            pending = [position for position in range(len(batch)) if position not in duplicates]
+            rows = [batch[position] for position in pending]
+            try:
+                if rows:
+                    # executemany rewrites a plain INSERT ... VALUES into one multi-row statement
+                    cursor.executemany(INSERT_SQL[table], [record_values(table, r) for r in rows])
+                    if table == "college_ids":
+                        record_ids = college_record_ids(cursor, rows)
+                    else:
+                        record_ids = [r['ID'] for r in rows]
+                    insert_embeddings_many(cursor, table, record_ids, rows)
+                connection.commit()
+                for position in pending:
+                    batch_statuses[position] = "inserted"
+                statuses.extend(batch_statuses)
+                continue
+            except mysql.connector.OperationalError:
+                raise
+            except mysql.connector.Error as e:
+                connection.rollback()
+                # Only the error number, MySQL's message quotes the offending values
+                logging.warning(f"Batch insert into {table} failed with MySQL error {e.errno}, retrying row by row")
+
+            # A failed statement does not abort the transaction in MySQL, so the good rows still commit
+            # together. The savepoint drops a record whose embedding insert fails after its row went in.
+            for position in pending:
+                record = batch[position]
+                cursor.execute("SAVEPOINT insert_row")
+                try:
+                    cursor.execute(INSERT_SQL[table], record_values(table, record))
+                    record_id = cursor.lastrowid if table == "college_ids" else record['ID']
+                    insert_embeddings_many(cursor, table, [record_id], [record])
+                    batch_statuses[position] = "inserted"
+                except mysql.connector.OperationalError:
+                    raise
+                except mysql.connector.Error as e:
+                    cursor.execute("ROLLBACK TO SAVEPOINT insert_row")
+                    if isinstance(e, mysql.connector.IntegrityError):
+                        logging.info(f"Skipping duplicate row in {table} table (MySQL error {e.errno})")
+                    else:
+                        batch_statuses[position] = "failed"
+                        logging.warning(f"Skipping row rejected by {table} table (MySQL error {e.errno})")
+            connection.commit()
+            statuses.extend(batch_statuses)
+        logging.info(f"Inserted {statuses.count('inserted')} records into {table} table, skipped "
+                     f"{statuses.count('duplicate')} duplicates and {statuses.count('failed')} rejected rows.")
+        return statuses
+    except Exception as e:
+        connection.rollback()
+        logging.error(f"Error bulk inserting records into {table} table: {e}")
+        raise
+    finally:
+        cursor.close()
+
+def fetch_records(text_info, connection=None):
+    db, cursor = get_cursor(connection)
     try:
         sql = "SELECT * FROM users WHERE id = %s"
         values = (text_info['ID'],)
-        mycursor.execute(sql, values)
-        result = mycursor.fetchall()
+        cursor.execute(sql, values)
+        result = cursor.fetchall()
         if result:
-            df = pd.DataFrame(result, columns=[desc[0] for desc in mycursor.description])
+            df = pd.DataFrame(result, columns=[desc[0] for desc in cursor.description])
             logging.info("Fetched records successfully from users table.")
             return df
         else:
@@ -149,15 +345,18 @@ def fetch_records(text_info):
     except Exception as e:
         logging.error(f"Error fetching records: {e}")
         return pd.DataFrame()
+    finally:
+        cursor.close()
     
-def fetch_records_aadhar(text_info):
+def fetch_records_aadhar(text_info, connection=None):
+    db, cursor = get_cursor(connection)
     try:
         sql = "SELECT * FROM aadhar WHERE id = %s"
         values = (text_info['ID'],)
-        mycursor.execute(sql, values)
-        result = mycursor.fetchall()
+        cursor.execute(sql, values)
+        result = cursor.fetchall()
         if result:
-            df = pd.DataFrame(result, columns=[desc[0] for desc in mycursor.description])
+            df = pd.DataFrame(result, columns=[desc[0] for desc in cursor.description])
             logging.info("Fetched records successfully from aadhar table.")
             return df
         else:
@@ -166,8 +365,11 @@ def fetch_records_aadhar(text_info):
     except Exception as e:
         logging.error(f"Error fetching records: {e}")
         return pd.DataFrame()
+    finally:
+        cursor.close()
 
-def fetch_college_records(text_info):
+def fetch_college_records(text_info, connection=None):
+    db, cursor = get_cursor(connection)
     try:
         # Search by either contact number or name+father_name combination
         if text_info.get('contact_no'):
@@ -177,10 +379,10 @@ def fetch_college_records(text_info):
             sql = "SELECT * FROM college_ids WHERE name = %s AND father_name = %s"
             values = (text_info.get('name', ''), text_info.get('father_name', ''))
         
-        mycursor.execute(sql, values)
-        result = mycursor.fetchall()
+        cursor.execute(sql, values)
+        result = cursor.fetchall()
         if result:
-            df = pd.DataFrame(result, columns=[desc[0] for desc in mycursor.description])
+            df = pd.DataFrame(result, columns=[desc[0] for desc in cursor.description])
             logging.info("Fetched records successfully from college_ids table.")
             return df
         else:
@@ -189,11 +391,13 @@ def fetch_college_records(text_info):
     except Exception as e:
         logging.error(f"Error fetching college records: {e}")
         return pd.DataFrame()
+    finally:
+        cursor.close()
 
-def check_duplicacy(text_info):
+def check_duplicacy(text_info, connection=None):
+    db, cursor = get_cursor(connection)
     try:
-        df = fetch_records(text_info)
-        if df.shape[0] > 0:
+        if record_exists(cursor, "SELECT id FROM users WHERE id = %s LIMIT 1", (text_info['ID'],)):
             logging.info("Duplicate records found.")
             return True
         else:
@@ -202,11 +406,13 @@ def check_duplicacy(text_info):
     except Exception as e:
         logging.error(f"Error checking duplicacy: {e}")
         return False
+    finally:
+        cursor.close()
     
-def check_duplicacy_aadhar(text_info):
+def check_duplicacy_aadhar(text_info, connection=None):
+    db, cursor = get_cursor(connection)
     try:
-        df = fetch_records_aadhar(text_info)
-        if df.shape[0] > 0:
+        if record_exists(cursor, "SELECT id FROM aadhar WHERE id = %s LIMIT 1", (text_info['ID'],)):
             logging.info("Duplicate records found.")
             return True
         else:
@@ -215,11 +421,20 @@ def check_duplicacy_aadhar(text_info):
     except Exception as e:
         logging.error(f"Error checking duplicacy: {e}")
         return False
+    finally:
+        cursor.close()
 
-def check_college_duplicacy(text_info):
+def check_college_duplicacy(text_info, connection=None):
+    db, cursor = get_cursor(connection)
     try:
-        df = fetch_college_records(text_info)
-        if df.shape[0] > 0:
+        # Same branches as fetch_college_records, served by idx_college_contact / idx_college_name_father
+        if text_info.get('contact_no'):
+            exists = record_exists(cursor, "SELECT id FROM college_ids WHERE contact_no = %s LIMIT 1",
+                                   (text_info['contact_no'],))
+        else:
+            exists = record_exists(cursor, "SELECT id FROM college_ids WHERE name = %s AND father_name = %s LIMIT 1",
+                                   (text_info.get('name', ''), text_info.get('father_name', '')))
+        if exists:
             logging.info("Duplicate college ID records found.")
             return True
         else:
@@ -227,4 +442,82 @@ def check_college_duplicacy(text_info):
             return False
     except Exception as e:
         logging.error(f"Error checking college ID duplicacy: {e}")
-        return False
\ No newline at end of file
+        return False
+    finally:
+        cursor.close()
+
+# Columns refreshed when a stored record is reprocessed, keyed by the text_info field they come from
+REPROCESS_COLUMNS = {
+    "users": {"name": "Name", "father_name": "Father's Name", "dob": "DOB"},
+    "aadhar": {"name": "Name", "gender": "Gender", "dob": "DOB"},
+    "college_ids": {"name": "name", "course": "course", "department": "department", "contact_no": "contact_no",
+                    "validity": "validity", "address": "address", "father_name": "father_name"},
+}
+
+def mark_stale_records(table, fingerprint, connection=None):
+    """Flag every row not produced by the given pipeline fingerprint, returns how many were newly flagged"""
+    if table not in REVERIFY_TABLES:
+        raise ValueError(f"Unknown table: {table}")
+    db, cursor = get_cursor(connection)
+    try:
+        # One pass per reverify run, the batches then page on the flag through idx_<table>_pending
+        sql = f"""
+        UPDATE {table} SET reverify_pending = 1
+        WHERE reverify_pending = 0 AND (pipeline_fingerprint IS NULL OR pipeline_fingerprint <> %s)
+        """
+        cursor.execute(sql, (fingerprint,))
+        db.commit()
+        logging.info(f"Flagged {cursor.rowcount} stale records in {table} table.")
+        return cursor.rowcount
+    except Exception as e:
+        db.rollback()
+        logging.error(f"Error flagging stale records in {table} table: {e}")
+        raise
+    finally:
+        cursor.close()
+
+def fetch_stale_records(table, after_id, limit, connection=None):
+    """Fetch the next batch of rows flagged by mark_stale_records, in id order"""
+    if table not in REVERIFY_TABLES:
+        raise ValueError(f"Unknown table: {table}")
+    db, cursor = get_cursor(connection)
+    try:
+        # Equality on the flag plus a range on id reads idx_<table>_pending in order, no filesort
+        sql = f"""
+        SELECT id, image_hash, face_hash FROM {table}
+        WHERE reverify_pending = 1 AND id > %s
+        ORDER BY id
+        LIMIT %s
+        """
+        cursor.execute(sql, (after_id, limit))
+        result = cursor.fetchall()
+        logging.info(f"Fetched {len(result)} stale records from {table} table.")
+        return result
+    except Exception as e:
+        logging.error(f"Error fetching stale records from {table} table: {e}")
+        raise
+    finally:
+        cursor.close()
+
+def update_reprocessed_record(table, record_id, text_info, fingerprint, connection=None):
+    """Overwrite the extracted fields of a record and stamp it with the current fingerprint"""
+    columns = REPROCESS_COLUMNS[table]
+    assignments = ", ".join(f"{column} = %s" for column in columns)
+    values = [text_info.get(key) for key in columns.values()]
+    db, cursor = get_cursor(connection)
+    try:
+        sql = f"UPDATE {table} SET {assignments}, pipeline_fingerprint = %s, reverify_pending = 0 WHERE id = %s"
+        cursor.execute(sql, (*values, fingerprint, record_id))
+        insert_embedding(cursor, table, record_id, text_info.get("Embedding"))
+        db.commit()
+        logging.info(f"Reprocessed record updated in {table} table.")
+    except mysql.connector.IntegrityError as e:
+        db.rollback()
+        logging.warning(f"Reprocessed record conflicts with an existing row in {table} table (MySQL error {e.errno})")
+        raise ValueError("Reprocessed record conflicts with an existing row")
+    except Exception as e:
+        db.rollback()
+        logging.error(f"Error updating reprocessed record in {table} table: {e}")
+        raise
+    finally:
+        cursor.close()
@@ -1,14 +1,15 @@
 import yaml
+import hashlib
 import os
 import logging
 
 def file_exists(file_path):
     is_exist = os.path.exists(file_path)
     if is_exist:
-        logging.info(f"File exists at {file_path}")
+        logging.debug("File exists at %s", file_path)
         return True
     else:
-        logging.warning(f"File does not exist at {file_path}")
+        logging.warning("File does not exist at %s", file_path)
         return False
 
 # It will receive file path and if found return yes else no
@@ -26,4 +27,14 @@ def create_dirs(dirs: list):
         os.makedirs(dir, exist_ok=True)
         logging.info(f"Directory is created at {dir}")
 
-# When you run this example, you will see log messages indicating that each directory has been created. If any of the directories already exist, they will be ignored, and no error will be raised due to the exist_ok=True parameter. I will be passing the list and exist_ok will ensure duplicy is not achieved 
\ No newline at end of file
+# When you run this example, you will see log messages indicating that each directory has been created. If any of the directories already exist, they will be ignored, and no error will be raised due to the exist_ok=True parameter. I will be passing the list and exist_ok will ensure duplicy is not achieved 
+
+def hash_id(id_value):
+    """Generate SHA-256 hash of the ID value"""
+    hash_object = hashlib.sha256(id_value.encode())
+    return hash_object.hexdigest()
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+# Used to key uploaded images (and anything else stored by content) with a SHA-256 hex digest
@@ -0,0 +1,59 @@
+import os
+import json
+import hashlib
+import logging
+from functools import lru_cache
+from importlib import metadata
+from utils import read_yaml
+from postprocess import PARSER_VERSION
+from image_store import store_record_images
+
+config_path = "config.yaml"
+config = read_yaml(config_path)
+
+artifacts = config['artifacts']
+pipeline_settings = config['pipeline']
+cascade_path = artifacts['HAARCASCADE_PATH']
+
+
+def package_version(name):
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+@lru_cache(maxsize=None)
+def pipeline_fingerprint():
+    """Short hash of everything that can change the stored output of a record"""
+    cascade_file = cascade_path.replace("\\", os.sep)
+    cascade_hash = ""
+    if os.path.exists(cascade_file):
+        with open(cascade_file, "rb") as f:
+            cascade_hash = hashlib.sha256(f.read()).hexdigest()
+
+    components = {
+        "parser_version": PARSER_VERSION,
+        "easyocr": package_version("easyocr"),
+        "deepface": package_version("deepface"),
+        "opencv": package_version("opencv-python"),
+        "haarcascade": cascade_hash,
+        "settings": pipeline_settings,
+    }
+    encoded = json.dumps(components, sort_keys=True).encode()
+    fingerprint = hashlib.sha256(encoded).hexdigest()[:16]
+    logging.info(f"Pipeline fingerprint {fingerprint} computed from {components}")
+    return fingerprint
+
+# The fingerprint is stored in the pipeline_fingerprint column of users, aadhar and college_ids.
+# Rows whose value differs from pipeline_fingerprint() were produced by an older pipeline.
+
+
+def stamp_pipeline_info(text_info, source_images, crops=None):
+    """Record the pipeline fingerprint and keep the uploads and crops so the record can be reprocessed.
+
+    source_images maps "Image Hash"/"Face Hash" to upload bytes, crops maps "Card Crop Hash"/"Face Crop Hash"
+    to (parent key, bbox, rotation), see image_store.store_record_images.
+    """
+    text_info["Fingerprint"] = pipeline_fingerprint()
+    store_record_images(text_info, source_images, crops)